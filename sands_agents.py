@@ -0,0 +1,338 @@
+# Autoplay agents for Utopian Sands
+# Policies that stand in for the player at every choice point, for playing
+# thousands of games in-process or load-testing the session server
+
+# Run in terminal command line: python3 sands_agents.py [games per agent]
+# Against a running server:     python3 sands_agents.py --server localhost:4000 --bots 200
+
+# ===== Imports =====
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+
+import utopian_sands_MX as game
+
+# ===== Agents =====
+class Agent:
+    """Picks options at choice points instead of a person
+
+    Call it with (options, player) like a play_headless() choose function,
+    or set game.choice_provider = agent to have it answer show_choices().
+    Subclasses give weights() for each option and the agent draws from them
+    with its own seeded generator. Without a graph it plays whichever one
+    the game is playing (player.graph, or the current one), so it carries
+    on across content reloads.
+    """
+    def __init__(self, seed=None, graph=None):
+        self.fixed_graph = graph
+        self.rng = random.Random(seed)
+        self.graph = None
+        self.nodes = {}
+
+    def use_graph(self, graph):
+        """Picks on graph's choice points from now on"""
+        self.graph = graph
+        # The option list is all show_choices() is given, and no two choice
+        # points share one, so it's enough to find the node
+        self.nodes = {tuple(node.choices): node for node in graph.nodes}
+
+    def __call__(self, options, player=None):
+        if self.fixed_graph is not None:
+            graph = self.fixed_graph
+        elif player is not None:
+            graph = game.player_graph(player)
+        else:
+            graph = game.event_graph()
+        if graph is not self.graph:
+            self.use_graph(graph)
+        node = self.nodes.get(tuple(options))
+        if node is None:
+            # Options this process has no events for, like a bot on a server
+            # whose content was edited: any of them will do
+            return self.rng.randrange(len(options)) + 1
+        return self.pick(node, player)
+
+    def pick(self, node, player):
+        """Option number (1-based) to take at a choice point"""
+        weights = self.weights(node, player)
+        return self.rng.choices(range(1, len(weights) + 1), weights)[0]
+
+    def weights(self, node, player):
+        """Relative chance of taking each option"""
+        return [1] * len(node.choices)
+
+class UniformAgent(Agent):
+    """Takes every option with equal chance"""
+    def pick(self, node, player):
+        return self.rng.randrange(len(node.choices)) + 1
+
+class AlignmentAgent(Agent):
+    """Always takes the option for one specific alignment, like "chaotic_good"
+
+    Where no option has one (the house and path picks) any option will do.
+    """
+    def __init__(self, alignment, seed=None, graph=None):
+        if alignment not in game.ALIGNMENT_TYPES:
+            raise ValueError(f"Unknown alignment: {alignment}")
+        super().__init__(seed, graph)
+        self.alignment = alignment
+        self.table = {}
+
+    def use_graph(self, graph):
+        super().use_graph(graph)
+        self.table = {}
+
+    def weights(self, node, player):
+        if node.index not in self.table:
+            weights = [1 if outcome.alignment and outcome.alignment[2] == self.alignment else 0
+                       for outcome in node.outcomes]
+            self.table[node.index] = weights if any(weights) else [1] * len(weights)
+        return self.table[node.index]
+
+class GreedyAgent(Agent):
+    """Heads for one ending, taking whichever option lands nearest its middle
+
+    An option leading to another choice point counts as the best option
+    there, and options that can kill (outright, through a chance, or by
+    using up the player's health) are never taken while a safe one is left.
+    Without a player to look at (a bot on the server) options are judged
+    from the centre with full health.
+    """
+    BAND_CENTRES = (-67, 0, 67)
+
+    def __init__(self, ending, seed=None, graph=None):
+        if ending not in game.ENDING_NAMES:
+            raise ValueError(f"Unknown ending: {ending}")
+        super().__init__(seed, graph)
+        self.ending = ending
+        ending_id = game.ENDING_NAMES.index(ending)
+        self.target = (self.BAND_CENTRES[ending_id % 3], self.BAND_CENTRES[ending_id // 3])
+
+    def distance(self, outcome, law, good, health, player=None, rest=()):
+        """Squared distance from the target at the end of the event after an outcome
+
+        Infinite if the player could die. A chance counts each way by its
+        probability. Spending an item and reputation checks go the way they
+        would for player, or the worse way without one. At another choice
+        point the best option counts. rest is the choice points still to
+        come after this outcome's branches.
+        """
+        if outcome.dies:
+            return float("inf")
+        if outcome.alignment:
+            law = max(-100, min(100, law + outcome.alignment[0]))
+            good = max(-100, min(100, good + outcome.alignment[1]))
+        health += outcome.health
+        if outcome.then:
+            rest = (outcome.then,) + rest
+        if outcome.chance:
+            probability, hit, miss = outcome.chance
+            if probability <= 0:
+                return self.distance(miss, law, good, health, player, rest)
+            if probability >= 1:
+                return self.distance(hit, law, good, health, player, rest)
+            return (probability * self.distance(hit, law, good, health, player, rest)
+                    + (1 - probability) * self.distance(miss, law, good, health, player, rest))
+        if outcome.spend:
+            items, paid, unpaid = outcome.spend
+            if player is None:
+                return max(self.distance(paid, law, good, health, player, rest),
+                           self.distance(unpaid, law, good, health, player, rest))
+            owned = any(item in player.inventory for item in items)
+            return self.distance(paid if owned else unpaid, law, good, health, player, rest)
+        if outcome.if_reputation:
+            faction, above, higher, lower = outcome.if_reputation
+            if player is None:
+                return max(self.distance(higher, law, good, health, player, rest),
+                           self.distance(lower, law, good, health, player, rest))
+            branch = higher if player.reputation[faction] > above else lower
+            return self.distance(branch, law, good, health, player, rest)
+        if rest:
+            return min(self.distance(sub, law, good, health, player, rest[1:])
+                       for sub in rest[0].outcomes)
+        if health <= 0:
+            return float("inf")
+        return (law - self.target[0]) ** 2 + (good - self.target[1]) ** 2
+
+    def weights(self, node, player):
+        if player is None:
+            law = good = 0
+            health = 100
+        else:
+            law, good = player.alignment["law_chaos"], player.alignment["good_evil"]
+            health = player.health
+        distances = [self.distance(outcome, law, good, health, player) for outcome in node.outcomes]
+        best = min(distances)
+        return [1 if distance == best else 0 for distance in distances]
+
+class LearnedAgent(Agent):
+    """Takes options as often as real players did
+
+    counts maps a choice point index to {option number: times taken}. Every
+    option gets one extra count, so none is ruled out just for being rare.
+    """
+    def __init__(self, counts, seed=None, graph=None):
+        super().__init__(seed, graph)
+        self.counts = counts
+        self.table = {}
+
+    def use_graph(self, graph):
+        super().use_graph(graph)
+        self.table = {node.index: [1 + self.counts.get(node.index, {}).get(option, 0)
+                                   for option in range(1, len(node.choices) + 1)]
+                      for node in graph.nodes}
+
+    def weights(self, node, player):
+        return self.table[node.index]
+
+    @classmethod
+    def from_journals(cls, paths, seed=None, graph=None):
+        """Learns from the choice journals of real games (see game.Journal)
+
+        Journals played on other content than graph are skipped, since
+        their choice point indexes are another graph's.
+        """
+        checksum = (graph or game.event_graph()).checksum
+        counts = {}
+        for path in paths:
+            with open(path, "rb") as file:
+                _, played_on, events, _, _ = game.parse_journal(file.read())
+            if played_on is not None and played_on != checksum:
+                continue
+            for _, records in events:
+                for record in records:
+                    if record[0] == "c":
+                        _, index, option = record
+                        counts.setdefault(index, Counter())[option] += 1
+        return cls(counts, seed, graph)
+
+def standard_agents(seed=None):
+    """{name: agent} for uniform play, every alignment and every ending"""
+    seed = game.new_seed() if seed is None else seed
+    agents = {"uniform": UniformAgent(game.derive_seed(seed, "uniform"))}
+    for alignment in game.ALIGNMENT_TYPES:
+        agents["always " + alignment] = AlignmentAgent(alignment, game.derive_seed(seed, alignment))
+    for ending in game.ENDING_NAMES:
+        agents["greedy " + ending] = GreedyAgent(ending, game.derive_seed(seed, ending))
+    return agents
+
+# ===== Running Agents =====
+def ending_frequencies(agent, games, seed=None, player_class=game.Player):
+    """Plays games headless with an agent, returns a Counter of endings ("Died" for deaths)"""
+    seed = game.new_seed() if seed is None else seed
+    counts = Counter()
+    for i in range(games):
+        player, ending = game.play_headless(agent, player_class=player_class,
+                                            seed=game.derive_seed(seed, "game", i))
+        counts[ending[0] if ending else "Died"] += 1
+    return counts
+
+def unreached_endings(counts):
+    """Endings that never came up in a Counter from ending_frequencies()"""
+    return [ending for ending in game.ENDING_NAMES if not counts[ending]]
+
+# ===== Server Bots =====
+OPTION_LINE = re.compile(r"  \[(\d+)\] (.*)")
+CHOICE_PROMPT = re.compile(r"Enter your choice \(1-\d+\): $")
+
+async def bot_session(host, port, agent, name="Bot"):
+    """Plays one game on a running sands_server, returns its ending ("Died" if it died)"""
+    reader, writer = await asyncio.open_connection(host, port)
+    text = ""
+    options = []
+    ending = None
+    try:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return ending
+            text += data.decode(errors="replace")
+            *lines, text = text.split("\n")
+            for line in lines:
+                line = line.rstrip("\r")
+                if line == "What do you do?":
+                    options = []
+                elif OPTION_LINE.fullmatch(line):
+                    options.append(OPTION_LINE.fullmatch(line).group(2))
+                elif line.startswith("YOUR FINAL ALIGNMENT: "):
+                    ending = line[len("YOUR FINAL ALIGNMENT: "):]
+                elif line == "GAME OVER":
+                    ending = "Died"
+
+            # Prompts are sent whole and don't end in a newline
+            if text == "Enter your name: ":
+                answer = name
+            elif text == "Press Enter to begin your journey...":
+                answer = ""
+            elif CHOICE_PROMPT.fullmatch(text):
+                answer = str(agent(options))
+            elif text == "Play again? (y/n): ":
+                answer = "n"
+            else:
+                continue
+            writer.write((answer + "\n").encode())
+            await writer.drain()
+            text = ""
+    finally:
+        writer.close()
+
+async def load_test(host, port, bots, agent_factory):
+    """Runs bots games on a server at once, returns (Counter of endings, seconds)"""
+    start = time.perf_counter()
+    endings = await asyncio.gather(*(bot_session(host, port, agent_factory(i), f"Bot{i}")
+                                     for i in range(bots)))
+    return Counter(endings), time.perf_counter() - start
+
+# ===== Reports =====
+def report(agents, games, seed):
+    """Prints each agent's most common ending and death rate, then any unreached endings"""
+    print(f"{'AGENT':<28}{'MOST COMMON ENDING':<20}{'SHARE':>8}{'DIED':>8}")
+    print("-"*64)
+    reached = Counter()
+    for name, agent in agents.items():
+        counts = ending_frequencies(agent, games, game.derive_seed(seed, name))
+        reached.update(counts)
+        endings = Counter({ending: counts[ending] for ending in game.ENDING_NAMES})
+        top, top_count = endings.most_common(1)[0]
+        print(f"{name:<28}{top:<20}{top_count / games:>8.1%}{counts['Died'] / games:>8.1%}")
+    print("-"*64)
+    missing = unreached_endings(reached)
+    if missing:
+        print("Never reached: " + ", ".join(missing))
+    else:
+        print("Every ending was reached")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Utopian Sands with autoplay agents")
+    parser.add_argument("games", type=int, nargs="?", default=2000, help="games per agent")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--journal", action="append", default=[],
+                        help="journal file of a real game to learn choices from (repeatable)")
+    parser.add_argument("--server", help="host:port of a running sands_server to load-test")
+    parser.add_argument("--bots", type=int, default=100, help="bots to connect with --server")
+    args = parser.parse_args()
+    seed = game.new_seed() if args.seed is None else args.seed
+
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        def agent_factory(i):
+            if args.journal:
+                return LearnedAgent.from_journals(args.journal, game.derive_seed(seed, "bot", i))
+            return UniformAgent(game.derive_seed(seed, "bot", i))
+        endings, seconds = asyncio.run(load_test(host, int(port), args.bots, agent_factory))
+        print(f"{args.bots} games in {seconds:.2f}s")
+        for ending, count in endings.most_common():
+            print(f"  {ending}: {count}")
+        return
+
+    agents = standard_agents(seed)
+    if args.journal:
+        agents["learned"] = LearnedAgent.from_journals(args.journal, game.derive_seed(seed, "learned"))
+    report(agents, args.games, seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+# Exact outcome analysis for Utopian Sands
+# Works out the odds of every ending by walking every path through the
+# compiled event graph instead of playing games
+
+# Run in terminal command line: python3 sands_analysis.py
+# Per-choice death odds and reachable endings: python3 sands_analysis.py --choices [--matrix out.json]
+
+# ===== Imports =====
+
+import argparse
+import json
+import time
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+
+import utopian_sands_MX as game
+
+# ===== Policies =====
+def uniform_policy(node):
+    """Every option at a choice point is equally likely"""
+    return [Fraction(1, len(node.choices))] * len(node.choices)
+
+# ===== Abstract State =====
+# A state is (law_chaos, good_evil, health, reputation, items) where
+# reputation is the (authorities, citizens, underworld) tuple and items
+# counts the items a later "spend" looks for. Items that every spend treats
+# the same (like the "bribe" money) share one count. Guilt, the specific alignment
+# counters and the rest of the inventory never change what happens next,
+# so they are left out and paths that only differ in those collapse together.
+# Anything no later event reads is set to None (or 0 for a single faction)
+# for the same reason.
+
+def tracked_items(graph):
+    """{item name: column in the items counts} for every item some outcome can spend
+
+    Items get the same column when they're in exactly the same spends, since
+    then it never matters which of them was handed over.
+    """
+    spends = {}
+    for node in graph.nodes:
+        for outcome in node.outcomes:
+            for sub in sub_outcomes(outcome):
+                if sub.spend:
+                    for item in sub.spend[0]:
+                        spends.setdefault(item, set()).add(sub.spend[0])
+    groups = sorted({frozenset(found) for found in spends.values()}, key=sorted)
+    return {item: groups.index(frozenset(found)) for item, found in sorted(spends.items())}
+
+def branches(outcome):
+    """The outcomes a chance/spend/reputation check picks between, if any"""
+    if outcome.chance:
+        return outcome.chance[1:]
+    if outcome.spend:
+        return outcome.spend[1:]
+    if outcome.if_reputation:
+        return outcome.if_reputation[2:]
+    return ()
+
+def sub_outcomes(outcome):
+    """The outcome plus every branch inside it"""
+    yield outcome
+    for branch in branches(outcome):
+        yield from sub_outcomes(branch)
+
+def event_nodes(node):
+    """Every choice point inside one event"""
+    yield node
+    for outcome in node.outcomes:
+        for sub in sub_outcomes(outcome):
+            if sub.then:
+                yield from event_nodes(sub.then)
+
+def later_needs(graph):
+    """For each event, which factions' reputation and whether items are read from then on
+
+    Factions come as a tuple of flags in game.FACTIONS order.
+    """
+    needs = []
+    read_factions = set()
+    reads_items = False
+    for event in reversed(graph.events):
+        for node in event_nodes(event):
+            for outcome in node.outcomes:
+                for sub in sub_outcomes(outcome):
+                    if sub.if_reputation:
+                        read_factions.add(sub.if_reputation[0])
+                    reads_items = reads_items or sub.spend is not None
+        needs.append((tuple(faction in read_factions for faction in game.FACTIONS), reads_items))
+    needs.reverse()
+    return needs
+
+def forget(state, cap, read_factions, reads_items):
+    """Drops whatever no later event looks at, so states only differing there merge"""
+    law, good, health, reputation, owned = state
+    if reputation is not None and not all(read_factions):
+        if any(read_factions):
+            reputation = tuple(value if read else 0 for value, read in zip(reputation, read_factions))
+        else:
+            reputation = None
+    return (law, good, min(health, cap), reputation, owned if reads_items else None)
+
+def worst_loss(node):
+    """The most health one pass through a choice point can take away"""
+    return max(outcome_loss(outcome) for outcome in node.outcomes)
+
+def outcome_loss(outcome):
+    loss = max(0, -outcome.health)
+    if branches(outcome):
+        loss += max(outcome_loss(branch) for branch in branches(outcome))
+    if outcome.then:
+        loss += worst_loss(outcome.then)
+    return loss
+
+def health_caps(graph):
+    """For each event, a health level that nothing from then on can use up
+
+    Outcomes that kill outright ("dies") don't care about health, so two
+    players above the cap live or die together and their health can be
+    treated as equal.
+    """
+    caps = []
+    remaining = 0
+    for event in reversed(graph.events):
+        remaining += worst_loss(event)
+        caps.append(remaining + 1)
+    caps.reverse()
+    return caps
+
+def start_state(graph):
+    """The state of a brand new Player"""
+    player = game.Player("Stranger", "Utopian Society")
+    items = tracked_items(graph)
+    owned = [0] * len(set(items.values()))
+    for item, column in items.items():
+        owned[column] += player.inventory.count(item)
+    return (player.alignment["law_chaos"], player.alignment["good_evil"], player.health,
+            tuple(player.reputation[faction] for faction in game.FACTIONS), tuple(owned))
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+# Probabilities are kept as whole numbers while walking an event: every
+# branch gets scale * its probability, where the event's scale is picked so
+# all of those divide exactly. This gives exact answers without paying for
+# Fraction arithmetic on every state.
+
+@lru_cache(maxsize=None)
+def as_ratio(probability):
+    """(numerator, denominator) of a probability given as a float or Fraction"""
+    probability = Fraction(str(probability)) if isinstance(probability, float) else Fraction(probability)
+    return probability.numerator, probability.denominator
+
+def node_scale(node, weights):
+    """A whole number every branch probability inside a choice point divides into"""
+    scale = 1
+    for (numerator, denominator), outcome in zip(weights(node), node.outcomes):
+        if numerator:
+            scale = lcm(scale, denominator * outcome_scale(outcome, weights))
+    return scale
+
+def outcome_scale(outcome, weights):
+    scale = lcm(*(outcome_scale(branch, weights) for branch in branches(outcome)))
+    if outcome.chance:
+        scale *= as_ratio(outcome.chance[0])[1]
+    if outcome.then:
+        scale *= node_scale(outcome.then, weights)
+    return scale
+
+def apply_outcome(outcome, state, scale, items, weights):
+    """Applies an outcome to a state, returns a list of (scale * probability, paths, state)"""
+    law, good, health, reputation, owned = state
+    # clamp() written out, this runs a few hundred thousand times
+    if outcome.alignment:
+        law += outcome.alignment[0]
+        law = -100 if law < -100 else 100 if law > 100 else law
+        good += outcome.alignment[1]
+        good = -100 if good < -100 else 100 if good > 100 else good
+    if outcome.reputation and reputation is not None:
+        authorities, citizens, underworld = reputation
+        change_a, change_c, change_u = outcome.reputation
+        authorities += change_a
+        citizens += change_c
+        underworld += change_u
+        reputation = (0 if authorities < 0 else 100 if authorities > 100 else authorities,
+                      0 if citizens < 0 else 100 if citizens > 100 else citizens,
+                      0 if underworld < 0 else 100 if underworld > 100 else underworld)
+    health += outcome.health
+    if outcome.dies:
+        health = 0
+    if outcome.item in items and owned is not None:
+        owned = add_item(owned, items[outcome.item], 1)
+    state = (law, good, health, reputation, owned)
+
+    results = [(scale, 1, state)]
+    if outcome.chance:
+        numerator, denominator = as_ratio(outcome.chance[0])
+        hit_scale = scale // denominator * numerator
+        miss_scale = scale // denominator * (denominator - numerator)
+        results = (apply_outcome(outcome.chance[1], state, hit_scale, items, weights) +
+                   apply_outcome(outcome.chance[2], state, miss_scale, items, weights))
+    elif outcome.spend:
+        spend, paid, unpaid = outcome.spend
+        for item in spend:
+            if owned[items[item]]:
+                state = (law, good, health, reputation, add_item(owned, items[item], -1))
+                results = apply_outcome(paid, state, scale, items, weights)
+                break
+        else:
+            results = apply_outcome(unpaid, state, scale, items, weights)
+    elif outcome.if_reputation:
+        faction, above, higher, lower = outcome.if_reputation
+        value = reputation[game.FACTIONS.index(faction)]
+        results = apply_outcome(higher if value > above else lower, state, scale, items, weights)
+
+    if outcome.then:
+        results = [(sub_scale, paths * sub_paths, final)
+                   for branch_scale, paths, after in results
+                   for sub_scale, sub_paths, final
+                   in node_states(outcome.then, after, branch_scale, items, weights)]
+    return results
+
+def add_item(owned, index, count):
+    owned = list(owned)
+    owned[index] += count
+    return tuple(owned)
+
+def node_states(node, state, scale, items, weights):
+    """Every (scale * probability, paths, state) that can come out of a choice point"""
+    results = []
+    for (numerator, denominator), outcome in zip(weights(node), node.outcomes):
+        if numerator:
+            results += apply_outcome(outcome, state, scale // denominator * numerator, items, weights)
+    return results
+
+# ===== Enumeration =====
+class Enumeration:
+    """Result of enumerate_endings()"""
+    def __init__(self):
+        self.endings = {}        # alignment name -> probability
+        self.paths = {}          # alignment name -> number of paths ending there
+        self.deaths = {}         # event number -> probability of dying in it
+        self.death_paths = {}    # event number -> number of paths dying in it
+        self.states = []         # number of distinct states after each event
+
+def enumerate_endings(graph=None, policy=uniform_policy):
+    """Works out the exact chance of every ending and of dying in each event
+
+    policy(node) gives the chance of picking each option at a choice point,
+    uniform_policy by default. States are merged after every event, so each
+    distinct state is only expanded once no matter how many paths reach it.
+    """
+    graph = graph or game.EVENT_GRAPH
+    items = tracked_items(graph)
+    needs = later_needs(graph) + [((False,) * len(game.FACTIONS), False)]
+    caps = health_caps(graph) + [1]
+    result = Enumeration()
+
+    # Policy weights as whole-number ratios, worked out once per choice point
+    ratios = {}
+    def weights(node):
+        if node.index not in ratios:
+            ratios[node.index] = [as_ratio(weight) for weight in policy(node)]
+        return ratios[node.index]
+
+    # state -> [probability * total, paths]
+    total = 1
+    states = {start_state(graph): [1, 1]}
+    deaths = {}
+    for number, event in enumerate(graph.events, 1):
+        read_factions, reads_items = needs[number]
+        scale = node_scale(event, weights)
+        total *= scale
+        next_states = {}
+        for state, (probability, paths) in states.items():
+            for p, branch_paths, after in node_states(event, state, scale, items, weights):
+                law, good, health, reputation, owned = after
+                if health <= 0:
+                    deaths[number] = deaths.get(number, 0) + probability * p
+                    result.death_paths[number] = (result.death_paths.get(number, 0)
+                                                  + paths * branch_paths)
+                    continue
+                after = forget(after, caps[number], read_factions, reads_items)
+                entry = next_states.setdefault(after, [0, 0])
+                entry[0] += probability * p
+                entry[1] += paths * branch_paths
+        states = next_states
+        result.states.append(len(states))
+        if number in deaths:
+            result.deaths[number] = Fraction(deaths[number], total)
+
+    endings = {}
+    for (law, good, health, reputation, owned), (probability, paths) in states.items():
+        alignment = game.axis_alignment(law, good)
+        endings[alignment] = endings.get(alignment, 0) + probability
+        result.paths[alignment] = result.paths.get(alignment, 0) + paths
+    for alignment, probability in endings.items():
+        result.endings[alignment] = Fraction(probability, total)
+    return result
+
+def report(result):
+    """Prints the enumeration as a table"""
+    print("ENDING" + " "*19 + "PROBABILITY" + " "*8 + "PATHS")
+    print("-"*50)
+    for title in game.ENDING_NAMES:
+        probability = result.endings.get(title, 0)
+        print(f"{title:<25}{float(probability):>11.6%}{result.paths.get(title, 0):>13}")
+    for number in sorted(result.deaths):
+        print(f"{'Died in event ' + str(number):<25}{float(result.deaths[number]):>11.6%}"
+              f"{result.death_paths[number]:>13}")
+    print("-"*50)
+    total_paths = sum(result.paths.values()) + sum(result.death_paths.values())
+    print(f"{total_paths} paths, states after each event: {result.states}")
+
+# ===== Choice Analysis =====
+# Which endings each choice can still lead to, and how likely it is to get
+# the player killed. One pass forward over the merged states records where
+# every option at every choice point takes each state; a pass backward over
+# those records then gives every state its chance of dying from there on
+# and a bitmask of the endings it can still reach (bit i = game.ENDING_NAMES[i]).
+# A choice point inside an event (like the houses in event 4) is only
+# reached down some of the event's paths. Its options are worked out by
+# walking the event twice from each state, once with the choice point
+# always taking the option and once with it taking nothing: whole-number
+# probabilities make the difference exactly the paths through it.
+
+class ChoiceMatrix:
+    """Result of analyse_choices()
+
+    For a player who reaches a choice point alive, takes one option there
+    and plays by the policy everywhere else, deaths[(event, node, option)]
+    is the chance of dying and endings[(event, node, option)] the bitmask
+    of endings still possible, where node is the choice point's index in
+    the graph. reach[node] is the chance of getting to the choice point alive.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.deaths = {}
+        self.endings = {}
+        self.reach = {}
+
+    def reachable(self, event, node, option):
+        """Names of the endings still possible after an option"""
+        mask = self.endings[(event, node, option)]
+        return [name for ending, name in enumerate(game.ENDING_NAMES) if mask >> ending & 1]
+
+    def rows(self):
+        """The matrix as plain data, one row per (event, node, option)"""
+        return [{"event": event, "node": node, "option": option,
+                 "text": self.graph.nodes[node].choices[option - 1],
+                 "death": death, "endings": self.reachable(event, node, option)}
+                for (event, node, option), death in sorted(self.deaths.items())]
+
+    def to_json(self):
+        return {"endings": list(game.ENDING_NAMES),
+                "reach": {str(node): chance for node, chance in self.reach.items()},
+                "rows": self.rows()}
+
+def leads_to(outcome, node):
+    """Whether node is one of the choice points an outcome can go on to"""
+    return any(sub.then is not None and (sub.then is node or any(leads_to(then_outcome, node)
+                                                                 for then_outcome in sub.then.outcomes))
+               for sub in sub_outcomes(outcome))
+
+def forced_weights(weights, node, option):
+    """weights() with one choice point always taking option (or nothing, for None)
+
+    Options on the way that can't lead to the choice point are never taken
+    either, since the paths down them are the same whatever it picks.
+    """
+    picked = [(1, 1) if number == option else (0, 1) for number in range(1, len(node.choices) + 1)]
+    on_the_way = {}
+    def forced(other):
+        if other is node:
+            return picked
+        if other.index not in on_the_way:
+            leads = [leads_to(outcome, node) for outcome in other.outcomes]
+            if any(leads):
+                on_the_way[other.index] = [weight if lead else (0, 1)
+                                           for weight, lead in zip(weights(other), leads)]
+            else:
+                on_the_way[other.index] = weights(other)   # not on the way to it
+        return on_the_way[other.index]
+    return forced
+
+def analyse_choices(graph=None, policy=uniform_policy):
+    """Works out every option's chance of death and the endings it leaves open
+
+    Uses floats rather than exact fractions, since it's meant to be rerun
+    in a second or so whenever the event content changes.
+    """
+    graph = graph or game.EVENT_GRAPH
+    items = tracked_items(graph)
+    needs = later_needs(graph) + [((False,) * len(game.FACTIONS), False)]
+    caps = health_caps(graph) + [1]
+    result = ChoiceMatrix(graph)
+
+    ratios = {}
+    def weights(node):
+        if node.index not in ratios:
+            ratios[node.index] = [as_ratio(weight) for weight in policy(node)]
+        return ratios[node.index]
+
+    # Forward: each event's states with their chance, and for every state
+    # and option the [(next state index or -1 for death, chance)] it leads
+    # to. An option inside the event only counts the paths through its
+    # choice point, so its chances add up to the chance of getting there.
+    states = [start_state(graph)]
+    chances = [1.0]
+    layers = []
+    for number, event in enumerate(graph.events, 1):
+        read_factions, reads_items = needs[number]
+        # (node, option, policy weight, outcome, scale) for the event's own options
+        options = [(event, option, numerator / denominator, outcome, outcome_scale(outcome, weights))
+                   for option, (outcome, (numerator, denominator))
+                   in enumerate(zip(event.outcomes, weights(event)), 1)]
+        # and (node, weights skipping it, [weights taking each option], scale) inside it
+        inner = []
+        for node in list(event_nodes(event))[1:]:
+            skip = forced_weights(weights, node, None)
+            picks = [forced_weights(weights, node, option) for option in range(1, len(node.choices) + 1)]
+            scale = lcm(*(node_scale(event, pick) for pick in picks), node_scale(event, skip))
+            inner.append((node, skip, picks, scale))
+        next_index = {}
+        next_chances = []
+        moves = []
+
+        def target_of(after):
+            if after[2] <= 0:
+                return -1
+            after = forget(after, caps[number], read_factions, reads_items)
+            target = next_index.get(after)
+            if target is None:
+                target = next_index[after] = len(next_chances)
+                next_chances.append(0.0)
+            return target
+
+        for state, chance in zip(states, chances):
+            state_moves = []
+            for _, _, weight, outcome, scale in options:
+                option_moves = []
+                for p, _, after in apply_outcome(outcome, state, scale, items, weights):
+                    target = target_of(after)
+                    p /= scale
+                    if target >= 0:
+                        next_chances[target] += chance * weight * p
+                    option_moves.append((target, p))
+                state_moves.append(option_moves)
+            for _, skip, picks, scale in inner:
+                skipped = {}
+                for p, _, after in node_states(event, state, scale, items, skip):
+                    target = target_of(after)
+                    skipped[target] = skipped.get(target, 0) + p
+                for pick in picks:
+                    masses = {}
+                    for p, _, after in node_states(event, state, scale, items, pick):
+                        target = target_of(after)
+                        masses[target] = masses.get(target, 0) + p
+                    for target, p in skipped.items():
+                        masses[target] -= p
+                    state_moves.append([(target, mass / scale) for target, mass in masses.items() if mass])
+            moves.append(state_moves)
+        options = [(node, option, weight) for node, option, weight, _, _ in options]
+        options += [(node, option, None) for node, _, picks, _ in inner
+                    for option in range(1, len(picks) + 1)]
+        layers.append((chances, options, moves))
+        states = list(next_index)
+        chances = next_chances
+
+    # Backward: death and endings of every state from that event onwards
+    death = [0.0] * len(states)
+    endings = [1 << game.ending_id(law, good) for law, good, _, _, _ in states]
+    for number in range(len(graph.events), 0, -1):
+        chances, options, moves = layers[number - 1]
+        option_deaths = [0.0] * len(options)
+        option_reach = [0.0] * len(options)
+        option_endings = [0] * len(options)
+        earlier_death = []
+        earlier_endings = []
+        for chance, state_moves in zip(chances, moves):
+            state_death = 0.0
+            state_endings = 0
+            for option, ((_, _, weight), option_moves) in enumerate(zip(options, state_moves)):
+                risk = 0.0
+                reach = 0.0
+                mask = 0
+                for target, p in option_moves:
+                    reach += p
+                    if target < 0:
+                        risk += p
+                    else:
+                        risk += p * death[target]
+                        mask |= endings[target]
+                option_deaths[option] += chance * risk
+                option_reach[option] += chance * reach
+                option_endings[option] |= mask
+                if weight:
+                    state_death += weight * risk
+                    state_endings |= mask
+            earlier_death.append(state_death)
+            earlier_endings.append(state_endings)
+        for (node, option, _), risk, reach, mask in zip(options, option_deaths, option_reach,
+                                                         option_endings):
+            result.reach[node.index] = reach
+            result.deaths[(number, node.index, option)] = risk / reach if reach else 0.0
+            result.endings[(number, node.index, option)] = mask
+        death, endings = earlier_death, earlier_endings
+    return result
+
+def choice_report(matrix):
+    """Prints each option's death chance and the endings it rules out"""
+    print("EVENT  NODE  OPTION  DEATH     ENDINGS STILL POSSIBLE")
+    print("-"*70)
+    for (event, node, option), death in sorted(matrix.deaths.items()):
+        reachable = matrix.reachable(event, node, option)
+        if len(reachable) == len(game.ENDING_NAMES):
+            endings = "all"
+        elif not reachable:
+            endings = "none (certain death)"
+        else:
+            endings = ", ".join(reachable)
+        print(f"{event:>5}{node:>6}{option:>8}{death:>9.2%}     {endings}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact odds of every Utopian Sands ending")
+    parser.add_argument("--choices", action="store_true",
+                        help="report every option's death chance and reachable endings")
+    parser.add_argument("--matrix", help="write the per-option result matrix to this JSON file")
+    args = parser.parse_args()
+    if args.choices or args.matrix:
+        start = time.perf_counter()
+        matrix = analyse_choices()
+        seconds = time.perf_counter() - start
+        if args.matrix:
+            with open(args.matrix, "w") as file:
+                json.dump(matrix.to_json(), file, indent=1)
+        choice_report(matrix)
+        print(f"Worked out in {seconds:.2f}s")
+    else:
+        report(enumerate_endings())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Choice analytics for Utopian Sands
+# Reads the columnar choice log written by game.AnalyticsSink (the game's
+# --analytics option, or sands_server.py --analytics FILE) and shows how
+# players chose at every choice point
+
+# Run in terminal command line: python3 sands_analytics.py [game_analytics.col] [--event N] [--json] [--content FILE]
+
+# ===== Imports =====
+
+import argparse
+import json
+from array import array
+from collections import Counter
+from itertools import compress
+
+try:
+    import numpy as np   # optional, makes counting millions of rows faster
+except ImportError:
+    np = None
+
+import utopian_sands_MX as game
+
+# ===== Reading =====
+def load_columns(path=game.ANALYTICS_FILE):
+    """{column name: values} for every row in an analytics file (NumPy arrays if available)"""
+    with open(path, "rb") as file:
+        columns = game.read_analytics(file.read())
+    if np is not None:
+        return {name: np.frombuffer(values, values.typecode) for name, values in columns.items()}
+    return columns
+
+def on_graph(columns, graph):
+    """(columns, rows left out) keeping only the rows logged on graph's events
+
+    Node indexes only mean something in the graph they were logged on.
+    Files from before analytics version 3 don't record it, so all their
+    rows are kept.
+    """
+    if "graph" not in columns:
+        return columns, 0
+    if np is not None:
+        keep = columns["graph"] == graph.checksum
+        left_out = len(keep) - int(np.count_nonzero(keep))
+        if left_out:
+            columns = {name: values[keep] for name, values in columns.items()}
+        return columns, left_out
+    keep = [value == graph.checksum for value in columns["graph"]]
+    left_out = keep.count(False)
+    if left_out:
+        columns = {name: array(values.typecode, compress(values, keep)) for name, values in columns.items()}
+    return columns, left_out
+
+# ===== Distributions =====
+class ChoiceStats:
+    """How often each option was taken at each choice point, and how long it took
+
+    counts[node index][option - 1] is how many times the option was picked.
+    """
+    def __init__(self, counts, think, sessions, rows, left_out=0):
+        self.counts = counts       # {node index: [times each option was picked]}
+        self.think = think         # {node index: mean seconds to pick}
+        self.sessions = sessions   # different games seen
+        self.rows = rows
+        self.left_out = left_out   # rows logged on other event content
+
+    def shares(self, node_index):
+        counts = self.counts.get(node_index, [])
+        total = sum(counts)
+        return [count / total for count in counts] if total else []
+
+    def to_json(self):
+        return {"rows": self.rows, "sessions": self.sessions, "left_out": self.left_out,
+                "nodes": {str(index): {"counts": counts, "mean_think": self.think[index]}
+                          for index, counts in sorted(self.counts.items())}}
+
+def choice_stats(columns, graph=None):
+    """ChoiceStats from load_columns() output, for the rows logged on graph"""
+    graph = graph or game.EVENT_GRAPH
+    columns, left_out = on_graph(columns, graph)
+    node, option, think = columns["node"], columns["option"], columns["think"]
+    counts = {}
+    mean_think = {}
+    if np is not None:
+        # One bincount over node * 256 + option instead of a loop over rows
+        flat = np.bincount(node.astype(np.int64) * 256 + option, minlength=len(graph.nodes) * 256)
+        per_node = np.bincount(node, minlength=len(graph.nodes))
+        think_total = np.bincount(node, weights=think, minlength=len(graph.nodes))
+        for index, choice_node in enumerate(graph.nodes[:len(per_node)]):
+            if per_node[index]:
+                options = len(choice_node.choices)
+                counts[index] = flat[index * 256 + 1:index * 256 + options + 1].tolist()
+                mean_think[index] = float(think_total[index] / per_node[index])
+        sessions = len(np.unique(columns["session"]))
+    else:
+        picked = Counter(zip(node, option))
+        think_total = Counter()
+        for index, seconds in zip(node, think):
+            think_total[index] += seconds
+        for index in sorted({index for index, _ in picked}):
+            options = len(graph.nodes[index].choices)
+            counts[index] = [picked[index, number] for number in range(1, options + 1)]
+            mean_think[index] = think_total[index] / sum(counts[index])
+        sessions = len(set(columns["session"]))
+    return ChoiceStats(counts, mean_think, sessions, len(node), left_out)
+
+# ===== Report =====
+def report(stats, graph=None, event=None):
+    """Prints each choice point's options with how often they were picked"""
+    graph = graph or game.EVENT_GRAPH
+    print(f"{stats.rows} choices from {stats.sessions} games")
+    if stats.left_out:
+        print(f"({stats.left_out} choices logged on other event content left out)")
+    for index, counts in sorted(stats.counts.items()):
+        node = graph.nodes[index]
+        if event is not None and node.event != event:
+            continue
+        print(f"\nEvent {node.event}, choice point {index} "
+              f"({sum(counts)} picks, {stats.think[index]:.1f}s to decide on average)")
+        for choice, share in zip(node.choices, stats.shares(index)):
+            print(f"  {share:>7.2%}  {choice}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how players chose, from an analytics file")
+    parser.add_argument("path", nargs="?", default=game.ANALYTICS_FILE)
+    parser.add_argument("--event", type=int, default=None, help="only this event's choice points")
+    parser.add_argument("--json", action="store_true", help="print the counts as JSON instead")
+    parser.add_argument("--content", help="the content file the games were played on (default: the built-in events)")
+    args = parser.parse_args()
+    graph = game.event_graph()
+    if args.content:
+        try:
+            graph = game.load_content(args.content, graph)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    stats = choice_stats(load_columns(args.path), graph)
+    if args.json:
+        print(json.dumps(stats.to_json(), indent=2))
+    else:
+        report(stats, graph, event=args.event)
+
+if __name__ == "__main__":
+    main()
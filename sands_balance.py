@@ -0,0 +1,466 @@
+# Balance optimizer for Utopian Sands
+# Searches for alignment changes (what each outcome passes to
+# update_alignment) and ending cutoffs (the -33/33 in axis_band) that give
+# a target mix of endings under a player policy, without playing any games
+
+# Run in terminal command line: python3 sands_balance.py [--target uniform|FILE.json] [--out proposal.json]
+# Balance for how real players chose: python3 sands_balance.py --observed game_analytics.col [--content FILE]
+
+# ===== Imports =====
+
+import argparse
+import copy
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("sands_balance.py needs NumPy (pip install numpy)") from None
+
+import sands_analysis as analysis
+import sands_batch as batch
+import utopian_sands_MX as game
+
+# ===== Parameters =====
+# A balance is a deltas array with one (law_change, good_change) row per
+# outcome that changes alignment, in alignment_outcomes() order, plus four
+# cutoffs (law low, law high, good low, good high): an axis value below the
+# low cutoff is Lawful/Good, above the high one Chaotic/Evil, like axis_band.
+CUTOFFS = (-33, 33, -33, 33)
+LIMIT = 50   # largest alignment change the search will try
+
+def alignment_outcomes(graph):
+    """[(label, outcome)] for every outcome in the graph that changes alignment"""
+    found = []
+    for node in graph.nodes:
+        for option, outcome in enumerate(node.outcomes, 1):
+            choice = node.choices[option - 1].split(" (")[0]
+            label = f"event {node.event}, choice point {node.index}, option {option} ({choice})"
+            add_alignment_outcomes(outcome, label, found)
+    return found
+
+def add_alignment_outcomes(outcome, label, found):
+    # Choice points reached through "then" are in graph.nodes themselves
+    if outcome.alignment:
+        found.append((label, outcome))
+    if outcome.chance:
+        add_alignment_outcomes(outcome.chance[1], label + ", chance hit", found)
+        add_alignment_outcomes(outcome.chance[2], label + ", chance miss", found)
+    if outcome.spend:
+        add_alignment_outcomes(outcome.spend[1], label + ", paid", found)
+        add_alignment_outcomes(outcome.spend[2], label + ", not paid", found)
+    if outcome.if_reputation:
+        add_alignment_outcomes(outcome.if_reputation[2], label + ", reputation high", found)
+        add_alignment_outcomes(outcome.if_reputation[3], label + ", reputation low", found)
+
+def graph_deltas(graph):
+    """The graph's own alignment changes as a deltas array"""
+    return np.array([outcome.alignment[:2] for _, outcome in alignment_outcomes(graph)], np.int64)
+
+def apply_balance(graph, deltas):
+    """A copy of graph with its alignment changes replaced by deltas"""
+    graph = copy.deepcopy(graph)
+    for (_, outcome), (law, good) in zip(alignment_outcomes(graph), deltas):
+        outcome.alignment = (int(law), int(good), outcome.alignment[2])
+    return graph
+
+# ===== Branch Skeleton =====
+# Alignment never decides which way an event goes (chance rolls, reputation,
+# items and health do), so every way the events can branch is worked out
+# once, along with which alignment changes each way applies. A candidate
+# balance then only has to push the odds of each (law_chaos, good_evil)
+# through those branches instead of playing or enumerating games.
+# States are sands_analysis states without the two axes:
+# (health, reputation, items), with whatever no later event reads forgotten.
+
+class Skeleton:
+    """Every branch through the events, from build_skeleton()
+
+    Each event is a table with one row per branch: the state going in
+    (numbered per event, new player = 0), the state coming out (-1 for
+    dying), its probability, and the alignment outcomes it applies in
+    order, padded with -1.
+    """
+    def __init__(self, start, moves, events):
+        self.start = start     # (law_chaos, good_evil) of a new player
+        self.moves = moves     # per event (source, target, probability, applied) arrays
+        self.events = events   # event number of each alignment outcome
+
+class SkeletonWalk:
+    """Walks choice points for build_skeleton(), like sands_analysis.apply_outcome without the axes"""
+    def __init__(self, graph, policy):
+        self.items = analysis.tracked_items(graph)
+        self.numbers = {id(outcome): i for i, (_, outcome) in enumerate(alignment_outcomes(graph))}
+        self.policy = policy
+        self.weights = {}
+
+    def node_paths(self, node, state, applied=()):
+        """[(probability, alignment outcomes applied, state)] out of a choice point"""
+        if node.index not in self.weights:
+            weights = [float(weight) for weight in self.policy(node)]
+            self.weights[node.index] = [weight / sum(weights) for weight in weights]
+        results = []
+        for weight, outcome in zip(self.weights[node.index], node.outcomes):
+            if weight:
+                results += [(weight * p, path, after)
+                            for p, path, after in self.outcome_paths(outcome, state, applied)]
+        return results
+
+    def outcome_paths(self, outcome, state, applied):
+        health, reputation, owned = state
+        if id(outcome) in self.numbers:
+            applied += (self.numbers[id(outcome)],)
+        if outcome.reputation and reputation is not None:
+            reputation = tuple(analysis.clamp(value + change, 0, 100)
+                               for value, change in zip(reputation, outcome.reputation))
+        health += outcome.health
+        if outcome.dies:
+            health = 0
+        if outcome.item in self.items and owned is not None:
+            owned = analysis.add_item(owned, self.items[outcome.item], 1)
+        state = (health, reputation, owned)
+
+        results = [(1.0, applied, state)]
+        if outcome.chance:
+            probability, hit, miss = outcome.chance
+            results = ([(probability * p, path, after)
+                        for p, path, after in self.outcome_paths(hit, state, applied)] +
+                       [((1 - probability) * p, path, after)
+                        for p, path, after in self.outcome_paths(miss, state, applied)])
+        elif outcome.spend:
+            spend, paid, unpaid = outcome.spend
+            for item in spend:
+                if owned[self.items[item]]:
+                    paying = (health, reputation, analysis.add_item(owned, self.items[item], -1))
+                    results = self.outcome_paths(paid, paying, applied)
+                    break
+            else:
+                results = self.outcome_paths(unpaid, state, applied)
+        elif outcome.if_reputation:
+            faction, above, higher, lower = outcome.if_reputation
+            value = reputation[game.FACTIONS.index(faction)]
+            results = self.outcome_paths(higher if value > above else lower, state, applied)
+
+        if outcome.then:
+            results = [(p * q, path, final)
+                       for p, applied_so_far, after in results
+                       for q, path, final in self.node_paths(outcome.then, after, applied_so_far)]
+        return results
+
+def build_skeleton(graph=None, policy=analysis.uniform_policy):
+    """Skeleton of every branch through the graph under policy(node)"""
+    graph = graph or game.EVENT_GRAPH
+    walk = SkeletonWalk(graph, policy)
+    needs = analysis.later_needs(graph) + [((False,) * len(game.FACTIONS), False)]
+    caps = analysis.health_caps(graph) + [1]
+    law, good, health, reputation, owned = analysis.start_state(graph)
+    numbers = {(health, reputation, owned): 0}
+    moves = []
+    events = [0] * len(walk.numbers)
+    for number, event in enumerate(graph.events, 1):
+        read_factions, reads_items = needs[number]
+        rows = {}
+        next_numbers = {}
+        for state, source in numbers.items():
+            for p, applied, after in walk.node_paths(event, state):
+                if after[0] <= 0:
+                    target = -1
+                else:
+                    after = analysis.forget((0, 0) + after, caps[number], read_factions, reads_items)[2:]
+                    target = next_numbers.setdefault(after, len(next_numbers))
+                key = (source, target, applied)
+                rows[key] = rows.get(key, 0.0) + p
+                for index in applied:
+                    events[index] = number
+        width = max([len(applied) for _, _, applied in rows] + [1])
+        rows = sorted(rows.items())
+        moves.append((np.array([source for (source, _, _), _ in rows], np.int64),
+                      np.array([target for (_, target, _), _ in rows], np.int64),
+                      np.array([p for _, p in rows]),
+                      np.array([applied + (-1,) * (width - len(applied)) for (_, _, applied), _ in rows],
+                               np.int64).reshape(len(rows), width)))
+        numbers = next_numbers
+    return Skeleton((law, good), moves, events)
+
+# ===== Evaluating a Balance =====
+# The odds going into an event are kept as "particles": parallel arrays of
+# state number, law_chaos, good_evil and probability, one per distinct
+# (state, law_chaos, good_evil), sorted by state. An event pairs every
+# particle with every branch out of its state, shifts the axes by that
+# branch's alignment changes and merges particles that land together.
+
+def start_particles(skeleton):
+    law, good = skeleton.start
+    return (np.zeros(1, np.int64), np.array([law], np.int64), np.array([good], np.int64), np.ones(1))
+
+def play_event_particles(particles, moves, deltas):
+    """Particles coming out of one event from those going in"""
+    state, law, good, p = particles
+    source, target, probability, applied = moves
+    # Every (branch, particle) pair with the particle in the branch's state
+    first = np.searchsorted(state, source, "left")
+    counts = np.searchsorted(state, source, "right") - first
+    branch = np.repeat(np.arange(len(source)), counts)
+    offsets = np.arange(len(branch)) - np.repeat(np.cumsum(counts) - counts, counts)
+    particle = first[branch] + offsets
+    lives = target[branch] >= 0
+    branch, particle = branch[lives], particle[lives]
+    law, good = law[particle], good[particle]
+    for column in applied.T:
+        index = column[branch]
+        has = index >= 0
+        law[has] = np.clip(law[has] + deltas[index[has], 0], -100, 100)
+        good[has] = np.clip(good[has] + deltas[index[has], 1], -100, 100)
+    key = (target[branch] * 201 + law + 100) * 201 + good + 100
+    weight = p[particle] * probability[branch]
+    size = (int(target.max()) + 1) * 201 * 201
+    if size <= 1 << 22:
+        # Few states coming out: add straight into every possible key
+        weight = np.bincount(key, weights=weight, minlength=size)
+        key = np.flatnonzero(weight)
+        weight = weight[key]
+    else:
+        key, where = np.unique(key, return_inverse=True)
+        weight = np.bincount(where, weights=weight, minlength=len(key))
+    good, rest = key % 201 - 100, key // 201
+    return rest // 201, rest % 201 - 100, good, weight
+
+def walk_particles(skeleton, deltas, particles=None, first_event=1):
+    """Particles after each event from first_event on (given the ones going into it)"""
+    particles = start_particles(skeleton) if particles is None else particles
+    after_each = []
+    for moves in skeleton.moves[first_event - 1:]:
+        particles = play_event_particles(particles, moves, deltas)
+        after_each.append(particles)
+    return after_each
+
+def final_grid(particles):
+    """201 x 201 odds of every (law_chaos, good_evil) surviving players end on"""
+    _, law, good, p = particles
+    return np.bincount((law + 100) * 201 + good + 100, weights=p, minlength=201 * 201).reshape(201, 201)
+
+def ending_shares(grid, cutoffs):
+    """Share of surviving players getting each ending, in game.ENDING_NAMES order"""
+    law_low, law_high, good_low, good_high = cutoffs
+    law_bands = band_slices(law_low, law_high)
+    good_bands = band_slices(good_low, good_high)
+    total = grid.sum()
+    shares = np.zeros(len(game.ENDING_NAMES))
+    for good_band, good_rows in enumerate(good_bands):
+        for law_band, law_rows in enumerate(law_bands):
+            shares[good_band * 3 + law_band] = grid[law_rows, good_rows].sum()
+    return shares / total if total else shares
+
+def band_slices(low, high):
+    """Grid index ranges of the three bands of an axis, like axis_band"""
+    return slice(0, low + 100), slice(low + 100, high + 101), slice(high + 101, 201)
+
+def distance(shares, target):
+    """Total variation distance: the share of players who'd need a different ending"""
+    return float(np.abs(shares - target).sum() / 2)
+
+# ===== Search =====
+class Search:
+    """Coordinate descent over the alignment changes and cutoffs
+
+    Each alignment change is moved one step either way if that brings the
+    endings closer to the target. Changes keep their sign (an option that
+    pushed toward Lawful still does) and zeros stay zero, so the story still
+    reads right. When a full round finds nothing, the step is halved.
+    Trying a change only recomputes from the event it's in onwards.
+    """
+    def __init__(self, skeleton, deltas, target, cutoffs=CUTOFFS, limit=LIMIT):
+        self.skeleton = skeleton
+        self.original = np.array(deltas)
+        self.deltas = np.array(deltas)
+        self.cutoffs = list(cutoffs)
+        self.target = np.asarray(target, float)
+        self.limit = limit
+        self.evaluations = 0
+        self.after_each = walk_particles(skeleton, self.deltas)
+        self.best = self.score(self.after_each[-1], self.cutoffs)
+
+    def score(self, particles, cutoffs):
+        return distance(ending_shares(final_grid(particles), cutoffs), self.target)
+
+    def allowed(self, index, axis, value):
+        original = self.original[index, axis]
+        if original == 0:
+            return value == 0
+        return 0 < value * np.sign(original) <= max(self.limit, abs(original))
+
+    def try_delta(self, index, axis, value):
+        deltas = self.deltas.copy()
+        deltas[index, axis] = value
+        event = self.skeleton.events[index]
+        particles = self.after_each[event - 2] if event > 1 else None
+        after_each = walk_particles(self.skeleton, deltas, particles, event)
+        self.evaluations += 1
+        score = self.score(after_each[-1], self.cutoffs)
+        if score < self.best - 1e-12:
+            self.deltas = deltas
+            self.after_each[event - 1:] = after_each
+            self.best = score
+            return True
+        return False
+
+    def try_cutoff(self, which, value):
+        cutoffs = list(self.cutoffs)
+        cutoffs[which] = value
+        low, high = cutoffs[which & 2], cutoffs[(which & 2) + 1]
+        if not -100 < low < 0 < high < 100:
+            return False
+        score = self.score(self.after_each[-1], cutoffs)
+        if score < self.best - 1e-12:
+            self.cutoffs = cutoffs
+            self.best = score
+            return True
+        return False
+
+    def round(self, step, tune_cutoffs=True):
+        """One pass over every parameter, returns True if anything improved"""
+        improved = False
+        for index in range(len(self.deltas)):
+            for axis in (0, 1):
+                for value in (self.deltas[index, axis] + step, self.deltas[index, axis] - step):
+                    if self.allowed(index, axis, value) and self.try_delta(index, axis, value):
+                        improved = True
+                        break
+        if tune_cutoffs:
+            for which in range(4):
+                if (self.try_cutoff(which, self.cutoffs[which] + step)
+                        or self.try_cutoff(which, self.cutoffs[which] - step)):
+                    improved = True
+        return improved
+
+    def run(self, steps=(8, 4, 2, 1), rounds=20, tune_cutoffs=True, tolerance=0.0, log=None):
+        """Searches with each step size in turn, at most rounds passes each
+
+        Stops early once the endings are within tolerance of the target.
+        """
+        for step in steps:
+            for _ in range(rounds):
+                if self.best <= tolerance or not self.round(step, tune_cutoffs):
+                    break
+                if log:
+                    log(f"step {step}: {self.best:.4%} off target after {self.evaluations} evaluations")
+        return self
+
+# ===== Policies and Targets =====
+def observed_policy(path, graph=None):
+    """Policy picking options as often as players did in an analytics file (uniform where unseen)
+
+    Only choices logged on graph's events count.
+    """
+    import sands_analytics
+    stats = sands_analytics.choice_stats(sands_analytics.load_columns(path), graph)
+    def policy(node):
+        counts = stats.counts.get(node.index)
+        if not counts or not sum(counts):
+            return analysis.uniform_policy(node)
+        return counts
+    return policy
+
+def load_target(spec):
+    """Target shares in game.ENDING_NAMES order from "uniform" or a JSON file of {ending: weight}"""
+    if spec == "uniform":
+        weights = {name: 1 for name in game.ENDING_NAMES}
+    else:
+        with open(spec) as file:
+            weights = json.load(file)
+        unknown = set(weights) - set(game.ENDING_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown endings in target: {sorted(unknown)}")
+    target = np.array([float(weights.get(name, 0)) for name in game.ENDING_NAMES])
+    if target.sum() <= 0:
+        raise ValueError("Target needs at least one ending with weight above 0")
+    return target / target.sum()
+
+# ===== Checking and Reporting =====
+def sampled_shares(graph, cutoffs, policy=None, games=200_000, seed=0):
+    """Ending shares of surviving players over games played by the batch simulator"""
+    players = batch.BatchRun(batch.PlayerBatch(games, batch.graph_items(graph)), graph,
+                             policy, np.random.default_rng(seed)).play()
+    alive = players.died_in == 0
+    grid = np.zeros((201, 201))
+    np.add.at(grid, (players.law_chaos[alive] + 100, players.good_evil[alive] + 100), 1)
+    return ending_shares(grid, cutoffs)
+
+def proposal(graph, search, before, after, sampled=None):
+    """The proposed balance as plain data"""
+    changes = []
+    for (label, outcome), old, new in zip(alignment_outcomes(graph), search.original, search.deltas):
+        if tuple(old) != tuple(new):
+            changes.append({"outcome": label, "specific": outcome.alignment[2],
+                            "old": [int(value) for value in old], "new": [int(value) for value in new]})
+    shares = lambda values: {name: round(float(value), 6) for name, value in zip(game.ENDING_NAMES, values)}
+    document = {"cutoffs": {"old": list(CUTOFFS), "new": [int(value) for value in search.cutoffs]},
+                "alignment": changes,
+                "target": shares(search.target), "before": shares(before), "after": shares(after),
+                "distance": {"before": distance(before, search.target), "after": search.best}}
+    if sampled is not None:
+        document["sampled"] = shares(sampled)
+    return document
+
+def report(document):
+    """Prints the proposal as tables"""
+    print(f"Cutoffs (law low, law high, good low, good high): "
+          f"{document['cutoffs']['old']} -> {document['cutoffs']['new']}")
+    print(f"\n{len(document['alignment'])} alignment changes (law, good):")
+    for change in document["alignment"]:
+        print(f"  {str(tuple(change['old'])):>10} -> {str(tuple(change['new'])):<10} {change['outcome']}")
+    columns = [name for name in ("target", "before", "after", "sampled") if name in document]
+    print("\nENDING" + " "*12 + "".join(f"{name.upper():>10}" for name in columns))
+    print("-"*(18 + 10 * len(columns)))
+    for ending in game.ENDING_NAMES:
+        print(f"{ending:<18}" + "".join(f"{document[name][ending]:>10.2%}" for name in columns))
+    print(f"\nOff target: {document['distance']['before']:.2%} before, "
+          f"{document['distance']['after']:.2%} after (share of surviving players in the wrong ending)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune alignment changes and cutoffs toward a target mix of endings")
+    parser.add_argument("--target", default="uniform", help="uniform, or a JSON file of {ending: weight}")
+    parser.add_argument("--observed", help="analytics file to take the player policy from (default: every option equally likely)")
+    parser.add_argument("--fixed-cutoffs", action="store_true", help="only tune the alignment changes")
+    parser.add_argument("--limit", type=int, default=LIMIT, help="largest alignment change to try")
+    parser.add_argument("--rounds", type=int, default=20, help="most passes per step size")
+    parser.add_argument("--tolerance", type=float, default=0.005,
+                        help="stop once this close to the target (share of players in the wrong ending)")
+    parser.add_argument("--check", type=int, default=200_000, help="games to play with the batch simulator as a check (0 to skip)")
+    parser.add_argument("--out", help="write the proposal to this JSON file")
+    parser.add_argument("--content", help="balance the events in this content file (default: the built-in events)")
+    args = parser.parse_args()
+
+    graph = game.event_graph()
+    if args.content:
+        try:
+            graph = game.load_content(args.content, graph)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    policy = observed_policy(args.observed, graph) if args.observed else analysis.uniform_policy
+    target = load_target(args.target)
+    start = time.perf_counter()
+    skeleton = build_skeleton(graph, policy)
+    deltas = graph_deltas(graph)
+    search = Search(skeleton, deltas, target, limit=args.limit)
+    before = ending_shares(final_grid(search.after_each[-1]), CUTOFFS)
+    print(f"{len(deltas)} alignment outcomes, {sum(len(moves[0]) for moves in skeleton.moves)} branches "
+          f"({time.perf_counter() - start:.2f}s)")
+    search.run(rounds=args.rounds, tune_cutoffs=not args.fixed_cutoffs, tolerance=args.tolerance, log=print)
+    after = ending_shares(final_grid(search.after_each[-1]), search.cutoffs)
+    print(f"Searched in {time.perf_counter() - start:.1f}s\n")
+
+    sampled = None
+    if args.check:
+        sampled = sampled_shares(apply_balance(graph, search.deltas), search.cutoffs,
+                                 None if policy is analysis.uniform_policy else policy, args.check)
+    document = proposal(graph, search, before, after, sampled)
+    report(document)
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(document, file, indent=2)
+        print(f"Proposal written to {args.out}")
+
+if __name__ == "__main__":
+    main()
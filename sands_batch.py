@@ -0,0 +1,272 @@
+# Batch simulator for Utopian Sands
+# Plays many games at once with NumPy, one array per stat instead of one
+# Player object per game, for balance sweeps over millions of players
+
+# Run in terminal command line: python3 sands_batch.py [number of players]
+
+# ===== Imports =====
+
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("sands_batch.py needs NumPy (pip install numpy)") from None
+
+import utopian_sands_MX as game
+
+# ===== Player Batch =====
+def ending_names():
+    """Alignment names in ending id order (id = good/evil band * 3 + law/chaos band)"""
+    return list(game.ENDING_NAMES)
+
+# game.ENDING_TABLE as a 201 x 201 array, indexed [law_chaos + 100, good_evil + 100]
+ENDING_GRID = np.frombuffer(game.ENDING_TABLE, np.int8).reshape(201, 201)
+
+def classify_endings(law_chaos, good_evil):
+    """Ending id for every pair of axis values, as one gather from ENDING_GRID"""
+    law = np.clip(law_chaos, -100, 100).astype(np.intp) + 100
+    good = np.clip(good_evil, -100, 100).astype(np.intp) + 100
+    return ENDING_GRID[law, good]
+
+def graph_outcomes(graph):
+    """Every outcome in the graph, including chance/spend/reputation branches"""
+    for node in graph.nodes:
+        stack = list(node.outcomes)
+        while stack:
+            outcome = stack.pop()
+            yield outcome
+            if outcome.chance:
+                stack += outcome.chance[1:]
+            if outcome.spend:
+                stack += outcome.spend[1:]
+            if outcome.if_reputation:
+                stack += outcome.if_reputation[2:]
+
+def graph_items(graph):
+    """Every item any outcome in the graph can hand out or spend"""
+    items = set()
+    for outcome in graph_outcomes(graph):
+        if outcome.item:
+            items.add(outcome.item)
+        if outcome.spend:
+            items.update(outcome.spend[0])
+    return tuple(sorted(items))
+
+class PlayerBatch:
+    """Player stats for n games, stored as one column per stat"""
+    def __init__(self, n, items):
+        start = game.Player("Stranger", "Utopian Society")
+        self.n = n
+        self.items = items
+        self.law_chaos = np.full(n, start.alignment["law_chaos"], np.int16)
+        self.good_evil = np.full(n, start.alignment["good_evil"], np.int16)
+        # Same order as game.ALIGNMENT_TYPES
+        self.choices = np.zeros((n, len(game.ALIGNMENT_TYPES)), np.int16)
+        for i, name in enumerate(game.ALIGNMENT_TYPES):
+            self.choices[:, i] = start.alignment["choices"][name]
+        # Same order as game.FACTIONS
+        self.reputation = np.tile(np.array([start.reputation[f] for f in game.FACTIONS], np.int16),
+                                  (n, 1))
+        self.health = np.full(n, start.health, np.int16)
+        self.guilt = np.full(n, start.guilt, np.int16)
+        self.inventory = np.zeros((n, len(items)), np.int16)  # count of each item
+        self.died_in = np.zeros(n, np.int8)  # event number the player died in, 0 = alive
+        self.draws = np.zeros(n, np.int16)   # chance rolls used so far
+
+    def endings(self):
+        """Ending id of every player, -1 for players who died"""
+        return np.where(self.died_in > 0, -1, classify_endings(self.law_chaos, self.good_evil))
+
+# ===== Simulation =====
+class BatchRun:
+    """Walks the compiled event graph for a whole PlayerBatch
+
+    choices and rolls can be given to replay exact games: choices[i, node.index]
+    is player i's option at that choice point and rolls[i, k] is the k-th
+    chance roll player i makes. Otherwise they're drawn from rng (a NumPy
+    Generator) using policy(node) for the option weights.
+    """
+    def __init__(self, batch, graph, policy=None, rng=None, choices=None, rolls=None):
+        self.batch = batch
+        self.graph = graph
+        self.policy = policy
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.choices = choices
+        self.rolls = rolls
+        self.item_index = {item: i for i, item in enumerate(batch.items)}
+        self.alignment_index = {name: i for i, name in enumerate(game.ALIGNMENT_TYPES)}
+        self.faction_index = {name: i for i, name in enumerate(game.FACTIONS)}
+
+    def play(self):
+        """Plays every event, dropping players as they die"""
+        batch = self.batch
+        active = np.arange(batch.n)
+        for number, event in enumerate(self.graph.events, 1):
+            self.play_node(event, active)
+            dead = batch.health[active] <= 0
+            batch.died_in[active[dead]] = number
+            active = active[~dead]
+        return batch
+
+    def pick(self, node, idx):
+        """Option number picked by each player in idx"""
+        if self.choices is not None:
+            return self.choices[idx, node.index]
+        count = len(node.choices)
+        if self.policy is None:
+            return self.rng.integers(1, count + 1, size=len(idx))
+        weights = np.array([float(w) for w in self.policy(node)])
+        return self.rng.choice(count, size=len(idx), p=weights / weights.sum()) + 1
+
+    def roll(self, idx):
+        """Next chance roll for each player in idx"""
+        batch = self.batch
+        if self.rolls is not None:
+            values = self.rolls[idx, batch.draws[idx]]
+        else:
+            values = self.rng.random(len(idx))
+        batch.draws[idx] += 1
+        return values
+
+    def play_node(self, node, idx):
+        picked = self.pick(node, idx)
+        for option, outcome in enumerate(node.outcomes, 1):
+            chosen = idx[picked == option]
+            if len(chosen):
+                self.apply(outcome, chosen)
+
+    def apply(self, outcome, idx):
+        """Applies an outcome to the players in idx (each listed once)"""
+        batch = self.batch
+        if outcome.alignment:
+            law, good, specific = outcome.alignment
+            batch.law_chaos[idx] = np.clip(batch.law_chaos[idx] + law, -100, 100)
+            batch.good_evil[idx] = np.clip(batch.good_evil[idx] + good, -100, 100)
+            batch.choices[idx, self.alignment_index[specific]] += 1
+        if outcome.reputation:
+            batch.reputation[idx] = np.clip(batch.reputation[idx] + np.array(outcome.reputation, np.int16),
+                                            0, 100)
+        if outcome.health:
+            batch.health[idx] += outcome.health
+        if outcome.guilt:
+            batch.guilt[idx] += outcome.guilt
+        if outcome.dies:
+            batch.health[idx] = 0
+        if outcome.item:
+            batch.inventory[idx, self.item_index[outcome.item]] += 1
+
+        if outcome.chance:
+            probability, hit, miss = outcome.chance
+            lucky = self.roll(idx) < probability
+            self.apply(hit, idx[lucky])
+            self.apply(miss, idx[~lucky])
+        if outcome.spend:
+            items, paid, unpaid = outcome.spend
+            left = idx
+            payers = []
+            for item in items:
+                column = self.item_index[item]
+                has = batch.inventory[left, column] > 0
+                batch.inventory[left[has], column] -= 1
+                payers.append(left[has])
+                left = left[~has]
+            self.apply(paid, np.concatenate(payers))
+            self.apply(unpaid, left)
+        if outcome.if_reputation:
+            faction, above, higher, lower = outcome.if_reputation
+            high = batch.reputation[idx, self.faction_index[faction]] > above
+            self.apply(higher, idx[high])
+            self.apply(lower, idx[~high])
+        if outcome.then:
+            self.play_node(outcome.then, idx)
+
+def simulate(n, policy=None, seed=None, graph=None, chunk=1_000_000):
+    """Plays n games and returns {ending name: count}, with deaths under "Died"
+
+    Games are run chunk at a time so memory stays flat for big n.
+    """
+    graph = graph or game.EVENT_GRAPH
+    items = graph_items(graph)
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(10, np.int64)
+    done = 0
+    while done < n:
+        size = min(chunk, n - done)
+        batch = BatchRun(PlayerBatch(size, items), graph, policy, rng).play()
+        counts += np.bincount(batch.endings() + 1, minlength=10)
+        done += size
+    histogram = {"Died": int(counts[0])}
+    for name, count in zip(ending_names(), counts[1:]):
+        histogram[name] = int(count)
+    return histogram
+
+# ===== Checking Against the Game =====
+class ListRandom:
+    """Stands in for the random module, handing out rolls from a list"""
+    def __init__(self, values):
+        self.values = iter(values)
+
+    def random(self):
+        return float(next(self.values))
+
+def check_against_game(n=1000, seed=0, graph=None):
+    """Plays the same n games through the batch and the normal game code
+
+    Returns the number of games whose final stats differ (should be 0).
+    """
+    graph = graph or game.EVENT_GRAPH
+    rng = np.random.default_rng(seed)
+    choices = np.zeros((n, len(graph.nodes)), np.int64)
+    for node in graph.nodes:
+        choices[:, node.index] = rng.integers(1, len(node.choices) + 1, size=n)
+    # No game can roll more often than there are chance outcomes
+    rolls = rng.random((n, sum(1 for outcome in graph_outcomes(graph) if outcome.chance)))
+    items = graph_items(graph)
+    batch = BatchRun(PlayerBatch(n, items), graph,
+                     choices=choices, rolls=rolls).play()
+    names = ending_names()
+    endings = batch.endings()
+
+    mismatches = 0
+    for i in range(n):
+        player = game.Player("Stranger", "Utopian Society")
+        rolls_i = ListRandom(rolls[i])
+        died_in = 0
+        for number, event in enumerate(graph.events, 1):
+            steps = game.walk_node(event, player, rolls_i)
+            try:
+                step = next(steps)
+                while True:
+                    if isinstance(step, str):
+                        step = next(steps)
+                    else:
+                        step = steps.send(int(choices[i, step.index]))
+            except StopIteration:
+                pass
+            if player.health <= 0:
+                died_in = number
+                break
+        expected = (died_in,
+                    player.alignment["law_chaos"], player.alignment["good_evil"],
+                    [player.alignment["choices"][name] for name in game.ALIGNMENT_TYPES],
+                    [player.reputation[faction] for faction in game.FACTIONS],
+                    player.health, player.guilt,
+                    [player.inventory.count(item) for item in items],
+                    None if died_in else game.axis_alignment(player.alignment["law_chaos"],
+                                                            player.alignment["good_evil"]))
+        got = (int(batch.died_in[i]),
+               int(batch.law_chaos[i]), int(batch.good_evil[i]),
+               batch.choices[i].tolist(), batch.reputation[i].tolist(),
+               int(batch.health[i]), int(batch.guilt[i]),
+               batch.inventory[i].tolist(),
+               None if endings[i] < 0 else names[endings[i]])
+        if expected != got:
+            mismatches += 1
+    return mismatches
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    histogram = simulate(n)
+    for name, count in histogram.items():
+        print(f"{name:<20}{count:>12}{count / n:>10.3%}")
@@ -0,0 +1,340 @@
+# Benchmarks for Utopian Sands
+# Times start-up, text rendering, whole playthroughs, saving and loading and
+# the ending screens, and measures how much memory a player takes, so slow
+# changes get noticed before they ship
+
+# Run in terminal command line: python3 sands_bench.py [--json FILE] [--save-baseline]
+# Exits with status 1 if start-up is over budget or anything is slower than
+# its stored baseline by more than the threshold
+
+# ===== Imports =====
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import utopian_sands_MX as game
+
+# ===== Startup =====
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAUNCHER = os.path.join(HERE, "utopian_sands_MX.command")
+# Run straight from source, Python compiles the whole file on every launch;
+# timed for comparison but not held to the budget
+SOURCE_SCRIPT = os.path.join(HERE, "utopian_sands_MX.py")
+FIRST_PROMPT = b"Enter choice (1-3): "
+STARTUP_BUDGET = 0.050   # seconds from launch to the first prompt
+
+def time_to_prompt(command, prompt=FIRST_PROMPT, cwd=None):
+    """Seconds from starting command until prompt shows up on its output"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, cwd=cwd)
+    output = b""
+    while prompt not in output:
+        data = os.read(process.stdout.fileno(), 4096)
+        if not data:
+            process.wait()
+            raise RuntimeError(f"{command[-1]} exited before showing {prompt!r}")
+        output += data
+    elapsed = time.perf_counter() - start
+    process.communicate(b"3\n")   # Quit from the menu
+    return elapsed
+
+def bench_startup(script, runs=20):
+    """Sorted launch-to-menu times for one game script
+
+    Runs in an empty folder so no saved game or unfinished journal changes
+    what the first prompt is.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        return sorted(time_to_prompt([sys.executable, script, "--fast"], cwd=folder)
+                      for _ in range(runs))
+
+def bench_interpreter(runs=20):
+    """Sorted times for Python to start and exit doing nothing, for comparison"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+# ===== In-Process Benchmarks =====
+# Every benchmark plays from fixed seeds, so each run does exactly the same
+# work, and timings are the best of several repeats (timeit turns the
+# garbage collector off while it times). A whole process can still run fast
+# or slow as a piece, so the suite runs in a few fresh processes and keeps
+# the median of each result.
+SEED = 2025
+REPEATS = 5
+
+@contextlib.contextmanager
+def hooks(**values):
+    """Sets game hooks like renderer and choice_provider for a with block"""
+    old = {name: getattr(game, name) for name in values}
+    for name, value in values.items():
+        setattr(game, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(game, name, value)
+
+def best_time(function, number, repeats=REPEATS):
+    """Fewest seconds a call of function took, over repeats batches of number calls"""
+    return min(timeit.repeat(function, number=number, repeat=repeats)) / number
+
+def story_lines():
+    """Every line of narration in the events, as the game would type them"""
+    lines = []
+    for entry in game.EVENT_TABLE:
+        lines.extend(entry.get("banner", []))
+        lines.extend(entry.get("text", []))
+    return lines
+
+def bench_render(passes=20):
+    """type_text() throughput in zero-delay mode, writing and flushing to the null device"""
+    lines = story_lines()
+    chars = sum(len(line) + 1 for line in lines)
+    with open(os.devnull, "w") as null, hooks(renderer=game.TextRenderer("zero", stream=null)):
+        def render():
+            for line in lines:
+                game.type_text(line)
+        seconds = best_time(render, passes)
+    return {"render_chars_per_second": chars / seconds,
+            "render_lines_per_second": len(lines) / seconds}
+
+def play_through_events(index):
+    """Plays game number index through event_1..event_7 like main() does"""
+    rng = random.Random(game.derive_seed(SEED, "choices", index))
+    player = game.Player("Bench", "Utopian Society", game.derive_seed(SEED, "game", index))
+    with hooks(choice_provider=lambda options: rng.randint(1, len(options))):
+        for event in game.EVENTS:
+            event(player)
+            if player.health <= 0:
+                break
+    return player
+
+def bench_playthroughs(games=500):
+    """Whole games per second through the interactive event functions, text thrown away"""
+    with hooks(renderer=game.render_nothing):
+        def play():
+            for index in range(games):
+                play_through_events(index)
+        seconds = best_time(play, 1)
+    return {"playthroughs_per_second": games / seconds}
+
+def bench_save_load(rounds=200):
+    """save_game() then loading the slot back, against a save store in a temp folder"""
+    with tempfile.TemporaryDirectory() as folder:
+        store = game.SaveStore(os.path.join(folder, game.SAVE_STORE_FILE))
+        with hooks(renderer=game.render_nothing, save_store=store):
+            player = play_through_events(0)
+            def round_trip():
+                game.save_game(player, 3)
+                loaded, event_counter = store.load(player.name)
+                assert event_counter == 3 and loaded.seed == player.seed
+            seconds = best_time(round_trip, rounds)
+        store.close()
+    return {"save_load_round_trip_ms": seconds * 1000,
+            "save_bytes": len(game.pack_save(player, 3))}
+
+def bench_ending(calls=2000):
+    """determine_final_alignment() and show_ending() for a mix of finished players"""
+    with hooks(renderer=game.render_nothing):
+        players = [player for player in map(play_through_events, range(200)) if player.health > 0]
+        def ending():
+            for player in players:
+                alignment, most_common = game.determine_final_alignment(player)
+                game.show_ending(player, alignment, most_common)
+        seconds = best_time(ending, max(1, calls // len(players)))
+    return {"ending_us_per_call": seconds / len(players) * 1e6}
+
+def bench_memory(count=1000):
+    """Bytes each finished player keeps alive, as a Player and as a CompactPlayer"""
+    results = {}
+    for name, player_class in (("player_bytes", game.Player),
+                               ("compact_player_bytes", game.CompactPlayer)):
+        # One game first, so the event graph and interned names aren't counted
+        game.play_headless(player_class=player_class, seed=SEED)
+        choose = random.Random(SEED).choice
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        players = [game.play_headless(lambda options, player: choose(range(1, len(options) + 1)),
+                                      player_class=player_class,
+                                      seed=game.derive_seed(SEED, "game", i))[0]
+                   for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[name] = (after - before) / len(players)
+    return results
+
+def bench_launch():
+    """Median launch-to-menu time of the launcher"""
+    return {"startup_ms": statistics.median(bench_startup(LAUNCHER)) * 1000}
+
+BENCHMARKS = {
+    "render": bench_render,
+    "playthroughs": bench_playthroughs,
+    "save_load": bench_save_load,
+    "ending": bench_ending,
+    "memory": bench_memory,
+    "startup": bench_launch,
+}
+
+# Whether a bigger number is better, for every result
+HIGHER_IS_BETTER = {
+    "render_chars_per_second": True,
+    "render_lines_per_second": True,
+    "playthroughs_per_second": True,
+    "save_load_round_trip_ms": False,
+    "save_bytes": False,
+    "ending_us_per_call": False,
+    "player_bytes": False,
+    "compact_player_bytes": False,
+    "startup_ms": False,
+}
+
+PROCESSES = 5
+
+def run_benchmarks(names=None):
+    """{result name: value} for the named benchmarks (all of them by default)"""
+    results = {}
+    for name in names or BENCHMARKS:
+        results.update(BENCHMARKS[name]())
+    return results
+
+def run_in_processes(names=None, processes=PROCESSES):
+    """run_benchmarks() in fresh processes, returns the median of each result"""
+    command = [sys.executable, os.path.abspath(__file__), "--raw"]
+    for name in names or ():
+        command += ["--only", name]
+    runs = [json.loads(subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout)
+            for _ in range(processes)]
+    return {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+# ===== Baselines =====
+BASELINE_FILE = os.path.join(HERE, "sands_bench_baseline.json")
+THRESHOLD = 0.25   # how much worse than the baseline counts as a regression
+
+def results_document(results):
+    """Results plus where they came from, as written by --json"""
+    return {"python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results}
+
+def load_baseline(path=BASELINE_FILE):
+    """Stored baseline results, or {} if there's no baseline file"""
+    try:
+        with open(path) as file:
+            return json.load(file)["results"]
+    except FileNotFoundError:
+        return {}
+
+def change(name, value, baseline):
+    """How much worse value is than baseline, as a fraction (negative when better)"""
+    if HIGHER_IS_BETTER[name]:
+        return baseline / value - 1
+    return value / baseline - 1
+
+def regressions(results, baseline, threshold=THRESHOLD):
+    """Names of results worse than their baseline by more than threshold"""
+    return [name for name, value in results.items()
+            if name in baseline and change(name, value, baseline[name]) > threshold]
+
+# ===== Report =====
+def number(value):
+    """value for the table, with more decimals when it's small"""
+    return f"{value:>14,.1f}" if value >= 100 else f"{value:>14.3f}"
+
+def report(results, baseline, threshold=THRESHOLD):
+    print(f"{'RESULT':<28}{'VALUE':>14}{'BASELINE':>14}{'WORSE':>10}")
+    print("-"*66)
+    for name, value in results.items():
+        line = f"{name:<28}{number(value)}"
+        if name in baseline:
+            worse = change(name, value, baseline[name])
+            flag = "  SLOWER" if worse > threshold else ""
+            line += f"{number(baseline[name])}{worse:>+10.1%}{flag}"
+        print(line)
+    print("-"*66)
+
+def report_startup():
+    """The original start-up table, returns True if the launcher is over budget"""
+    print(f"{'LAUNCH TO FIRST PROMPT':<32}{'MIN':>9}{'MEDIAN':>9}{'MAX':>9}")
+    print("-"*59)
+    interpreter = bench_interpreter()
+    print(f"{'python -c pass':<32}{interpreter[0] * 1000:>7.1f}ms"
+          f"{statistics.median(interpreter) * 1000:>7.1f}ms{interpreter[-1] * 1000:>7.1f}ms")
+    for script in (LAUNCHER, SOURCE_SCRIPT):
+        times = bench_startup(script)
+        if script == LAUNCHER:
+            over = statistics.median(times) > STARTUP_BUDGET
+        print(f"{os.path.basename(script):<32}{times[0] * 1000:>7.1f}ms"
+              f"{statistics.median(times) * 1000:>7.1f}ms{times[-1] * 1000:>7.1f}ms")
+    print("-"*59)
+    print(f"Budget for {os.path.basename(LAUNCHER)}: {STARTUP_BUDGET * 1000:.0f}ms median, "
+          + ("OVER" if over else "OK"))
+    return over
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Utopian Sands against stored baselines")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS),
+                        help="run just this benchmark (repeatable)")
+    parser.add_argument("--json", help="write the results to this file as JSON (- for stdout)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="fraction worse than the baseline that fails the run (default 0.25)")
+    parser.add_argument("--processes", type=int, default=PROCESSES,
+                        help="fresh processes to run the suite in (default 5)")
+    parser.add_argument("--startup", action="store_true",
+                        help="just the start-up table and its budget, like before")
+    parser.add_argument("--raw", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.startup:
+        sys.exit(1 if report_startup() else 0)
+    if args.raw:
+        # One process's results for run_in_processes()
+        print(json.dumps(run_benchmarks(args.only)))
+        return
+
+    results = run_in_processes(args.only, args.processes)
+    document = results_document(results)
+    if args.json == "-":
+        print(json.dumps(document, indent=2))
+    else:
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(document, file, indent=2)
+        report(results, load_baseline(args.baseline), args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(document, file, indent=2)
+            file.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+    failed = regressions(results, load_baseline(args.baseline), args.threshold)
+    if "startup_ms" in results and results["startup_ms"] > STARTUP_BUDGET * 1000:
+        failed.append("startup_ms (over the start-up budget)")
+    if failed:
+        sys.stderr.write("Regressed: " + ", ".join(failed) + "\n")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
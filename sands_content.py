@@ -0,0 +1,61 @@
+# Event content files for Utopian Sands
+# Writes the built-in events out as a JSON file that a running game or
+# server can play instead and reload without restarting (see Live Content
+# in the game), and checks an edited file before it goes live
+
+# Run in terminal command line: python3 sands_content.py export utopian_sands_events.json
+# Check an edited file:         python3 sands_content.py check utopian_sands_events.json
+# Then play it with: python3 utopian_sands_MX.py --content utopian_sands_events.json
+#               or:  python3 sands_server.py --content utopian_sands_events.json
+
+# ===== Imports =====
+
+import argparse
+import json
+import os
+
+import utopian_sands_MX as game
+
+# ===== Export =====
+def export_content(path=game.CONTENT_FILE):
+    """Writes EVENT_TABLE to path as JSON, one indented entry per event"""
+    text = json.dumps(game.EVENT_TABLE, indent=2, ensure_ascii=False)
+    # Written next to the target and renamed over it, so a game reloading
+    # at the same moment never reads half a file
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(text + "\n")
+    os.replace(path + ".tmp", path)
+
+# ===== Check =====
+def check_content(path):
+    """Compiles path the way reload_content() would, returns the graph
+
+    Its changed attribute lists the events that differ from the built-in ones.
+    """
+    return game.load_content(path, game.compile_events(game.EVENT_TABLE))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check Utopian Sands event content files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the built-in events to a JSON file")
+    export.add_argument("path", nargs="?", default=game.CONTENT_FILE)
+    check = commands.add_parser("check", help="compile a content file and list the events it changes")
+    check.add_argument("path", nargs="?", default=game.CONTENT_FILE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_content(args.path)
+        print(f"Wrote {len(game.EVENT_TABLE)} events to {args.path}")
+        return
+    try:
+        graph = check_content(args.path)
+    except (OSError, ValueError) as error:
+        raise SystemExit(str(error))
+    print(f"{args.path}: {len(graph.events)} events, {len(graph.nodes)} choice points")
+    if graph.changed:
+        print("Different from the built-in events: " + ", ".join(f"event {number}" for number in graph.changed))
+    else:
+        print("Same as the built-in events")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# Instrumentation for Utopian Sands
+# Records where a session's time goes (events, typing, waiting on the
+# player, saving and loading) and dumps it as JSON lines or in the
+# Prometheus text format
+
+# Run in terminal command line: python3 sands_metrics.py [--jsonl FILE] [--prometheus FILE] [game flags]
+# (plays the game as usual, with any of its flags, and writes the metrics when it ends)
+
+# ===== Imports =====
+
+import argparse
+import builtins
+import functools
+import json
+import sys
+import time
+
+import utopian_sands_MX as game
+
+# ===== Metrics =====
+class Metrics:
+    """Timings and counters for one session, or many merged together
+
+    timings[name] is [calls, total seconds, longest call in seconds] and
+    counters[name] a running total, like characters rendered.
+    """
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        timing = self.timings.get(name)
+        if timing is None:
+            self.timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        """Adds another Metrics into this one, returns self"""
+        for name, (calls, seconds, longest) in other.timings.items():
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += calls
+            timing[1] += seconds
+            timing[2] = max(timing[2], longest)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        return self
+
+    def snapshot(self):
+        """The metrics as plain data"""
+        return {"timings": {name: {"calls": calls, "seconds": seconds, "max_seconds": longest}
+                            for name, (calls, seconds, longest) in sorted(self.timings.items())},
+                "counters": dict(sorted(self.counters.items()))}
+
+    def json_line(self, **labels):
+        """One JSON object on one line, with labels like session="7" added"""
+        return json.dumps(dict(labels, **self.snapshot()), separators=(",", ":"))
+
+    def prometheus(self, prefix="utopian_sands"):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        timings = sorted(self.timings.items())
+        # Each metric's samples have to follow its own TYPE line
+        for metric, kind, column, layout in (("calls_total", "counter", 0, "{}"),
+                                             ("seconds_total", "counter", 1, "{:.6f}"),
+                                             ("seconds_max", "gauge", 2, "{:.6f}")):
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for name, values in timings:
+                lines.append(f'{prefix}_{metric}{{name="{name}"}} ' + layout.format(values[column]))
+        for name, amount in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {amount}")
+        return "\n".join(lines) + "\n"
+
+# ===== Wrappers =====
+def timed(metrics, name, function):
+    """function, recording each call's wall time under name"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.record(name, time.perf_counter() - start)
+    return wrapper
+
+class CountingStream:
+    """Passes writes and flushes through to a stream, counting them
+
+    render_flushes counts flush() calls, not system calls: a flush with
+    nothing left in the buffer writes nothing, so it's an upper bound on
+    the write() calls the renderer's flushes cost.
+    """
+    def __init__(self, stream, metrics):
+        self.stream = stream
+        self.metrics = metrics
+
+    def write(self, text):
+        self.metrics.count("render_writes")
+        return self.stream.write(text)
+
+    def flush(self):
+        self.metrics.count("render_flushes")
+        return self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+# ===== Instrumenting the Game =====
+# Nothing is wrapped until instrument() is called, so an uninstrumented
+# game runs exactly the code it always did.
+_originals = None
+
+def instrument(metrics):
+    """Wraps the game's events, type_text, show_choices, save_game and load_game"""
+    global _originals
+    if _originals is not None:
+        uninstrument()
+    _originals = {name: getattr(game, name)
+                  for name in ("type_text", "show_choices", "save_game", "load_game")}
+    _originals["EVENTS"] = list(game.EVENTS)
+    _originals["renderer_stream"] = getattr(game.renderer, "stream", None)
+    deciding = [False]
+
+    def type_text(text, delay=0.03):
+        metrics.count("chars_rendered", len(text) + 1)
+        _originals["type_text"](text, delay)
+
+    def show_choices(options):
+        deciding[0] = True
+        try:
+            return _originals["show_choices"](options)
+        finally:
+            deciding[0] = False
+
+    def timed_input(prompt=""):
+        # Only time spent in show_choices is a decision, the rest is menus
+        start = time.perf_counter()
+        try:
+            return builtins.input(prompt)
+        finally:
+            metrics.record("think" if deciding[0] else "input_wait", time.perf_counter() - start)
+
+    game.type_text = timed(metrics, "type_text", type_text)
+    game.show_choices = timed(metrics, "show_choices", show_choices)
+    game.save_game = timed(metrics, "save_game", _originals["save_game"])
+    game.load_game = timed(metrics, "load_game", _originals["load_game"])
+    game.input = timed_input   # shadows the builtin inside the game module
+    for i, event in enumerate(_originals["EVENTS"]):
+        game.EVENTS[i] = timed(metrics, event.__name__, event)
+    if isinstance(game.renderer, game.TextRenderer):
+        game.renderer.stream = CountingStream(game.renderer.stream or sys.stdout, metrics)
+
+def uninstrument():
+    """Puts back everything instrument() wrapped"""
+    global _originals
+    if _originals is None:
+        return
+    for name in ("type_text", "show_choices", "save_game", "load_game"):
+        setattr(game, name, _originals[name])
+    game.EVENTS[:] = _originals["EVENTS"]
+    del game.input
+    if isinstance(game.renderer, game.TextRenderer):
+        game.renderer.stream = _originals["renderer_stream"]
+    _originals = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Utopian Sands and record where the time goes",
+                                     epilog="Any other flags (--fast, --text-speed, --analytics, "
+                                            "--text, --content) are passed on to the game.")
+    parser.add_argument("--jsonl", help="append the session's metrics to this file as a JSON line")
+    parser.add_argument("--prometheus", help="write the metrics to this file in Prometheus text format")
+    args, game_args = parser.parse_known_args()
+    metrics = Metrics()
+    # game.run() picks the renderer, loads text and content and opens the
+    # analytics log, then calls main(); instrumenting there wraps the
+    # renderer it picked. Play again calls the real main() directly.
+    original_main = game.main
+    def instrumented_main():
+        game.main = original_main
+        instrument(metrics)
+        original_main()
+    game.main = instrumented_main
+    try:
+        game.run(game_args)
+    finally:
+        game.main = original_main
+        uninstrument()
+        if args.jsonl:
+            with open(args.jsonl, "a") as file:
+                file.write(metrics.json_line(ended=time.time()) + "\n")
+        if args.prometheus:
+            with open(args.prometheus, "w") as file:
+                file.write(metrics.prometheus())
+        if not args.jsonl and not args.prometheus:
+            sys.stderr.write(metrics.prometheus())
+
+if __name__ == "__main__":
+    main()
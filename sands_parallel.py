@@ -0,0 +1,163 @@
+# Parallel Monte Carlo runner for Utopian Sands
+# Splits lots of headless playthroughs across every core and adds up small
+# per-shard summaries, so balance runs use the whole machine
+
+# Run in terminal command line: python3 sands_parallel.py [number of games] [--workers N]
+
+# ===== Imports =====
+
+import argparse
+import functools
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+import utopian_sands_MX as game
+import sands_agents
+
+# ===== Aggregates =====
+class Aggregate:
+    """Totals over a set of games
+
+    Everything is a whole-number count or sum, so merging is plain addition:
+    the same games give the same totals whatever order or grouping the
+    shards are merged in, and so whatever the number of workers.
+    """
+    def __init__(self):
+        self.games = 0
+        self.endings = Counter()       # alignment name (or "Died") -> games
+        self.deaths = Counter()        # event number -> games that died in it
+        self.reputation = [0] * len(game.FACTIONS)  # final reputation summed over games
+        self.items = Counter()         # item -> games that ended holding one
+        self.mismatches = 0            # finished games whose most common choice isn't their ending
+
+    def add_game(self, player, died_in):
+        """Counts one finished or dead player"""
+        self.games += 1
+        if died_in:
+            self.endings["Died"] += 1
+            self.deaths[died_in] += 1
+        else:
+            alignment, most_common = game.determine_final_alignment(player)
+            self.endings[alignment] += 1
+            # Same test show_ending() uses for its "tendency toward" line
+            if most_common != alignment.lower().replace(" ", "_"):
+                self.mismatches += 1
+        for i, faction in enumerate(game.FACTIONS):
+            self.reputation[i] += player.reputation[faction]
+        self.items.update(set(player.inventory))
+
+    def merge(self, other):
+        """Adds another aggregate's totals into this one, returns self"""
+        self.games += other.games
+        self.endings.update(other.endings)
+        self.deaths.update(other.deaths)
+        self.reputation = [mine + theirs for mine, theirs in zip(self.reputation, other.reputation)]
+        self.items.update(other.items)
+        self.mismatches += other.mismatches
+        return self
+
+    def death_rate(self, number):
+        return self.deaths[number] / self.games
+
+    def mean_reputation(self):
+        return {faction: total / self.games for faction, total in zip(game.FACTIONS, self.reputation)}
+
+    def item_frequency(self, item):
+        return self.items[item] / self.games
+
+    def mismatch_rate(self):
+        """Share of finished games where show_ending() adds the "tendency toward" line"""
+        finished = self.games - self.endings["Died"]
+        return self.mismatches / finished if finished else 0.0
+
+# ===== Shards =====
+def play_game(agent, seed, index):
+    """Plays game number index of a run, returns (player, event it died in or 0)
+
+    The game's rolls and the agent's picks both come from streams derived
+    from (seed, index), so a game plays out the same on any worker.
+    """
+    agent.rng.seed(game.derive_seed(seed, "choices", index))
+    player = game.Player("Stranger", "Utopian Society", game.derive_seed(seed, "game", index))
+    for number, event in enumerate(game.EVENT_GRAPH.events, 1):
+        game.play_event_headless(event, player, agent, game.event_stream(player.seed, number))
+        if player.health <= 0:
+            return player, number
+    return player, 0
+
+def run_shard(shard):
+    """Worker entry point: plays games start..stop-1 and returns their Aggregate"""
+    start, stop, seed, agent_factory = shard
+    agent = agent_factory()
+    aggregate = Aggregate()
+    for index in range(start, stop):
+        aggregate.add_game(*play_game(agent, seed, index))
+    return aggregate
+
+def run(games, seed=None, workers=None, agent_factory=sands_agents.UniformAgent, shard_size=5000):
+    """Plays games across worker processes, returns the merged Aggregate
+
+    agent_factory() makes each worker's agent and has to be picklable (a
+    class, or functools.partial of one). Shards are a fixed size rather than
+    one per worker, so the split is the same however many workers there are.
+    """
+    seed = game.new_seed() if seed is None else seed
+    workers = workers or os.cpu_count()
+    shards = [(start, min(start + shard_size, games), seed, agent_factory)
+              for start in range(0, games, shard_size)]
+    total = Aggregate()
+    if workers == 1:
+        for shard in shards:
+            total.merge(run_shard(shard))
+        return total
+    with multiprocessing.Pool(workers) as pool:
+        for aggregate in pool.imap_unordered(run_shard, shards):
+            total.merge(aggregate)
+    return total
+
+# ===== Report =====
+def report(total, seconds):
+    """Prints an Aggregate as a table"""
+    print(f"{total.games} games in {seconds:.2f}s ({total.games / seconds:,.0f} games/s)")
+    print("\nENDING" + " "*19 + "GAMES" + " "*6 + "SHARE")
+    print("-"*47)
+    for ending in game.ENDING_NAMES + ("Died",):
+        print(f"{ending:<25}{total.endings[ending]:>10}{total.endings[ending] / total.games:>11.3%}")
+    print("\nDeath rate by event:")
+    for number in range(1, len(game.EVENT_GRAPH.events) + 1):
+        print(f"  Event {number}: {total.death_rate(number):.3%}")
+    print("\nMean final reputation:")
+    for faction, mean in total.mean_reputation().items():
+        print(f"  {faction.capitalize()}: {mean:.2f}/100")
+    print("\nGames ending with each item:")
+    for item in sorted(total.items):
+        print(f"  {item}: {total.item_frequency(item):.3%}")
+    print(f"\nMost common choice differs from the ending: {total.mismatch_rate():.3%}")
+
+def agent_from_name(name):
+    """Picklable agent factory from a name: uniform, always:<alignment> or greedy:<ending>"""
+    kind, _, target = name.partition(":")
+    if kind == "uniform":
+        return sands_agents.UniformAgent
+    if kind == "always":
+        return functools.partial(sands_agents.AlignmentAgent, target)
+    if kind == "greedy":
+        return functools.partial(sands_agents.GreedyAgent, target)
+    raise ValueError(f"Unknown agent: {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play lots of Utopian Sands games on every core")
+    parser.add_argument("games", type=int, nargs="?", default=1_000_000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--agent", default="uniform",
+                        help='"uniform", "always:<alignment>" or "greedy:<ending>"')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    total = run(args.games, args.seed, args.workers, agent_from_name(args.agent))
+    report(total, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
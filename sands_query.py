@@ -0,0 +1,512 @@
+# Query engine for Utopian Sands choice logs
+# Turns analytics files (see game.AnalyticsSink) into a folder of column
+# files that are memory-mapped rather than loaded, with bitmap indexes of
+# which games picked each option and reached each ending, for answering
+# questions like "what share of players who picked House 2 in event 4 ended
+# up THE VILLAIN?" over a hundred million choices in well under a second
+
+# Run in terminal command line: python3 sands_query.py build game_analytics.col --out playthroughs [--content FILE]
+# Then for example:  python3 sands_query.py share playthroughs --of "chose 4:2" --where "ended THE VILLAIN"
+#                    python3 sands_query.py stat playthroughs guilt --event 6 --by ending
+
+# ===== Imports =====
+
+import argparse
+import json
+import mmap
+import os
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("sands_query.py needs NumPy (pip install numpy)") from None
+
+import utopian_sands_MX as game
+
+# ===== Store Layout =====
+# A store folder holds:
+#   meta.json           row and game counts, where each choice point's rows start,
+#                       the checksum of the events they were played on
+#   rows.<column>.bin   one value per logged choice, sorted by choice point
+#                       (so an event's rows are one slice), for the columns in
+#                       ROW_COLUMNS; "session" is the game's number in the store
+#   games.<column>.bin  one value per game, its state after its last choice
+#   choices.bits        bitmap of the games that picked each option at each
+#                       choice point, [node][option - 1]
+#   endings.bits        bitmap of the games with each of ENDING_GROUPS
+# Bitmaps hold one bit per game, 8 games to a byte, lowest bit first.
+ENDING_GROUPS = game.ENDING_NAMES + ("Died", "Unfinished")
+DIED = ENDING_GROUPS.index("Died")
+UNFINISHED = ENDING_GROUPS.index("Unfinished")
+
+ROW_COLUMNS = {"session": "<u4", "option": "u1", "think": "<f4",
+               "law_chaos": "i1", "good_evil": "i1", "authorities": "u1",
+               "citizens": "u1", "underworld": "u1", "health": "<i2", "guilt": "<i2"}
+GAME_COLUMNS = {"seed": "<u8", "ending": "u1", "event": "u1", "node": "<u2", "option": "u1",
+                "law_chaos": "i1", "good_evil": "i1", "authorities": "u1",
+                "citizens": "u1", "underworld": "u1", "health": "<i2", "guilt": "<i2"}
+STATE_COLUMNS = ("law_chaos", "good_evil", "authorities", "citizens", "underworld", "health", "guilt")
+
+# game.ENDING_TABLE as a 201 x 201 array, indexed [law_chaos + 100, good_evil + 100]
+ENDING_GRID = np.frombuffer(game.ENDING_TABLE, np.int8).reshape(201, 201)
+
+# ===== Reading Logs =====
+def log_chunks(paths, chunk_rows=4_000_000):
+    """{column: array} for the rows of some analytics files, a few million at a time
+
+    The files are memory-mapped and each chunk is cut straight out of the
+    blocks, so memory use stays at one chunk however big the logs are.
+    """
+    for path in paths:
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            layout, _ = game.analytics_layout(data)
+            dtypes = [(name, np.dtype("<" + typecode)) for name, typecode in layout]
+            missing = {"health", "guilt"} - {name for name, _ in layout}   # version 1 logs
+            pending, size = [], 0
+            for offset, rows in game.analytics_blocks(data):
+                block = {}
+                for name, dtype in dtypes:
+                    block[name] = np.frombuffer(data, dtype, rows, offset)
+                    offset += rows * dtype.itemsize
+                pending.append(block)
+                size += rows
+                if size >= chunk_rows:
+                    yield join_blocks(pending, missing)
+                    pending, size = [], 0
+            if pending:
+                yield join_blocks(pending, missing)
+            pending = block = None   # views into the map, which can't close while they're alive
+
+def join_blocks(blocks, missing):
+    chunk = {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]}
+    rows = len(chunk["node"])
+    if "health" in missing:
+        chunk["health"] = np.full(rows, 100, np.int16)   # unknown, counted as alive
+    if "guilt" in missing:
+        chunk["guilt"] = np.zeros(rows, np.int16)
+    return chunk
+
+def on_graph(chunk, graph):
+    """(chunk, rows left out) keeping only the rows logged on graph's events
+
+    Logs from before analytics version 3 don't record the graph, so all
+    their rows are kept.
+    """
+    if "graph" not in chunk:
+        return chunk, 0
+    keep = chunk["graph"] == graph.checksum
+    left_out = len(keep) - int(np.count_nonzero(keep))
+    if left_out:
+        chunk = {name: values[keep] for name, values in chunk.items()}
+    return chunk, left_out
+
+# ===== Building =====
+def outcome_goes_on(outcome):
+    """True if an outcome (or any branch of it) leads to another choice point"""
+    if outcome.then:
+        return True
+    for branches in (outcome.chance and outcome.chance[1:], outcome.spend and outcome.spend[1:],
+                     outcome.if_reputation and outcome.if_reputation[2:]):
+        if branches and any(outcome_goes_on(branch) for branch in branches):
+            return True
+    return False
+
+def build_store(paths, folder, graph=None, chunk_rows=4_000_000):
+    """Builds a store folder from analytics files, returns its meta dict
+
+    Two passes over the logs: the first finds every game and how many rows
+    each choice point has, the second writes the rows sorted by choice point
+    and keeps each game's last state. Then the bitmaps are made from the
+    sorted rows. Rows logged on other events than graph's are left out.
+    """
+    graph = graph or game.EVENT_GRAPH
+    os.makedirs(folder, exist_ok=True)
+    node_count = len(graph.nodes)
+
+    # First pass: the games (by seed) and rows per choice point
+    seeds = []
+    per_node = np.zeros(node_count, np.int64)
+    left_out = 0
+    for chunk in log_chunks(paths, chunk_rows):
+        chunk, skipped = on_graph(chunk, graph)
+        left_out += skipped
+        seeds.append(distinct(chunk["session"]))
+        per_node += np.bincount(chunk["node"], minlength=node_count)
+    seeds = distinct(np.concatenate(seeds)) if seeds else np.zeros(0, np.uint64)
+    rows = int(per_node.sum())
+    node_offsets = np.concatenate([[0], np.cumsum(per_node)])
+
+    # Second pass: rows sorted by choice point, and each game's last row
+    out = {name: open_column(folder, "rows", name, dtype, rows, "w+")
+           for name, dtype in ROW_COLUMNS.items()}
+    games = {name: np.zeros(len(seeds), dtype) for name, dtype in GAME_COLUMNS.items()}
+    games["seed"][:] = seeds
+    cursor = node_offsets[:-1].copy()
+    for chunk in log_chunks(paths, chunk_rows):
+        chunk, _ = on_graph(chunk, graph)
+        chunk["session"] = np.searchsorted(seeds, chunk["session"]).astype(np.uint32)
+        order = np.argsort(chunk["node"], kind="stable")
+        counts = np.bincount(chunk["node"], minlength=node_count)
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        for name in ROW_COLUMNS:
+            values = chunk[name][order]
+            for node in np.flatnonzero(counts):
+                out[name][cursor[node]:cursor[node] + counts[node]] = values[starts[node]:starts[node + 1]]
+        cursor += counts
+        # Last row of each game in this chunk, found as the first in reverse
+        sessions, first = np.unique(chunk["session"][::-1], return_index=True)
+        last = len(chunk["session"]) - 1 - first
+        for name in ("event", "node", "option") + STATE_COLUMNS:
+            games[name][sessions] = chunk[name][last]
+    for column in out.values():
+        column.flush()
+
+    # A game finished if its last choice was in the last event and led nowhere further
+    goes_on = np.zeros((node_count, 256), bool)
+    for node in graph.nodes:
+        for option, outcome in enumerate(node.outcomes, 1):
+            goes_on[node.index, option] = outcome_goes_on(outcome)
+    finished = (games["event"] == len(graph.events)) & ~goes_on[games["node"], games["option"]]
+    endings = np.where(finished, ENDING_GRID[games["law_chaos"].astype(np.intp) + 100,
+                                             games["good_evil"].astype(np.intp) + 100], UNFINISHED)
+    games["ending"][:] = np.where(games["health"] <= 0, DIED, endings)
+    for name, values in games.items():
+        open_column(folder, "games", name, GAME_COLUMNS[name], len(seeds), "w+")[:] = values
+
+    # Bitmaps: which games picked each option, and which reached each ending
+    max_options = max(len(node.choices) for node in graph.nodes)
+    bitmap_bytes = (len(seeds) + 7) // 8
+    choice_bits = np.zeros((node_count, max_options, bitmap_bytes), np.uint8)
+    for node in graph.nodes:
+        start, stop = node_offsets[node.index], node_offsets[node.index + 1]
+        sessions, options = out["session"][start:stop], out["option"][start:stop]
+        for option in range(1, len(node.choices) + 1):
+            choice_bits[node.index, option - 1] = bitmap_of(sessions[options == option], len(seeds))
+    choice_bits.tofile(os.path.join(folder, "choices.bits"))
+    np.stack([bitmap_of(np.flatnonzero(games["ending"] == i), len(seeds))
+              for i in range(len(ENDING_GROUPS))]).tofile(os.path.join(folder, "endings.bits"))
+
+    meta = {"rows": rows, "games": len(seeds), "max_options": max_options,
+            "graph": graph.checksum, "left_out": left_out,
+            "node_offsets": node_offsets.tolist(),
+            "node_events": [node.event for node in graph.nodes],
+            "node_options": [len(node.choices) for node in graph.nodes],
+            "sources": [os.path.abspath(path) for path in paths]}
+    with open(os.path.join(folder, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=2)
+    return meta
+
+def distinct(values):
+    """Sorted distinct values (np.unique, but sorting is quicker than its hashing here)"""
+    values = np.sort(values)
+    keep = np.ones(len(values), bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+def open_column(folder, table, name, dtype, length, mode="r"):
+    """Memory-maps one column file of a store"""
+    path = os.path.join(folder, f"{table}.{name}.bin")
+    if length == 0:
+        if mode == "w+":
+            open(path, "wb").close()
+        return np.zeros(0, dtype)   # mmap can't map an empty file
+    return np.memmap(path, dtype, mode, shape=(length,))
+
+def bitmap_of(indexes, size):
+    """Packed bitmap with the bits at indexes set"""
+    flags = np.zeros(size, bool)
+    flags[indexes] = True
+    return np.packbits(flags, bitorder="little")
+
+# ===== Bitmaps =====
+class Bitmap:
+    """A set of games, one bit each; combine with &, | and ~"""
+    __slots__ = ("bits", "size")
+
+    def __init__(self, bits, size):
+        self.bits = bits
+        self.size = size
+
+    def __and__(self, other):
+        return Bitmap(self.bits & other.bits, self.size)
+
+    def __or__(self, other):
+        return Bitmap(self.bits | other.bits, self.size)
+
+    def __invert__(self):
+        bits = ~self.bits
+        if self.size % 8:
+            bits[-1] &= (1 << (self.size % 8)) - 1   # no games past the end
+        return Bitmap(bits, self.size)
+
+    def count(self):
+        return int(np.bitwise_count(self.bits).sum(dtype=np.int64))
+
+    def flags(self):
+        """One bool per game"""
+        return np.unpackbits(self.bits, count=self.size, bitorder="little").view(bool)
+
+    def __len__(self):
+        return self.count()
+
+# ===== Queries =====
+class Store:
+    """A store folder, memory-mapped
+
+    Nothing is read until a query touches it, and then only the columns
+    and the slices of rows it needs.
+    """
+    def __init__(self, folder):
+        with open(os.path.join(folder, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.games_count = self.meta["games"]
+        self.node_offsets = self.meta["node_offsets"]
+        self.node_events = self.meta["node_events"]
+        self.rows = {name: open_column(folder, "rows", name, dtype, self.meta["rows"])
+                     for name, dtype in ROW_COLUMNS.items()}
+        self.games = {name: open_column(folder, "games", name, dtype, self.games_count)
+                      for name, dtype in GAME_COLUMNS.items()}
+        bitmap_bytes = (self.games_count + 7) // 8
+        shape = (len(self.node_events), self.meta["max_options"], bitmap_bytes)
+        self.choice_bits = self.map_bits(folder, "choices.bits", shape)
+        self.ending_bits = self.map_bits(folder, "endings.bits", (len(ENDING_GROUPS), bitmap_bytes))
+
+    @staticmethod
+    def map_bits(folder, name, shape):
+        if 0 in shape:
+            return np.zeros(shape, np.uint8)
+        return np.memmap(os.path.join(folder, name), np.uint8, "r", shape=shape)
+
+    # Sets of games
+    def everyone(self):
+        return ~Bitmap(np.zeros((self.games_count + 7) // 8, np.uint8), self.games_count)
+
+    def event_nodes(self, event):
+        """Choice point indexes in one event, the event's first choice first"""
+        return [index for index, number in enumerate(self.node_events) if number == event]
+
+    def chose(self, event, option, node=None):
+        """Games that picked option at an event's first choice point (or at node)"""
+        node = self.event_nodes(event)[0] if node is None else node
+        return Bitmap(self.choice_bits[node, option - 1], self.games_count)
+
+    def ended(self, ending):
+        """Games with an ending, by name ("Neutral Evil"), title ("THE VILLAIN"), "Died" or "Unfinished" """
+        for name, title in game.ALIGNMENT_TITLES.items():
+            if ending.upper() in (title.upper(), title.split(":")[0].upper()):
+                ending = name
+        matches = [i for i, name in enumerate(ENDING_GROUPS) if name.lower() == ending.lower()]
+        if not matches:
+            raise ValueError(f"Unknown ending: {ending}")
+        return Bitmap(self.ending_bits[matches[0]], self.games_count)
+
+    def where(self, column, low=None, high=None):
+        """Games whose final value of column is within low..high (either end optional)"""
+        values = self.games[column]
+        flags = np.ones(self.games_count, bool)
+        if low is not None:
+            flags &= values >= low
+        if high is not None:
+            flags &= values <= high
+        return Bitmap(np.packbits(flags, bitorder="little"), self.games_count)
+
+    def share(self, where, of=None):
+        """Fraction of the games in of (everyone by default) that are also in where"""
+        of = of or self.everyone()
+        total = of.count()
+        return (where & of).count() / total if total else 0.0
+
+    def count_by_ending(self, where=None):
+        """{ending group: games}, of the games in where"""
+        counts = {}
+        for i, name in enumerate(ENDING_GROUPS):
+            bitmap = Bitmap(self.ending_bits[i], self.games_count)
+            counts[name] = (bitmap & where).count() if where is not None else bitmap.count()
+        return counts
+
+    # Values of logged choices
+    def row_range(self, event=None, node=None):
+        """The slice of rows for one choice point, one event or everything"""
+        if node is not None:
+            return slice(self.node_offsets[node], self.node_offsets[node + 1])
+        if event is not None:
+            nodes = self.event_nodes(event)
+            return slice(self.node_offsets[nodes[0]], self.node_offsets[nodes[-1] + 1])
+        return slice(0, self.node_offsets[-1])
+
+    def values(self, column, event=None, node=None, where=None):
+        """Values of a row column for the choices at an event or choice point, by games in where"""
+        rows = self.row_range(event, node)
+        values = self.rows[column][rows]
+        if where is not None:
+            values = values[where.flags()[self.rows["session"][rows]]]
+        return values
+
+    def group_keys(self, by, rows, where_rows=None):
+        """(group number per row, group names) for grouping rows"""
+        if by == "ending":
+            keys = self.games["ending"][self.rows["session"][rows]]
+            names = ENDING_GROUPS
+        elif by == "option":
+            keys = self.rows["option"][rows]
+            names = [str(option) for option in range(256)]
+        elif by in game.FACTIONS:
+            keys = np.frombuffer(game.REPUTATION_BAND_TABLE, np.uint8)[self.rows[by][rows]]
+            names = [name for _, name in game.REPUTATION_BANDS]
+        elif by in ("law_chaos", "good_evil"):
+            values = self.rows[by][rows]
+            keys = (values > -34).astype(np.uint8) + (values > 33)
+            names = game.LAW_BAND_NAMES if by == "law_chaos" else game.GOOD_BAND_NAMES
+        else:
+            raise ValueError(f"Can't group by {by}")
+        if where_rows is not None:
+            keys = keys[where_rows]
+        return keys, names
+
+    def stat(self, column, stat="median", event=None, node=None, where=None, by=None):
+        """{group: stat of column} over the choices at an event or choice point
+
+        stat is count, mean, median, min, max or pNN (a percentile). by
+        groups rows by the game's ending, the option picked, a faction's
+        reputation band or an axis band; without it there's one group, "all".
+        """
+        rows = self.row_range(event, node)
+        where_rows = None if where is None else where.flags()[self.rows["session"][rows]]
+        values = self.rows[column][rows]
+        if where_rows is not None:
+            values = values[where_rows]
+        if by is None:
+            return {"all": summarise(values, stat)} if len(values) else {}
+        keys, names = self.group_keys(by, rows, where_rows)
+        return {names[key]: value for key, value in grouped(values, keys, stat).items()}
+
+def summarise(values, stat):
+    if stat == "count":
+        return len(values)
+    if stat == "mean":
+        return float(values.mean(dtype=np.float64))
+    # Interpolating in the column's own type overflows the int8 axes
+    # (halfway between -100 and 100 comes out as 128), so work in float64
+    if stat == "median":
+        return float(np.median(values.astype(np.float64)))
+    if stat == "min":
+        return values.min().item()
+    if stat == "max":
+        return values.max().item()
+    if re.fullmatch(r"p\d+(\.\d+)?", stat):
+        return float(np.percentile(values.astype(np.float64), float(stat[1:])))
+    raise ValueError(f"Unknown stat: {stat}")
+
+def grouped(values, keys, stat):
+    """{key: stat of the values with that key}, in one pass where possible
+
+    Counts and means come from bincount. Medians and percentiles of the
+    small integer columns come from a histogram per group, which gives the
+    same answer as np.percentile without sorting anything. Anything else
+    falls back to picking out each group's values.
+    """
+    counts = np.bincount(keys)
+    present = np.flatnonzero(counts)
+    if stat == "count":
+        return {key: int(counts[key]) for key in present}
+    if stat == "mean":
+        sums = np.bincount(keys, weights=values)
+        return {key: float(sums[key] / counts[key]) for key in present}
+    percent = 50.0 if stat == "median" else None
+    if re.fullmatch(r"p\d+(\.\d+)?", stat):
+        percent = float(stat[1:])
+    if percent is not None and values.dtype.kind in "iu" and len(values):
+        low = int(values.min())
+        span = int(values.max()) - low + 1
+        if span * len(counts) <= 1 << 24:
+            histogram = np.bincount(keys.astype(np.int64) * span + values - low,
+                                    minlength=len(counts) * span).reshape(len(counts), span)
+            return {key: low + histogram_percentile(histogram[key], percent) for key in present}
+    return {key: summarise(values[keys == key], stat) for key in present}
+
+def histogram_percentile(histogram, percent):
+    """Percentile of the values counted in histogram (histogram[i] values equal to i), as np.percentile works it out"""
+    cumulative = np.cumsum(histogram)
+    rank = percent / 100 * (cumulative[-1] - 1)
+    below = int(np.searchsorted(cumulative, np.floor(rank), side="right"))
+    above = int(np.searchsorted(cumulative, np.ceil(rank), side="right"))
+    return float(below + (above - below) * (rank - np.floor(rank)))
+
+# ===== Filters =====
+FILTER = re.compile(r"(chose) (\d+):(\d+)(?:@(\d+))?|(ended) (.+)|(\w+) *(>=|<=|>|<|=) *(-?\d+)")
+
+def parse_filter(store, text):
+    """Bitmap for a filter written like "chose 4:2", "chose 4:1@4", "ended THE VILLAIN" or "authorities>60" """
+    match = FILTER.fullmatch(text.strip())
+    if not match:
+        raise ValueError(f"Can't read filter: {text}")
+    if match.group(1):
+        node = None if match.group(4) is None else int(match.group(4))
+        return store.chose(int(match.group(2)), int(match.group(3)), node)
+    if match.group(5):
+        return store.ended(match.group(6))
+    column, operator, value = match.group(7), match.group(8), int(match.group(9))
+    low, high = {">=": (value, None), ">": (value + 1, None), "<=": (None, value),
+                 "<": (None, value - 1), "=": (value, value)}[operator]
+    return store.where(column, low, high)
+
+def parse_filters(store, texts):
+    """The games matching every filter in texts (everyone if there are none)"""
+    bitmap = store.everyone()
+    for text in texts:
+        bitmap = bitmap & parse_filter(store, text)
+    return bitmap
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query stores of Utopian Sands choice logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="make a store folder from analytics files")
+    build.add_argument("logs", nargs="+")
+    build.add_argument("--out", required=True)
+    build.add_argument("--content", help="the content file the games were played on (default: the built-in events)")
+    share = commands.add_parser("share", help="share of games matching --of that also match --where")
+    share.add_argument("store")
+    share.add_argument("--of", action="append", default=[])
+    share.add_argument("--where", action="append", default=[])
+    count = commands.add_parser("endings", help="games per ending, of those matching --where")
+    count.add_argument("store")
+    count.add_argument("--where", action="append", default=[])
+    stat = commands.add_parser("stat", help="a statistic of a logged column, optionally grouped")
+    stat.add_argument("store")
+    stat.add_argument("column", choices=[name for name in ROW_COLUMNS if name != "session"])
+    stat.add_argument("--stat", default="median", help="count, mean, median, min, max or pNN")
+    stat.add_argument("--event", type=int)
+    stat.add_argument("--node", type=int)
+    stat.add_argument("--by", help="ending, option, a faction or an axis")
+    stat.add_argument("--where", action="append", default=[])
+    args = parser.parse_args()
+
+    if args.command == "build":
+        graph = game.event_graph()
+        if args.content:
+            try:
+                graph = game.load_content(args.content, graph)
+            except (OSError, ValueError) as error:
+                build.error(str(error))
+        meta = build_store(args.logs, args.out, graph)
+        print(f"{meta['rows']} choices from {meta['games']} games written to {args.out}")
+        if meta["left_out"]:
+            print(f"({meta['left_out']} choices logged on other event content left out)")
+        return
+    store = Store(args.store)
+    if args.command == "share":
+        of, where = parse_filters(store, args.of), parse_filters(store, args.where)
+        print(f"{store.share(where, of):.4%} of {of.count()} games")
+    elif args.command == "endings":
+        where = parse_filters(store, args.where) if args.where else None
+        for name, games in store.count_by_ending(where).items():
+            print(f"{name:<20}{games:>12}")
+    else:
+        where = parse_filters(store, args.where) if args.where else None
+        results = store.stat(args.column, args.stat, args.event, args.node, where, args.by)
+        for group, value in results.items():
+            print(f"{group:<20}{value:>14.3f}" if isinstance(value, float) else f"{group:<20}{value:>14}")
+
+if __name__ == "__main__":
+    main()
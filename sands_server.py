@@ -0,0 +1,331 @@
+# Multiplayer server for Utopian Sands
+# Lets lots of people play at once over telnet/netcat, every session
+# running as a coroutine on one asyncio event loop
+
+# Run in terminal command line: python3 sands_server.py --port 4000
+# Then connect with: telnet localhost 4000   (or nc localhost 4000)
+# Add --metrics-port 9100 for Prometheus and --metrics-log FILE for a JSON
+# line of timings per finished session, and --analytics FILE to log every
+# choice (see game.AnalyticsSink). With --content FILE the events come from
+# a content file (see sands_content.py) that is reloaded whenever it
+# changes; games already going finish on the events they started with.
+# --text FILE reads the narration from a string table (see sands_strings.py),
+# shared with every other server process on the machine using the same file.
+
+# ===== Imports =====
+
+import argparse
+import asyncio
+import time
+
+import utopian_sands_MX as game
+from sands_metrics import Metrics
+
+# ===== Sessions =====
+class SessionClosed(Exception):
+    """The player disconnected"""
+
+class Session:
+    """One player's game, talking over a stream reader/writer pair
+
+    Has its own Player, whose seed gives every event its own random stream,
+    and types text with asyncio.sleep() so a slow typing effect never holds
+    up other sessions. With a seed, every game in the session is repeatable.
+    With a Metrics it also records where the session's time goes, and with
+    an AnalyticsSink it logs every choice.
+    """
+    def __init__(self, reader, writer, delay=0.03, frame=0.05, seed=None, metrics=None,
+                 analytics=None):
+        self.reader = reader
+        self.writer = writer
+        self.delay = delay      # seconds per character, 0 for no typing effect
+        self.frame = frame      # seconds between writes while typing
+        self.seed = seed
+        self.games = 0
+        self.player = None
+        self.metrics = metrics
+        self.analytics = analytics
+        self.think_time = 0.0   # seconds the last show_choices() answer took
+
+    async def type_text(self, text):
+        """Types a line to the player a frame at a time"""
+        text = (text + "\n").replace("\n", "\r\n")
+        if self.metrics is not None:
+            start = time.perf_counter()
+            self.metrics.count("chars_rendered", len(text))
+        if self.delay <= 0:
+            self.write(text)
+            await self.writer.drain()
+        else:
+            loop = asyncio.get_running_loop()
+            per_frame = max(1, int(self.frame / self.delay))
+            frame_start = loop.time()
+            for i in range(0, len(text), per_frame):
+                self.write(text[i:i + per_frame])
+                await self.writer.drain()
+                await asyncio.sleep(max(0, frame_start + (i + per_frame) * self.delay - loop.time()))
+        if self.metrics is not None:
+            self.metrics.record("type_text", time.perf_counter() - start)
+
+    def write(self, text):
+        """Sends text to the player, one socket write each time"""
+        if self.metrics is not None:
+            self.metrics.count("socket_writes")
+        self.writer.write(text.encode())
+
+    async def ask(self, prompt, waiting="input_wait"):
+        """Shows a prompt and waits for the player's next line
+
+        With metrics, the wait is recorded under waiting ("think" at a choice).
+        """
+        self.write(prompt.replace("\n", "\r\n"))
+        await self.writer.drain()
+        if self.metrics is not None:
+            start = time.perf_counter()
+        line = await self.reader.readline()
+        if self.metrics is not None:
+            self.metrics.record(waiting, time.perf_counter() - start)
+        if not line:
+            raise SessionClosed()
+        return line.decode(errors="replace").strip()
+
+    async def show_choices(self, options):
+        """Same as game.show_choices(), without blocking the event loop"""
+        if self.metrics is not None:
+            start = time.perf_counter()
+        for line in game.choice_lines(options):
+            await self.type_text(line)
+        shown = time.perf_counter()
+        while True:
+            answer = await self.ask(game.choice_prompt(options), "think")
+            choice, problem = game.parse_choice(answer, options)
+            if problem is None:
+                self.think_time = time.perf_counter() - shown
+                if self.metrics is not None:
+                    self.metrics.record("show_choices", time.perf_counter() - start)
+                return choice
+            await self.type_text(problem)
+
+    def game_seed(self):
+        """Seed for the session's next game, None for a fresh random one"""
+        self.games += 1
+        if self.seed is None:
+            return None
+        return game.derive_seed(self.seed, "game", self.games)
+
+    async def play_event(self, node, number):
+        """Plays one compiled event the same way game.play_event() does"""
+        rng = game.event_stream(self.player.seed, number)
+        steps = game.play_steps(node, self.player, rng, self.analytics)
+        answer = None
+        try:
+            while True:
+                step = steps.send(answer)
+                if isinstance(step, str):
+                    await self.type_text(step)
+                    answer = None
+                else:
+                    answer = (await self.show_choices(step.choices), self.think_time)
+        except StopIteration:
+            pass
+        for line in game.stats_lines(self.player):
+            await self.type_text(line)
+
+    async def play(self):
+        """Runs a whole game from the title screen to the ending"""
+        for line in game.TITLE_LINES:
+            await self.type_text(line)
+        while True:
+            name = await self.ask("\nEnter your name: ") or "Stranger"
+            self.player = game.Player(name, "Utopian Society", self.game_seed())
+            changes = []
+            tracker = game.track(self.player)
+            tracker.subscribe(changes.append)
+            if self.metrics is not None:
+                tracker.subscribe(lambda change: self.metrics.count("changes_" + change.kind))
+            for line in game.character_creation_lines(name):
+                await self.type_text(line)
+            await self.ask("\nPress Enter to begin your journey...")
+
+            # Pinned for the whole game, content reloads only reach new games
+            self.player.graph = game.event_graph()
+            events = self.player.graph.events
+            for number, event in enumerate(events, 1):
+                await self.type_text(f"\n[Event {number} of {len(events)}]")
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                await self.play_event(event, number)
+                if self.metrics is not None:
+                    self.metrics.record(f"event_{number}", time.perf_counter() - start)
+                for line in game.change_lines(changes):
+                    await self.type_text(line)
+                changes.clear()
+                if self.player.health <= 0:
+                    for line in game.GAME_OVER_LINES:
+                        await self.type_text(line)
+                    break
+            else:
+                alignment, most_common = game.determine_final_alignment(self.player)
+                for line in game.ending_lines(self.player, alignment, most_common):
+                    await self.type_text(line)
+
+            await self.type_text("\nPlay again to explore different alignments!")
+            if (await self.ask("Play again? (y/n): ")).lower() != "y":
+                await self.type_text("\nGoodbye.")
+                return
+
+# ===== Server =====
+class GameServer:
+    """Accepts connections and runs a Session for each one
+
+    With metrics on, each session records its own Metrics, which are added
+    into the server's totals (and written to metrics_log) when it ends.
+    """
+    def __init__(self, delay=0.03, frame=0.05, metrics=False, metrics_log=None, analytics=None,
+                 content=None, reload_every=2.0):
+        self.delay = delay
+        self.frame = frame
+        self.sessions = set()
+        self.analytics = analytics   # AnalyticsSink shared by every session
+        self.metrics = Metrics() if metrics or metrics_log else None
+        self.metrics_log = metrics_log
+        self.session_count = 0
+        self.content = content            # content file to watch, if any
+        self.reload_every = reload_every  # seconds between checks of it
+
+    async def handle(self, reader, writer):
+        self.session_count += 1
+        number = self.session_count
+        metrics = None if self.metrics is None else Metrics()
+        session = Session(reader, writer, self.delay, self.frame, metrics=metrics,
+                          analytics=self.analytics)
+        self.sessions.add(session)
+        start = time.perf_counter()
+        try:
+            await session.play()
+        except (SessionClosed, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            if metrics is not None:
+                metrics.record("session", time.perf_counter() - start)
+                self.metrics.merge(metrics)
+                if self.metrics_log:
+                    with open(self.metrics_log, "a") as file:
+                        file.write(metrics.json_line(session=number, games=session.games,
+                                                     ended=time.time()) + "\n")
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def prometheus(self):
+        """The server's totals in Prometheus text format, with live session counts"""
+        return (self.metrics.prometheus()
+                + "# TYPE utopian_sands_sessions_active gauge\n"
+                + f"utopian_sands_sessions_active {len(self.sessions)}\n"
+                + "# TYPE utopian_sands_sessions_started_total counter\n"
+                + f"utopian_sands_sessions_started_total {self.session_count}\n"
+                + "# TYPE utopian_sands_content_version gauge\n"
+                + f"utopian_sands_content_version {game.event_graph().version}\n")
+
+    async def handle_scrape(self, reader, writer):
+        """Answers any HTTP request with prometheus()"""
+        try:
+            while (await reader.readline()).strip():
+                pass   # the request line and headers don't matter
+            body = self.prometheus().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve_metrics(self, host, port):
+        server = await asyncio.start_server(self.handle_scrape, host, port)
+        print(f"Metrics on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def watch_content(self):
+        """Reloads the content file whenever it changes
+
+        The file is read and compiled on a worker thread, so sessions keep
+        playing while it happens, and goes live in one assignment.
+        """
+        loop = asyncio.get_running_loop()
+        problem = None
+        while True:
+            await asyncio.sleep(self.reload_every)
+            try:
+                graph = await loop.run_in_executor(None, game.reload_content, self.content)
+            except (OSError, ValueError) as error:
+                if str(error) != problem:   # say so once, not every check
+                    problem = str(error)
+                    print(f"Still on event content version {game.event_graph().version}: {error}")
+                continue
+            problem = None
+            if graph is not None:
+                print(f"Event content version {graph.version} live, recompiled events "
+                      + ", ".join(str(number) for number in graph.changed))
+
+    async def serve(self, host, port, backlog=1024):
+        # A deep accept queue so a classroom connecting at once isn't left hanging
+        server = await asyncio.start_server(self.handle, host, port, backlog=backlog)
+        names = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Utopian Sands server listening on {names}")
+        async with server:
+            await server.serve_forever()
+
+    async def serve_all(self, host, port, metrics_port=None):
+        """serve(), plus the metrics endpoint and content reloads if they're wanted"""
+        tasks = [self.serve(host, port)]
+        if metrics_port is not None:
+            tasks.append(self.serve_metrics(host, metrics_port))
+        if self.content is not None:
+            tasks.append(self.watch_content())
+        await asyncio.gather(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Utopian Sands for many players")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--delay", type=float, default=0.03,
+                        help="seconds per typed character, 0 turns the typing effect off")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port")
+    parser.add_argument("--metrics-log", help="append one JSON line of metrics per finished session")
+    parser.add_argument("--analytics", help="log every choice to this columnar file")
+    parser.add_argument("--content", help="play the events in this content file, reloading it when it changes")
+    parser.add_argument("--reload-every", type=float, default=2.0,
+                        help="seconds between checks of the content file")
+    parser.add_argument("--text", help="read the narration from this string table")
+    args = parser.parse_args()
+    if args.text:
+        try:
+            game.load_strings(args.text)   # before the events are compiled, so they use it
+        except (OSError, game.StringTableError) as error:
+            parser.error(str(error))
+    if args.content:
+        # A bad file stops the server here, before anyone connects
+        try:
+            game.reload_content(args.content)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    analytics = game.AnalyticsSink(args.analytics) if args.analytics else None
+    server = GameServer(args.delay, metrics=args.metrics_port is not None, metrics_log=args.metrics_log,
+                        analytics=analytics, content=args.content, reload_every=args.reload_every)
+    try:
+        asyncio.run(server.serve_all(args.host, args.port, args.metrics_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if analytics is not None:
+            analytics.close()
+
+if __name__ == "__main__":
+    main()
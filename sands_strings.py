@@ -0,0 +1,127 @@
+# String tables for Utopian Sands
+# Builds the memory-mapped narration file the game and server read their
+# text from (see String Table in the game), so many processes on one
+# machine share one copy of it, and turns translations into tables with
+# the same ids
+
+# Run in terminal command line: python3 sands_strings.py build [--content utopian_sands_events.json]
+# Start a translation:          python3 sands_strings.py template french.json
+# Build it once filled in:      python3 sands_strings.py pack french.json --language fr
+# Then play it with: python3 utopian_sands_MX.py --text utopian_sands_text.fr.bin
+#               or:  python3 sands_server.py --text utopian_sands_text.fr.bin
+
+# ===== Imports =====
+
+import argparse
+import json
+import os
+
+import utopian_sands_MX as game
+
+# ===== Building =====
+def event_table(content=None):
+    """The events a table is built from: a content file's, or the built-in ones"""
+    if content is None:
+        return game.EVENT_TABLE
+    with open(content, encoding="utf-8") as file:
+        return json.load(file)
+
+def write_table(path, data):
+    """Writes a table next to path and renames it over, so mapped copies stay whole"""
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+
+def build_table(path=game.STRINGS_FILE, content=None):
+    """Writes the English string table for the events, returns how many strings it has"""
+    lines = list(game.string_ids(event_table(content)))
+    write_table(path, game.pack_string_table(lines))
+    return len(lines)
+
+# ===== Translations =====
+def write_template(path, content=None):
+    """Writes a JSON file listing every string, with an empty translation to fill in"""
+    lines = list(game.string_ids(event_table(content)))
+    document = {"language": "",
+                "strings": [{"id": number, "en": line, "text": ""} for number, line in enumerate(lines)]}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(document, file, indent=2, ensure_ascii=False)
+        file.write("\n")
+    return len(lines)
+
+def pack_translation(path, out, language, content=None):
+    """Builds a translated table from a filled in template, returns (strings, untranslated)
+
+    Strings are matched on their English text, so a template made before
+    the events changed still fills in whatever is the same. Anything left
+    empty or missing stays in English.
+    """
+    with open(path, encoding="utf-8") as file:
+        document = json.load(file)
+    translated = {entry["en"]: entry["text"] for entry in document["strings"] if entry.get("text")}
+    english = list(game.string_ids(event_table(content)))
+    lines = [translated.get(line, line) for line in english]
+    # The English checksums, so the game uses it exactly where it would the English table
+    data = game.pack_string_table(lines, language or document.get("language") or "en",
+                                  game.text_checksum(english[:len(game.ENDING_NAMES) * 2]),
+                                  game.text_checksum(english))
+    write_table(out, data)
+    return len(lines), sum(line not in translated for line in english)
+
+# ===== Show =====
+def describe(path, content=None):
+    """Lines describing a table and whether it fits the events"""
+    table = game.StringTable(path)
+    try:
+        lines = [f"{path}: {len(table)} strings, language {table.language}, "
+                 f"{len(table.data) / 1024:.1f} KB"]
+        english = list(game.string_ids(event_table(content)))
+        lines.append("Ending text: " + ("used" if table.endings else "doesn't match, built-in text used"))
+        if game.text_checksum(english) == table.events_check:
+            lines.append("Event text: matches the events")
+        else:
+            lines.append("Event text: built from different events, their own text is used")
+        return lines
+    finally:
+        table.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and translate Utopian Sands string tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write the English string table")
+    build.add_argument("--out", default=game.STRINGS_FILE)
+    template = commands.add_parser("template", help="write a JSON file of strings to translate")
+    template.add_argument("path")
+    pack = commands.add_parser("pack", help="build a string table from a translated template")
+    pack.add_argument("path")
+    pack.add_argument("--language", default=None, help="language code stored in the table, like fr")
+    pack.add_argument("--out", default=None, help="default utopian_sands_text.LANGUAGE.bin")
+    show = commands.add_parser("show", help="describe a string table")
+    show.add_argument("path", nargs="?", default=game.STRINGS_FILE)
+    for command in (build, template, pack, show):
+        command.add_argument("--content", default=None, help="events from this content file instead of the built-in ones")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            count = build_table(args.out, args.content)
+            print(f"Wrote {count} strings to {args.out}")
+        elif args.command == "template":
+            count = write_template(args.path, args.content)
+            print(f"Wrote {count} strings to translate to {args.path}")
+        elif args.command == "pack":
+            language = args.language
+            if language is None:
+                with open(args.path, encoding="utf-8") as file:
+                    language = json.load(file).get("language") or "en"
+            out = args.out or f"utopian_sands_text.{language}.bin"
+            count, untranslated = pack_translation(args.path, out, language, args.content)
+            print(f"Wrote {count} strings to {out} ({untranslated} left in English)")
+        else:
+            for line in describe(args.path, args.content):
+                print(line)
+    except (OSError, ValueError, KeyError, game.StringTableError) as error:
+        raise SystemExit(str(error))
+
+if __name__ == "__main__":
+    main()
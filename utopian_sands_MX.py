@@ -5,18 +5,34 @@
 
 # ===== Imports =====
 
-import shelve
+# dbm, hashlib, shelve and sqlite3 are imported where they're first used,
+# so the title screen doesn't wait on them (together they take longer to
+# load than the rest of the game)
+import os
+import struct
 import time
 import sys
 import random
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import MutableMapping
+
+try:
+    import msvcrt  # Windows keyboard polling for the "skip" text mode
+except ImportError:
+    msvcrt = None
+    import select
 
 # ===== Game Setup =====
 class Player:
     """Player class to store player information and stats"""
-    def __init__(self, name, location):
+    def __init__(self, name, location, seed=None):
         self.name = name
         self.location = location
-        self.inventory = []
+        # Seed for this game's random events, see Random Streams below
+        self.seed = new_seed() if seed is None else seed
+        self.inventory = Inventory()
         self.health = 100
         self.guilt = 0
         # Expanded alignment system for 9 endings
@@ -45,126 +61,979 @@ class Player:
             "underworld": 50    # 0-100, how criminals view you
         }
 
+    # AlignmentTracker following this player, set by track()
+    tracker = None
+    # EventGraph this player's game started on, see Live Content
+    graph = None
+
+    def __getstate__(self):
+        # Trackers hold their listeners and graphs are shared by every
+        # game, neither needs to pickle
+        state = self.__dict__.copy()
+        state.pop("tracker", None)
+        state.pop("graph", None)
+        return state
+
+# Same order as the dicts in Player
+ALIGNMENT_TYPES = ("lawful_good", "neutral_good", "chaotic_good",
+                   "lawful_neutral", "true_neutral", "chaotic_neutral",
+                   "lawful_evil", "neutral_evil", "chaotic_evil")
+FACTIONS = ("authorities", "citizens", "underworld")
+
+# ===== Random Streams =====
+# Every game has a 64-bit seed, kept on the Player and in the save. Each
+# event rolls from its own stream derived from that seed, so a game loaded
+# before event 4 rolls exactly what it would have rolled had it never been
+# saved, and no two sessions or worker processes share a generator.
+
+def new_seed():
+    """A fresh random 64-bit seed"""
+    return int.from_bytes(os.urandom(8), "little")
+
+_blake2b = None
+
+def blake2b():
+    """hashlib.blake2b, imported the first time a seed or stream needs it"""
+    global _blake2b
+    if _blake2b is None:
+        import hashlib
+        _blake2b = hashlib.blake2b
+    return _blake2b
+
+def derive_seed(seed, *path):
+    """Seed of a named sub-stream, e.g. derive_seed(seed, "event", 3)"""
+    name = ":".join(str(part) for part in path).encode()
+    digest = blake2b()(name, digest_size=8, key=seed.to_bytes(8, "little")).digest()
+    return int.from_bytes(digest, "little")
+
+class RandomStream:
+    """Counter-based random numbers: draw n is a keyed hash of n
+
+    There's no generator state to set up, so making one per event is free,
+    and streams with different seeds never overlap.
+    """
+    __slots__ = ("key", "count", "hash")
+
+    def __init__(self, seed):
+        self.key = seed.to_bytes(8, "little")
+        self.count = 0
+        self.hash = blake2b()   # looked up once here, random() is called a lot
+
+    def random(self):
+        """Float in [0, 1), like random.random()"""
+        digest = self.hash(self.count.to_bytes(8, "little"), digest_size=8,
+                                 key=self.key).digest()
+        self.count += 1
+        return (int.from_bytes(digest, "little") >> 11) * (1.0 / (1 << 53))
+
+def event_stream(seed, number):
+    """The stream event number (1-based) rolls from in the game with this seed"""
+    return RandomStream(derive_seed(seed, "event", number))
+
+# ===== Items =====
+# Item names are stored once here and inventories count items by small id
+# numbers. Tags group items an event can ask for without naming them, like
+# "bribe" for anything the police would take; a tag lists its items in the
+# order they're tried.
+ITEM_NAMES = []
+ITEM_IDS = {}
+
+ITEM_TAGS = {
+    "Stolen Fruit": ("food", "stolen"),
+    "Stolen Goods": ("bribe", "stolen"),
+    "Social Observations": ("evidence",),
+    "Small Reward": ("bribe", "money"),
+    "Research Money": ("bribe", "money"),
+    "Trained Dog": ("dog",),
+    "Attack Dog": ("dog",),
+    "Dog Companion": ("dog",),
+    "Stolen Supplies": ("stolen",),
+    "Extortion Money": ("bribe", "money"),
+    "Hidden Treasure": ("bribe", "valuable"),
+    "Blackmail Evidence": ("evidence",),
+    "Incriminating Recording": ("evidence",),
+    "Evidence Dossier": ("evidence",),
+    "Settlement Money": ("bribe", "money"),
+}
+
+def intern_item(name):
+    """Id number for an item name"""
+    if name not in ITEM_IDS:
+        ITEM_IDS[name] = len(ITEM_NAMES)
+        ITEM_NAMES.append(name)
+    return ITEM_IDS[name]
+
+def build_tag_items(item_tags):
+    """{tag: tuple of item names} from {item name: tags}"""
+    tag_items = {}
+    for name, tags in item_tags.items():
+        for tag in tags:
+            tag_items.setdefault(tag, []).append(name)
+    return {tag: tuple(names) for tag, names in tag_items.items()}
+
+TAG_ITEMS = build_tag_items(ITEM_TAGS)
+# Known items get the same ids in every process
+for _name in ITEM_TAGS:
+    intern_item(_name)
+del _name
+
+class Inventory:
+    """How many of each item a player has, counts[i] for item id i
+
+    Checking for an item, counting it, adding one and removing one each
+    take the same time however much is being carried. Still answers to the
+    list methods the events used before (append, remove, count, in), and
+    iterates item names, repeated when there's more than one.
+    """
+    __slots__ = ("counts",)
+
+    def __init__(self, counts=None):
+        self.counts = array("H") if counts is None else counts
+
+    @classmethod
+    def from_names(cls, names):
+        inventory = cls()
+        for name in names:
+            inventory.add(name)
+        return inventory
+
+    def add(self, name, amount=1):
+        item_id = intern_item(name)
+        if item_id >= len(self.counts):
+            self.counts.extend([0] * (item_id + 1 - len(self.counts)))
+        self.counts[item_id] += amount
+
+    def append(self, name):
+        self.add(name)
+
+    def remove(self, name):
+        if name not in self:
+            raise ValueError(f"{name} is not in the inventory")
+        self.counts[ITEM_IDS[name]] -= 1
+
+    def count(self, name):
+        item_id = ITEM_IDS.get(name)
+        if item_id is None or item_id >= len(self.counts):
+            return 0
+        return self.counts[item_id]
+
+    def __contains__(self, name):
+        return self.count(name) > 0
+
+    def items(self):
+        """(name, count) for every item held"""
+        return [(ITEM_NAMES[i], n) for i, n in enumerate(self.counts) if n]
+
+    def has_tag(self, tag):
+        return any(name in self for name in TAG_ITEMS.get(tag, ()))
+
+    def with_tag(self, tag):
+        """Names of the items held with a tag, in the tag's order"""
+        return [name for name in TAG_ITEMS.get(tag, ()) if name in self]
+
+    def take_first(self, names):
+        """Removes one of the first of names that's held, returns it (None if none are)"""
+        for name in names:
+            if name in self:
+                self.counts[ITEM_IDS[name]] -= 1
+                return name
+        return None
+
+    def __iter__(self):
+        for name, n in self.items():
+            for _ in range(n):
+                yield name
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __eq__(self, other):
+        return sorted(self) == sorted(other)
+
+    def __reduce__(self):
+        # Pickle by name, ids differ between processes for items outside ITEM_TAGS
+        return (Inventory.from_names, (list(self),))
+
+    def __repr__(self):
+        return repr(list(self))
+
+# ===== Compact Player =====
+# Choice history labels are stored once here and players keep small id
+# numbers instead of their own copies of the strings.
+HISTORY_LABELS = []
+HISTORY_IDS = {}
+
+def intern_label(label):
+    """Id number for a choice history label, like Dog event: Choice"""
+    if label not in HISTORY_IDS:
+        if len(HISTORY_LABELS) == 256:
+            raise ValueError("Too many choice history labels")
+        HISTORY_IDS[label] = len(HISTORY_LABELS)
+        HISTORY_LABELS.append(label)
+    return HISTORY_IDS[label]
+
+# Where each stat lives in CompactPlayer's stats array
+AXIS_SLOTS = {"law_chaos": 0, "good_evil": 1}
+CHOICE_SLOTS = {name: 2 + i for i, name in enumerate(ALIGNMENT_TYPES)}
+REPUTATION_SLOTS = {name: 11 + i for i, name in enumerate(FACTIONS)}
+HEALTH_SLOT = 14
+GUILT_SLOT = 15
+
+class StatView(MutableMapping):
+    """Dict-style view of some of a CompactPlayer's stats"""
+    __slots__ = ("stats", "slots")
+
+    def __init__(self, stats, slots):
+        self.stats = stats
+        self.slots = slots
+
+    def __getitem__(self, key):
+        return self.stats[self.slots[key]]
+
+    def __setitem__(self, key, value):
+        self.stats[self.slots[key]] = value
+
+    def __delitem__(self, key):
+        raise TypeError("Player stats can't be removed")
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class AlignmentView(StatView):
+    """Like StatView, plus the "choices" counters under their own key"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key == "choices":
+            return StatView(self.stats, CHOICE_SLOTS)
+        return self.stats[self.slots[key]]
+
+    def __iter__(self):
+        yield from self.slots
+        yield "choices"
+
+    def __len__(self):
+        return len(self.slots) + 1
+
+class HistoryList:
+    """List-style view of a CompactPlayer's choice history
+
+    Each entry is two bytes: the label id and the choice number, so
+    "Dog event: Choice 9" costs 2 bytes instead of a string.
+    """
+    __slots__ = ("codes",)
+
+    def __init__(self, codes):
+        self.codes = codes
+
+    def append(self, entry):
+        label, _, number = entry.rpartition(" ")
+        if not number.isdigit() or int(number) > 255:
+            label, number = entry, 0  # not "<label> <number>", keep it whole
+        self.codes += bytes((intern_label(label), int(number)))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("choice history index out of range")
+        label, number = self.codes[2 * index], self.codes[2 * index + 1]
+        return f"{HISTORY_LABELS[label]} {number}" if number else HISTORY_LABELS[label]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __len__(self):
+        return len(self.codes) // 2
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+class CompactPlayer:
+    """Player that packs its stats into one small array
+
+    Works anywhere a Player does: alignment, reputation, inventory and
+    choices_history look like the usual dicts and lists, but every number
+    lives in one array of 16 short ints, the inventory is an array of item
+    counts and the history is a bytearray. Meant for holding lots of
+    players in memory.
+    """
+    __slots__ = ("name", "location", "seed", "stats", "item_counts", "history_codes", "tracker", "graph")
+
+    def __init__(self, name, location, seed=None):
+        self.name = name
+        self.location = location
+        self.seed = new_seed() if seed is None else seed
+        self.tracker = None
+        self.graph = None
+        self.stats = array("h", [0] * 16)
+        self.item_counts = array("H")
+        self.history_codes = bytearray()
+        self.health = 100
+        for faction in FACTIONS:
+            self.reputation[faction] = 50
+
+    @property
+    def health(self):
+        return self.stats[HEALTH_SLOT]
+
+    @health.setter
+    def health(self, value):
+        self.stats[HEALTH_SLOT] = value
+
+    @property
+    def guilt(self):
+        return self.stats[GUILT_SLOT]
+
+    @guilt.setter
+    def guilt(self, value):
+        self.stats[GUILT_SLOT] = value
+
+    @property
+    def alignment(self):
+        return AlignmentView(self.stats, AXIS_SLOTS)
+
+    @property
+    def reputation(self):
+        return StatView(self.stats, REPUTATION_SLOTS)
+
+    @property
+    def inventory(self):
+        return Inventory(self.item_counts)
+
+    @property
+    def choices_history(self):
+        return HistoryList(self.history_codes)
+
+    @classmethod
+    def from_player(cls, player):
+        """Makes a CompactPlayer copy of a Player (or another CompactPlayer)"""
+        compact = cls(player.name, player.location, getattr(player, "seed", None))
+        compact.health = player.health
+        compact.guilt = player.guilt
+        for key in AXIS_SLOTS:
+            compact.alignment[key] = player.alignment[key]
+        for key in CHOICE_SLOTS:
+            compact.alignment["choices"][key] = player.alignment["choices"][key]
+        for key in REPUTATION_SLOTS:
+            compact.reputation[key] = player.reputation[key]
+        for item in player.inventory:
+            compact.inventory.append(item)
+        for entry in player.choices_history:
+            compact.choices_history.append(entry)
+        return compact
+
+    def to_player(self):
+        """Makes a normal Player copy"""
+        player = Player.__new__(Player)
+        player.__dict__.update(self.__getstate__())
+        player.inventory = Inventory.from_names(player.inventory)
+        return player
+
+    def __getstate__(self):
+        # Pickle as plain data (same layout as a Player) so saves don't
+        # depend on the interned id numbers of the process that wrote them
+        alignment = {key: self.alignment[key] for key in AXIS_SLOTS}
+        alignment["choices"] = dict(self.alignment["choices"])
+        return {"name": self.name, "location": self.location, "seed": self.seed,
+                "inventory": list(self.inventory), "health": self.health,
+                "guilt": self.guilt, "alignment": alignment,
+                "choices_history": list(self.choices_history),
+                "reputation": dict(self.reputation)}
+
+    def __setstate__(self, state):
+        player = Player.__new__(Player)
+        player.__dict__.update(state)
+        copy = CompactPlayer.from_player(player)
+        for slot in CompactPlayer.__slots__:
+            setattr(self, slot, getattr(copy, slot))
+
+# ===== Text Rendering =====
+class TextRenderer:
+    """Writes text with the typing effect, a frame of characters at a time
+    
+    Instead of one write, flush and sleep per character, each frame writes
+    every character that is due and flushes once. Modes:
+      "typed"   - normal typing effect
+      "skip"    - typing effect, pressing Enter finishes the current line at once
+      "zero"    - no delay, one write and flush per line
+      "instant" - no delay and no flushing (used when stdout isn't a terminal)
+    With mode=None, "typed" is used on a terminal and "instant" otherwise.
+    """
+    def __init__(self, mode=None, frame=0.016, stream=None):
+        self.mode = mode
+        self.frame = frame      # seconds between flushes while typing
+        self.stream = stream    # None means whatever sys.stdout is right now
+    
+    def __call__(self, text, delay=0.03):
+        stream = self.stream or sys.stdout
+        mode = self.mode or ("typed" if stream.isatty() else "instant")
+        text += "\n"
+        
+        if mode == "instant" or delay <= 0:
+            stream.write(text)
+            return
+        if mode == "zero":
+            stream.write(text)
+            stream.flush()
+            return
+        
+        # Each frame shows as many characters as the delay says are due,
+        # sleeping until the frame's deadline so sleep overshoot doesn't add up
+        per_frame = max(1, int(self.frame / delay))
+        start = time.monotonic()
+        for i in range(0, len(text), per_frame):
+            if mode == "skip" and key_pressed():
+                stream.write(text[i:])
+                stream.flush()
+                return
+            stream.write(text[i:i + per_frame])
+            stream.flush()
+            wait = start + (i + per_frame) * delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+def key_pressed():
+    """Returns True (and eats the key press) if the player has pressed a key
+
+    On Windows that's any key, read as one character. Elsewhere the terminal
+    only passes input on at Enter, so it's the line typed, read straight
+    from the file descriptor: one read of a terminal returns at most one
+    line, so anything typed after it is left for the next input(). Input
+    that isn't a terminal (answers piped in) never counts as a key press.
+    """
+    if msvcrt is not None:
+        if msvcrt.kbhit():
+            msvcrt.getwch()
+            return True
+        return False
+    try:
+        if not sys.stdin.isatty():
+            return False
+        fd = sys.stdin.fileno()
+        ready, _, _ = select.select([fd], [], [], 0)
+        if ready:
+            os.read(fd, 4096)
+            return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+# ===== Input/Output Hooks =====
+# Swap these out to run the events somewhere other than a terminal
+# (play_headless() skips them entirely). choice_provider stands in for the
+# person at the keyboard, so like them it's only given the options shown;
+# play_headless()'s choose(options, player) also gets the player, for
+# simulations that pick by the player's state. A function taking
+# (options, player=None), like the agents in sands_agents.py, works as both.
+renderer = TextRenderer()  # function(text, delay) that shows text to the player
+choice_provider = None     # function(options) that replaces asking the player
+journal = None             # Journal recording the game being played, if any
+analytics = None           # AnalyticsSink getting a record of every choice, if any
+
+think_time = 0.0           # seconds the last show_choices() answer took
+
 # ===== Functions =====
 def type_text(text, delay=0.03):
     """Prints text with typing effect"""
-    for char in text:
-        sys.stdout.write(char)
-        sys.stdout.flush()
-        time.sleep(delay)
-    print()
+    renderer(text, delay)
+
+def choice_lines(options):
+    """Lines listing the numbered choices"""
+    lines = ["\nWhat do you do?"]
+    for i, option in enumerate(options, 1):
+        lines.append(f"  [{i}] {option}")
+    return lines
+
+def choice_prompt(options):
+    return "\nEnter your choice (1-" + str(len(options)) + "): "
+
+def parse_choice(answer, options):
+    """Returns (choice number, None) for a valid answer or (None, message to show)"""
+    try:
+        choice_num = int(answer)
+    except ValueError:
+        return None, "Please enter a valid number"
+    if 1 <= choice_num <= len(options):
+        return choice_num, None
+    return None, f"Please enter a number between 1 and {len(options)}"
 
 def show_choices(options):
     """Displays numbered choices to the player"""
-    type_text("\nWhat do you do?")
-    for i, option in enumerate(options, 1):
-        type_text(f"  [{i}] {option}")
+    global think_time
+    for line in choice_lines(options):
+        type_text(line)
+    
+    # Time from the options being shown to a valid answer
+    start = time.perf_counter()
+    if choice_provider is not None:
+        choice_num = choice_provider(options)
+        think_time = time.perf_counter() - start
+        return choice_num
     
     while True:
-        try:
-            choice = input("\nEnter your choice (1-" + str(len(options)) + "): ")
-            choice_num = int(choice)
-            if 1 <= choice_num <= len(options):
-                return choice_num
-            else:
-                type_text(f"Please enter a number between 1 and {len(options)}")
-        except ValueError:
-            type_text("Please enter a valid number")
+        choice_num, problem = parse_choice(input(choice_prompt(options)), options)
+        if problem is None:
+            think_time = time.perf_counter() - start
+            return choice_num
+        type_text(problem)
 
 def update_alignment(player, law_change=0, good_change=0, specific_alignment=None):
     """Updates player alignment on both axes and specific alignment choices"""
-    # Update axes
-    player.alignment["law_chaos"] += law_change
-    player.alignment["good_evil"] += good_change
+    alignment = player.alignment
     
-    # Clamp values
-    for axis in ["law_chaos", "good_evil"]:
-        player.alignment[axis] = max(-100, min(100, player.alignment[axis]))
+    # Update axes, clamping only the ones that moved
+    if law_change:
+        law = alignment["law_chaos"] + law_change
+        alignment["law_chaos"] = -100 if law < -100 else 100 if law > 100 else law
+    if good_change:
+        good = alignment["good_evil"] + good_change
+        alignment["good_evil"] = -100 if good < -100 else 100 if good > 100 else good
     
     # Update specific alignment if provided
     if specific_alignment:
-        player.alignment["choices"][specific_alignment] += 1
+        alignment["choices"][specific_alignment] += 1
     
+    if player.tracker is not None:
+        player.tracker.alignment_changed(specific_alignment)
     return player
 
+def change_reputation(player, faction, change):
+    """Adds change to one faction's reputation, kept within 0-100"""
+    value = player.reputation[faction] + change
+    value = 0 if value < 0 else 100 if value > 100 else value
+    player.reputation[faction] = value
+    if player.tracker is not None:
+        player.tracker.reputation_changed(faction, value)
+
 def update_reputation(player, authorities_change=0, citizens_change=0, underworld_change=0):
     """Updates player reputation with different factions"""
-    player.reputation["authorities"] += authorities_change
-    player.reputation["citizens"] += citizens_change
-    player.reputation["underworld"] += underworld_change
-    
-    # Clamp values
-    for faction in player.reputation:
-        player.reputation[faction] = max(0, min(100, player.reputation[faction]))
-    
+    if authorities_change:
+        change_reputation(player, "authorities", authorities_change)
+    if citizens_change:
+        change_reputation(player, "citizens", citizens_change)
+    if underworld_change:
+        change_reputation(player, "underworld", underworld_change)
     return player
 
+def stats_lines(player):
+    """Lines of the current stats box"""
+    return ["\n" + "-"*40,
+            "CURRENT STATS",
+            "-"*40,
+            f"Health: {player.health}%",
+            f"Guilt: {player.guilt}%"]
+
 def show_stats(player):
     """Displays current player stats"""
-    type_text("\n" + "-"*40)
-    type_text("CURRENT STATS")
-    type_text("-"*40)
-    type_text(f"Health: {player.health}%")
-    type_text(f"Guilt: {player.guilt}%")
+    for line in stats_lines(player):
+        type_text(line)
+
+GAME_OVER_LINES = ["\nGAME OVER", "Your journey has come to an unfortunate end..."]
 
 def check_game_over(player):
     """Checks if game should end"""
     if player.health <= 0:
-        type_text("\nGAME OVER")
-        type_text("Your journey has come to an unfortunate end...")
+        for line in GAME_OVER_LINES:
+            type_text(line)
         return True
     return False
 
-def save_game(player, event_counter):
+# ===== Save Files =====
+# A save file is a small header followed by the game data:
+#   header:  magic "USND", format version, CRC32 of the data
+#   data:    event counter, both axes, the 9 choice counters, 3 reputations,
+#            health and guilt as 16-bit ints, the 64-bit random seed, then
+#            name and location as length-prefixed UTF-8 strings, the names
+#            of the items held followed by how many of each (16-bit ints),
+#            and the choice history as strings
+#            (version 1 saves have no seed, and versions 1 and 2 list the
+#            inventory as one string per item)
+# Files are written to a temporary name and renamed over the old save, so a
+# crash mid-save never leaves half a file behind.
+SAVE_FILE = "game_save.sav"
+LEGACY_SAVE_FILE = "game_save"   # the old shelve database
+SAVE_MAGIC = b"USND"
+SAVE_VERSION = 3
+SAVE_HEADER = struct.Struct("<4sBI")
+SAVE_STATS = struct.Struct("<17h")
+SAVE_SEED = struct.Struct("<Q")
+
+class SaveError(Exception):
+    """A save file is missing, damaged or from an unknown version"""
+
+def pack_strings(strings):
+    """Count followed by each string's length and UTF-8 bytes"""
+    parts = [struct.pack("<H", len(strings))]
+    for text in strings:
+        data = text.encode("utf-8")
+        parts.append(struct.pack("<H", len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def unpack_strings(data, offset):
+    """Reads what pack_strings() wrote, returns (strings, new offset)"""
+    (count,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    strings = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    if offset > len(data):
+        raise SaveError("Save file is cut short")
+    return strings, offset
+
+def pack_inventory(inventory):
+    """Names of the items held then a 16-bit count for each"""
+    held = Counter(inventory)
+    return pack_strings(list(held)) + struct.pack(f"<{len(held)}H", *held.values())
+
+def unpack_inventory(data, offset):
+    """Reads what pack_inventory() wrote, returns ([(name, count)], new offset)"""
+    names, offset = unpack_strings(data, offset)
+    counts = struct.unpack_from(f"<{len(names)}H", data, offset)
+    return list(zip(names, counts)), offset + 2 * len(names)
+
+def pack_save(player, event_counter):
+    """Turns a player (Player or CompactPlayer) into save file bytes"""
+    choices = player.alignment["choices"]
+    stats = SAVE_STATS.pack(
+        event_counter, player.alignment["law_chaos"], player.alignment["good_evil"],
+        *[choices[name] for name in ALIGNMENT_TYPES],
+        *[player.reputation[faction] for faction in FACTIONS],
+        player.health, player.guilt)
+    data = (stats + SAVE_SEED.pack(player.seed) + pack_strings([player.name, player.location])
+            + pack_inventory(player.inventory) + pack_strings(list(player.choices_history)))
+    return SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, zlib.crc32(data)) + data
+
+def unpack_save(data, player_class=None):
+    """Turns save file bytes back into (player, event_counter)"""
+    if len(data) < SAVE_HEADER.size + SAVE_STATS.size:
+        raise SaveError("Save file is cut short")
+    magic, version, checksum = SAVE_HEADER.unpack_from(data)
+    if magic != SAVE_MAGIC:
+        raise SaveError("Not a Utopian Sands save file")
+    if version not in (1, 2, SAVE_VERSION):
+        raise SaveError(f"Unknown save file version {version}")
+    body = data[SAVE_HEADER.size:]
+    if zlib.crc32(body) != checksum:
+        raise SaveError("Save file is damaged")
+
+    try:
+        stats = SAVE_STATS.unpack_from(body)
+        offset = SAVE_STATS.size
+        seed = None   # a version 1 save gets a fresh seed
+        if version >= 2:
+            (seed,) = SAVE_SEED.unpack_from(body, offset)
+            offset += SAVE_SEED.size
+        (name, location), offset = unpack_strings(body, offset)
+        if version >= 3:
+            inventory, offset = unpack_inventory(body, offset)
+        else:
+            names, offset = unpack_strings(body, offset)
+            inventory = list(Counter(names).items())
+        history, offset = unpack_strings(body, offset)
+    except (struct.error, UnicodeDecodeError, ValueError) as error:
+        raise SaveError(f"Save file is damaged ({error})") from None
+
+    player = (player_class or Player)(name, location, seed)
+    event_counter, player.alignment["law_chaos"], player.alignment["good_evil"] = stats[:3]
+    for name, value in zip(ALIGNMENT_TYPES, stats[3:12]):
+        player.alignment["choices"][name] = value
+    for faction, value in zip(FACTIONS, stats[12:15]):
+        player.reputation[faction] = value
+    player.health, player.guilt = stats[15:17]
+    for item, count in inventory:
+        player.inventory.add(item, count)
+    for entry in history:
+        player.choices_history.append(entry)
+    return player, event_counter
+
+def write_save_file(path, data):
+    """Writes a file so it is either fully replaced or left untouched"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+def read_save_file(path=SAVE_FILE):
+    """Loads (player, event_counter) from a save file, raising SaveError if it can't"""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        raise SaveError("No saved game found") from None
+    return unpack_save(data)
+
+def unpickle_legacy(data):
+    """Unpickles a value from an old shelve save
+
+    The old game pickled its Player while running as __main__, which is
+    the launcher (or some other script) when the game is started another
+    way, so __main__.Player is read as this module's Player.
+    """
+    import io
+    import pickle
+
+    class LegacyUnpickler(pickle.Unpickler):
+        def find_class(self, module, name):
+            if module == "__main__" and name == "Player":
+                return Player
+            return super().find_class(module, name)
+
+    try:
+        return LegacyUnpickler(io.BytesIO(data)).load()
+    except (pickle.UnpicklingError, AttributeError, EOFError, ImportError) as error:
+        raise SaveError(f"Old save file is damaged ({error})") from None
+
+def migrate_legacy_save(path=SAVE_FILE, legacy_path=LEGACY_SAVE_FILE):
+    """Copies an old shelve save into the new format, returns True if there was one
+
+    A damaged old save raises SaveError.
+    """
+    import dbm
+    try:
+        # The same database shelve kept, read here so the pickles can be too
+        with dbm.open(legacy_path, "r") as save_file:
+            if b"player" not in save_file or b"event_counter" not in save_file:
+                return False
+            player = unpickle_legacy(save_file[b"player"])
+            event_counter = unpickle_legacy(save_file[b"event_counter"])
+    except dbm.error:
+        return False
+    if not hasattr(player, "seed"):
+        player.seed = new_seed()
+    write_save_file(path, pack_save(player, event_counter))
+    return True
+
+# ===== Save Store =====
+SAVE_STORE_FILE = "game_saves.db"
+
+class SaveStore:
+    """Every player's save slots in one SQLite database
+
+    Rows are keyed by (player name, slot) so finding, listing and replacing
+    a save is an index lookup however many profiles there are. Each row keeps
+    the event counter and save time next to the packed save, so slots can be
+    listed without unpacking any players.
+    """
+    def __init__(self, path=SAVE_STORE_FILE):
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS saves (
+                               name TEXT NOT NULL,
+                               slot TEXT NOT NULL,
+                               event_counter INTEGER NOT NULL,
+                               saved_at REAL NOT NULL,
+                               data BLOB NOT NULL,
+                               PRIMARY KEY (name, slot))""")
+
+    def save(self, player, event_counter, slot="1"):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO saves VALUES (?, ?, ?, ?, ?)",
+                            (player.name, slot, event_counter, time.time(),
+                             pack_save(player, event_counter)))
+
+    def load(self, name, slot="1", player_class=None):
+        """Returns (player, event_counter), raising SaveError if there's no such save"""
+        row = self.db.execute("SELECT data FROM saves WHERE name = ? AND slot = ?",
+                              (name, slot)).fetchone()
+        if row is None:
+            raise SaveError("No saved game found")
+        return unpack_save(row[0], player_class)
+
+    def list_slots(self, name):
+        """[(slot, event_counter, saved_at)] for one player, without loading them"""
+        return self.db.execute("SELECT slot, event_counter, saved_at FROM saves "
+                               "WHERE name = ? ORDER BY slot", (name,)).fetchall()
+
+    def delete(self, name, slot):
+        with self.db:
+            self.db.execute("DELETE FROM saves WHERE name = ? AND slot = ?", (name, slot))
+
+    def is_empty(self):
+        return self.db.execute("SELECT 1 FROM saves LIMIT 1").fetchone() is None
+
+    def import_old_save(self):
+        """Brings a single-file save (or an older shelve save) into slot 1"""
+        if not os.path.exists(SAVE_FILE):
+            migrate_legacy_save()
+        if os.path.exists(SAVE_FILE):
+            player, event_counter = read_save_file(SAVE_FILE)
+            self.save(player, event_counter, "1")
+
+    def close(self):
+        self.db.close()
+
+save_store = None
+
+def get_save_store():
+    """Opens the save store the first time it's needed"""
+    global save_store
+    if save_store is None:
+        save_store = SaveStore()
+        if save_store.is_empty():
+            try:
+                save_store.import_old_save()
+            except SaveError:
+                pass
+    return save_store
+
+def ask_save_slot():
+    return input("Save slot (Enter for 1): ").strip() or "1"
+
+def save_game(player, event_counter, slot="1"):
     """Saves the current game state"""
+    import sqlite3
     try:
-        with shelve.open("game_save") as save_file:
-            save_file["player"] = player
-            save_file["event_counter"] = event_counter
+        get_save_store().save(player, event_counter, slot)
         type_text("\nGame saved successfully!")
-    except:
-        type_text("\nError saving game.")
+    except (sqlite3.Error, struct.error) as error:
+        type_text(f"\nError saving game. ({error})")
 
 def load_game():
     """Loads a saved game"""
+    import sqlite3
     try:
-        with shelve.open("game_save") as save_file:
-            if "player" in save_file and "event_counter" in save_file:
-                type_text("\nGame loaded successfully!")
-                return save_file["player"], save_file["event_counter"]
-            else:
-                type_text("\nNo saved game found.")
-                return None, 0
-    except:
-        type_text("\nError loading game.")
+        store = get_save_store()
+        name = input("Enter your name: ").strip() or "Stranger"
+        slots = store.list_slots(name)
+        if not slots:
+            type_text("\nNo saved game found.")
+            return None, 0
+        type_text(f"\nSaved games for {name}:")
+        for i, (slot, event_counter, saved_at) in enumerate(slots, 1):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(saved_at))
+            type_text(f"  [{i}] Slot {slot} - before event {event_counter + 1}, saved {when}")
+        while True:
+            choice, problem = parse_choice(input(choice_prompt(slots)), slots)
+            if problem is None:
+                break
+            type_text(problem)
+        player, event_counter = store.load(name, slots[choice - 1][0])
+    except SaveError as error:
+        type_text(f"\n{error}.")
         return None, 0
+    except sqlite3.Error as error:
+        type_text(f"\nError loading game. ({error})")
+        return None, 0
+    type_text("\nGame loaded successfully!")
+    return player, event_counter
+
+# ===== Endings =====
+# Ending ids run good/evil band * 3 + law/chaos band, with bands 0, 1, 2 for
+# Lawful/Neutral/Chaotic and Good/Neutral/Evil
+ENDING_NAMES = ("Lawful Good", "Neutral Good", "Chaotic Good",
+                "Lawful Neutral", "True Neutral", "Chaotic Neutral",
+                "Lawful Evil", "Neutral Evil", "Chaotic Evil")
+
+def axis_band(value):
+    """0, 1 or 2 for the low, middle and high third of an axis"""
+    if value < -33:
+        return 0
+    if value > 33:
+        return 2
+    return 1
+
+def build_ending_table():
+    """Ending id of every (law_chaos, good_evil) point, 201 x 201 bytes
+
+    Row law_chaos + 100, column good_evil + 100.
+    """
+    rows = [bytes(axis_band(good) * 3 + law_band for good in range(-100, 101))
+            for law_band in range(3)]
+    return b"".join(rows[axis_band(law)] for law in range(-100, 101))
+
+ENDING_TABLE = build_ending_table()
+
+def ending_id(law_chaos, good_evil):
+    """Looks up the ending id for a point on the two axes"""
+    if not (-100 <= law_chaos <= 100 and -100 <= good_evil <= 100):
+        law_chaos = max(-100, min(100, law_chaos))
+        good_evil = max(-100, min(100, good_evil))
+    return ENDING_TABLE[(law_chaos + 100) * 201 + good_evil + 100]
+
+def axis_alignment(law_chaos, good_evil):
+    """Names the alignment for a point on the two axes, like Chaotic Good"""
+    return ENDING_NAMES[ending_id(law_chaos, good_evil)]
+
+# Title shown for each ending
+ALIGNMENT_TITLES = {
+    "Lawful Good": "THE KNIGHT: Lawful Good",
+    "Neutral Good": "THE HERO: Neutral Good",
+    "Chaotic Good": "THE REBEL: Chaotic Good",
+    "Lawful Neutral": "THE JUDGE: Lawful Neutral",
+    "True Neutral": "THE LURKER: True Neutral",
+    "Chaotic Neutral": "THE NARCISSIST: Chaotic Neutral",
+    "Lawful Evil": "THE OVERLORD: Lawful Evil",
+    "Neutral Evil": "THE VILLAIN: Neutral Evil",
+    "Chaotic Evil": "THE SADIST: Chaotic Evil"
+}
+
+# Description under each title
+ALIGNMENT_DESCRIPTIONS = {
+    "THE KNIGHT: Lawful Good": "\nYou are a paragon of order and justice. You believe in using\n"
+                  "law and tradition to create a better world for all. Your\n"
+                  "choices reflect a commitment to doing what is right,\n"
+                  "even when it is difficult - following a strict moral code.",
+
+    "THE HERO: Neutral Good": "\nYou are a kind soul who does good without being bound\n"
+                   "by strict codes. You follow your conscience and help others\n"
+                   "because it's the right thing to do, regardless of laws\n"
+                   "or perceived righteouness.",
+
+    "THE REBEL: Chaotic Good": "\nYou are a free spirit who believes in doing good on your\n"
+                   "own terms. You value individual freedom and will bend\n"
+                   "or even break rules when they threaten what you believe is right.",
+
+    "THE JUDGE: Lawful Neutral": "\nYou believe in order, law, and tradition above all else.\n"
+                     "You follow a personal code or the laws of society,\n"
+                     "regardless of whether they lead to good or evil outcomes.",
+
+    "THE LURKER: True Neutral": "\nYou maintain perfect balance in all things. You avoid\n"
+                   "extremes and believe that all forces should exist in harmony.\n"
+                   "You are neither altruistic nor selfish, lawful nor chaotic. In other words...\n"
+                   "unaffected by the petty squabbles of the masses.",
+
+    "THE NARCISSIST: Chaotic Neutral": "\nYou are a true individualist who values personal freedom\n"
+                      "above all else. You follow your whims and desires,\n"
+                      "unconcerned with laws, traditions, or moral codes.\n"
+                      "A true self loving spirit.",
+
+    "THE OVERLORD: Lawful Evil": "\nYou use society's rules and laws to gain power and control.\n"
+                  "You believe in order, but use it for selfish or cruel purposes.\n"
+                  "You are a ruthless ruler.",
+
+    "THE VILLAIN: Neutral Evil": "\nYou do whatever you can get away with, without loyalty\n"
+                   "to anyone but yourself. You have no regard for laws or\n"
+                   "traditions. Persuing only personal power and pleasure.",
+
+    "THE SADIST: Chaotic Evil": "\nYou are a destructive force of unadulterated narcissism and violence.\n"
+                   "You reject all laws, traditions, and moral obligation.\n"
+                   "You do whatever you want, whenever you want with no regard."
+}
 
 def determine_final_alignment(player):
     """Determines the final D&D alignment based on axes and choices"""
-    law_chaos = player.alignment["law_chaos"]
-    good_evil = player.alignment["good_evil"]
-    
-    # Determine law/chaos axis
-    if law_chaos < -33:
-        law_status = "Lawful"
-    elif law_chaos > 33:
-        law_status = "Chaotic"
-    else:
-        law_status = "Neutral"
+    if player.tracker is not None:
+        # Already worked out as the game went
+        return ENDING_NAMES[player.tracker.ending], player.tracker.dominant
     
-    # Determine good/evil axis
-    if good_evil < -33:
-        good_status = "Good"
-    elif good_evil > 33:
-        good_status = "Evil"
-    else:
-        good_status = "Neutral"
-    
-    # Special case for True Neutral
-    if law_status == "Neutral" and good_status == "Neutral":
-        alignment = "True Neutral"
-    else:
-        alignment = f"{law_status} {good_status}"
+    alignment = axis_alignment(player.alignment["law_chaos"], player.alignment["good_evil"])
     
     # Also check most common specific alignment choice
     specific_choices = player.alignment["choices"]
@@ -172,893 +1041,1699 @@ def determine_final_alignment(player):
     
     return alignment, most_common
 
-def show_ending(player, alignment, most_common):
-    """Shows the final ending based on alignment"""
-    type_text("\n" + "="*60)
-    type_text("FINAL DESTINY")
-    type_text("="*60)
+def ending_text(alignment):
+    """(title, description) of an ending, from the string table if it has them"""
+    if string_table is not None and string_table.endings:
+        number = ENDING_NAMES.index(alignment)
+        return string_table[number], string_table[len(ENDING_NAMES) + number]
+    title = ALIGNMENT_TITLES[alignment]
+    return title, ALIGNMENT_DESCRIPTIONS[title]
+
+def ending_lines(player, alignment, most_common):
+    """Lines of the final ending based on alignment"""
+    lines = []
+    lines.append("\n" + "="*60)
+    lines.append("FINAL DESTINY")
+    lines.append("="*60)
     
     # Show final stats
-    type_text(f"\n{player.name}'s Journey Summary:")
-    type_text(f"Final Health: {player.health}%")
-    type_text(f"Final Guilt: {player.guilt}%")
-    type_text(f"Choices Made: {len(player.choices_history)}")
+    lines.append(f"\n{player.name}'s Journey Summary:")
+    lines.append(f"Final Health: {player.health}%")
+    lines.append(f"Final Guilt: {player.guilt}%")
+    lines.append(f"Choices Made: {len(player.choices_history)}")
     
     # Show reputation
-    type_text("\nFinal Reputation:")
-    type_text(f"  Authorities: {player.reputation['authorities']}/100")
-    type_text(f"  Citizens: {player.reputation['citizens']}/100")
-    type_text(f"  Underworld: {player.reputation['underworld']}/100")
+    lines.append("\nFinal Reputation:")
+    lines.append(f"  Authorities: {player.reputation['authorities']}/100")
+    lines.append(f"  Citizens: {player.reputation['citizens']}/100")
+    lines.append(f"  Underworld: {player.reputation['underworld']}/100")
     
     # Show alignment breakdown
-    type_text("\nAlignment Axes:")
-    type_text(f"  Law/Chaos: {player.alignment['law_chaos']} (Law < 0 < Chaos)")
-    type_text(f"  Good/Evil: {player.alignment['good_evil']} (Good < 0 < Evil)")
+    lines.append("\nAlignment Axes:")
+    lines.append(f"  Law/Chaos: {player.alignment['law_chaos']} (Law < 0 < Chaos)")
+    lines.append(f"  Good/Evil: {player.alignment['good_evil']} (Good < 0 < Evil)")
     
     # Final alignment
-    type_text("\n" + "="*60)
-    type_text(f"YOUR FINAL ALIGNMENT: {alignment}")
-    type_text("="*60)
+    lines.append("\n" + "="*60)
+    lines.append(f"YOUR FINAL ALIGNMENT: {alignment}")
+    lines.append("="*60)
     
-    # Alignment descriptions
-    alignment_descriptions = {
-        "THE KNIGHT: Lawful Good": "\nYou are a paragon of order and justice. You believe in using\n"
-                      "law and tradition to create a better world for all. Your\n"
-                      "choices reflect a commitment to doing what is right,\n"
-                      "even when it is difficult - following a strict moral code.",
-        
-        "THE HERO: Neutral Good": "\nYou are a kind soul who does good without being bound\n"
-                       "by strict codes. You follow your conscience and help others\n"
-                       "because it's the right thing to do, regardless of laws\n"
-                       "or perceived righteouness.",
-        
-        "THE REBEL: Chaotic Good": "\nYou are a free spirit who believes in doing good on your\n"
-                       "own terms. You value individual freedom and will bend\n"
-                       "or even break rules when they threaten what you believe is right.",
-        
-        "THE JUDGE: Lawful Neutral": "\nYou believe in order, law, and tradition above all else.\n"
-                         "You follow a personal code or the laws of society,\n"
-                         "regardless of whether they lead to good or evil outcomes.",
-        
-        "THE LURKER: True Neutral": "\nYou maintain perfect balance in all things. You avoid\n"
-                       "extremes and believe that all forces should exist in harmony.\n"
-                       "You are neither altruistic nor selfish, lawful nor chaotic. In other words...\n"
-                       "unaffected by the petty squabbles of the masses.",
-        
-        "THE NARCISSIST: Chaotic Neutral": "\nYou are a true individualist who values personal freedom\n"
-                          "above all else. You follow your whims and desires,\n"
-                          "unconcerned with laws, traditions, or moral codes.\n"
-                          "A true self loving spirit.",
-        
-        "THE OVERLORD: Lawful Evil": "\nYou use society's rules and laws to gain power and control.\n"
-                      "You believe in order, but use it for selfish or cruel purposes.\n"
-                      "You are a ruthless ruler.",
-        
-        "THE VILLAIN: Neutral Evil": "\nYou do whatever you can get away with, without loyalty\n"
-                       "to anyone but yourself. You have no regard for laws or\n"
-                       "traditions. Persuing only personal power and pleasure.",
-        
-        "THE SADIST: Chaotic Evil": "\nYou are a destructive force of unadulterated narcissism and violence.\n"
-                       "You reject all laws, traditions, and moral obligation.\n"
-                       "You do whatever you want, whenever you want with no regard."
-    }
-    
-    alignment_titles = {
-    "Lawful Good": "THE KNIGHT: Lawful Good",
-    "Neutral Good": "THE HERO: Neutral Good",
-    "Chaotic Good": "THE REBEL: Chaotic Good",
-    "Lawful Neutral": "THE JUDGE: Lawful Neutral",
-    "True Neutral": "THE LURKER: True Neutral",
-    "Chaotic Neutral": "THE NARCISSIST: Chaotic Neutral",
-    "Lawful Evil": "THE OVERLORD: Lawful Evil",
-    "Neutral Evil": "THE VILLAIN: Neutral Evil",
-    "Chaotic Evil": "THE SADIST: Chaotic Evil"
-}
-
     # Print the specific title and description
-    title = alignment_titles[alignment]
-    type_text(title)
-    type_text(alignment_descriptions[title])
+    title, description = ending_text(alignment)
+    lines.append(title)
+    lines.append(description)
     
     # Additional ending based on most common choice type
     if most_common != alignment.lower().replace(" ", "_"):
-        type_text(f"\nYour journey showed a tendency toward {most_common.replace('_', ' ').title()} choices.")
+        lines.append(f"\nYour journey showed a tendency toward {most_common.replace('_', ' ').title()} choices.")
     
-    type_text("\n" + "="*60)
-    type_text("Your story for today has reached its conclusion...")
-    type_text("Thank you for playing!")
+    lines.append("\n" + "="*60)
+    lines.append("Your story for today has reached its conclusion...")
+    lines.append("Thank you for playing!")
+    return lines
+
+def show_ending(player, alignment, most_common):
+    """Shows the final ending based on alignment"""
+    for line in ending_lines(player, alignment, most_common):
+        type_text(line)
+
+# ===== Alignment Tracking =====
+# A tracker follows one player and keeps the ending their axes point to,
+# their most common kind of choice and how each faction sees them, updated
+# by update_alignment() and update_reputation() as they happen, so nothing
+# has to be worked out again after every choice. Anything can subscribe to
+# hear about changes, like crossing into Chaotic.
+LAW_BAND_NAMES = ("Lawful", "Neutral", "Chaotic")
+GOOD_BAND_NAMES = ("Good", "Neutral", "Evil")
+ALIGNMENT_ORDER = {name: i for i, name in enumerate(ALIGNMENT_TYPES)}
+
+# Reputation bands, each up to and including its limit; 60 is a limit
+# because the police check for authorities reputation above 60
+REPUTATION_BANDS = ((20, "Hated"), (40, "Distrusted"), (60, "Neutral"),
+                    (80, "Trusted"), (100, "Admired"))
+REPUTATION_BAND_TABLE = bytes(next(i for i, (limit, _) in enumerate(REPUTATION_BANDS) if value <= limit)
+                              for value in range(101))
+
+class StateChange:
+    """Something a tracker noticed
+
+    kind is "law_chaos" or "good_evil" (old and new are bands 0-2),
+    "ending" (ending ids), "dominant" (alignment names) or "reputation"
+    (bands of REPUTATION_BANDS, for faction).
+    """
+    __slots__ = ("kind", "old", "new", "faction")
+
+    def __init__(self, kind, old, new, faction=None):
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.faction = faction
+
+    def __str__(self):
+        if self.kind == "law_chaos":
+            return f"Crossed into {LAW_BAND_NAMES[self.new]}"
+        if self.kind == "good_evil":
+            return f"Crossed into {GOOD_BAND_NAMES[self.new]}"
+        if self.kind == "ending":
+            return f"Now heading for {ENDING_NAMES[self.new]}"
+        if self.kind == "dominant":
+            return f"Most choices now {self.new.replace('_', ' ').title()}"
+        return f"The {self.faction} now see you as {REPUTATION_BANDS[self.new][1]}"
+
+    def __repr__(self):
+        return f"StateChange({self.kind!r}, {self.old!r}, {self.new!r}, {self.faction!r})"
+
+class AlignmentTracker:
+    """Keeps a player's ending, most common choice and reputation bands up to date
+
+    Each update is a few comparisons. Changes made to the player without
+    going through update_alignment()/update_reputation() aren't seen, so
+    track a player once it's loaded or replayed.
+    """
+    def __init__(self, player):
+        self.player = player
+        self.law_band = axis_band(player.alignment["law_chaos"])
+        self.good_band = axis_band(player.alignment["good_evil"])
+        self.ending = self.good_band * 3 + self.law_band
+        choices = player.alignment["choices"]
+        self.dominant = max(choices, key=choices.get)
+        self.reputation_bands = {faction: REPUTATION_BAND_TABLE[player.reputation[faction]]
+                                 for faction in FACTIONS}
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """Calls listener(change) with every StateChange from now on, returns listener"""
+        self.listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, kind, old, new, faction=None):
+        if self.listeners:
+            change = StateChange(kind, old, new, faction)
+            for listener in self.listeners:
+                listener(change)
+
+    def alignment_changed(self, specific_alignment=None):
+        law_band = axis_band(self.player.alignment["law_chaos"])
+        good_band = axis_band(self.player.alignment["good_evil"])
+        if law_band != self.law_band or good_band != self.good_band:
+            old_ending = self.ending
+            if law_band != self.law_band:
+                self.emit("law_chaos", self.law_band, law_band)
+                self.law_band = law_band
+            if good_band != self.good_band:
+                self.emit("good_evil", self.good_band, good_band)
+                self.good_band = good_band
+            self.ending = good_band * 3 + law_band
+            self.emit("ending", old_ending, self.ending)
+        if specific_alignment and specific_alignment != self.dominant:
+            # Counters only go up, so only the one just counted can take the
+            # lead, and it wins a tie if it comes first like max() would pick
+            choices = self.player.alignment["choices"]
+            count, leader = choices[specific_alignment], choices[self.dominant]
+            if count > leader or (count == leader and
+                                  ALIGNMENT_ORDER[specific_alignment] < ALIGNMENT_ORDER[self.dominant]):
+                old = self.dominant
+                self.dominant = specific_alignment
+                self.emit("dominant", old, specific_alignment)
+
+    def reputation_changed(self, faction, value):
+        band = REPUTATION_BAND_TABLE[value]
+        if band != self.reputation_bands[faction]:
+            old = self.reputation_bands[faction]
+            self.reputation_bands[faction] = band
+            self.emit("reputation", old, band, faction)
+
+def track(player):
+    """Starts an AlignmentTracker following player, returns it"""
+    player.tracker = AlignmentTracker(player)
+    return player.tracker
+
+def change_lines(changes):
+    """Lines telling the player about the band crossings in a list of StateChanges"""
+    shown = [str(change) for change in changes if change.kind in ("law_chaos", "good_evil", "reputation")]
+    if not shown:
+        return []
+    return ["\nYour standing has shifted:"] + ["  * " + line for line in shown]
 
 # ===== Game Events - Expanded =====
-def event_1(player):
-    """First event: Falling with mattress choice"""
-    type_text("\n" + "="*50)
-    type_text("                  FALL FROM GRACE")
-    type_text("      did it hurt when you fell from heaven?")
-    type_text("="*50)
-    
-    type_text("\nYou awaken mid-air, plummeting toward a crowded marketplace.")
-    type_text("Below you, five innocent people go about their daily lives.")
-    type_text("You notice a mattress has suddenly appeared near you.")
-    
-    choices = [
-        "Create a spectacle (Embrace the chaos)",
-        "Check legal manual (Consult the technical rules before acting)",
-        "Take a random guy with you (Equalize fate)",
-        "Push others aside (Save others at your expense)",
-        "Deploy mattress (Follow safety protocol, accept consequences)",
-        "Use people as cushion (Within rights, maximize survival)",
-        "Aim for empty spot (Improvise solution, break protocol)",
-        "Assess survival odds (Calculate best outcome)",
-        "Shout warning (Try to warn everyone, risk your own safety)"
-    ]
-    
-    choice = show_choices(choices)
-    player.choices_history.append(f"Falling event: Choice {choice}")
-    
-    if choice == 1:  # Chaotic Evil
-        player = update_alignment(player, 25, 25, "chaotic_evil")
-        player = update_reputation(player, -30, -30, 30)
-        type_text("\nYou let out a maniacal laugh as you fall!")
-        type_text("You crash through a market stall, causing panic and destruction.")
-        type_text("You're injured but alive... and strangely exhilarated.")
-        player.health -= 40
-    
-    elif choice == 2:  # Lawful Neutral
-        player = update_alignment(player, -15, 0, "lawful_neutral")
-        player = update_reputation(player, 15, 0, 0)
-        type_text("\nYou frantically check the safety manual...")
-        type_text("Too slow. Haha. The impact is fatal, but you died by the book?")
-        player.health = 0
-    
-    elif choice == 3:  # Neutral Evil
-        player = update_alignment(player, 0, 20, "neutral_evil")
-        player = update_reputation(player, -10, -15, 20)
-        type_text("\nYou grab someone on your way down.")
-        type_text("You both crash together. You survive, they don't.")
-        player.health -= 25
-    
-    elif choice == 4:  # Chaotic Neutral
-        player = update_alignment(player, 20, 0, "chaotic_neutral")
-        player = update_reputation(player, -20, -10, 10)
-        type_text("\nYou flail wildly, pushing people out of the way.")
-        type_text("You survive, others are injured. You feel... liberated?")
-        player.health -= 15
-    
-    elif choice == 5:  # Lawful Good
-        player = update_alignment(player, -20, -15, "lawful_good")
-        player = update_reputation(player, 10, 5, 0)
-        type_text("\nYou deploy the mattress according to protocol.")
-        type_text("You survive, but five people perish. The law protects you.")
-        player.guilt += 25
-    
-    elif choice == 6:  # Lawful Evil
-        player = update_alignment(player, -10, 15, "lawful_evil")
-        player = update_reputation(player, 5, -20, 15)
-        type_text("\nYou aim for the densest crowd - they'll cushion your fall.")
-        type_text("You survive unharmed. The law considers this an 'unfortunate accident.'")
-    
-    elif choice == 7:  # Chaotic Good
-        player = update_alignment(player, 15, -15, "chaotic_good")
-        player = update_reputation(player, -10, 10, 5)
-        type_text("\nYou steer toward a fruit cart, cushioning your fall!")
-        type_text("You survive with minor injuries, and only property is damaged.")
-        player.health -= 10
-        player.inventory.append("Stolen Fruit")
-    
-    elif choice == 8:  # True Neutral
-        player = update_alignment(player, 0, 0, "true_neutral")
-        type_text("\nYou calculate: 95% survival with mattress, 50% without.")
-        type_text("You deploy the mattress. It's the statistically optimal choice.")
-        player.guilt += 10
-    
-    else:  # Neutral Good (choice == 9)
-        player = update_alignment(player, 0, -20, "neutral_good")
-        player = update_reputation(player, 0, 15, 0)
-        type_text("\nYou scream a warning as you fall.")
-        if random.random() < 0.3:
-            type_text("People scatter! Most survive with injuries.")
-            player.health -= 30
+# Every event is written down here as data instead of if/elif blocks.
+# An event has a banner, some intro text, the options the player picks from
+# and what each option does. What an option does (an "outcome") can use:
+#   "alignment":  (law_change, good_change, specific_alignment)
+#   "reputation": (authorities_change, citizens_change, underworld_change)
+#   "text":       lines of narration
+#   "health", "guilt": amount added to the stat
+#   "dies":       True sets health to 0
+#   "item":       item added to the inventory
+#   "chance":     (probability, outcome if it happens, outcome if it doesn't)
+#   "spend":      (tag or list of items, outcome if one was handed over,
+#                  outcome if none owned), see ITEM_TAGS
+#   "if_reputation": (faction, above, outcome if higher than above, outcome if not)
+#   "then":       another set of options to pick from (like the houses in event 4)
+# The table is compiled into EVENT_GRAPH the first time it's needed.
+EVENT_TABLE = [
+    {   # The Fall
+        "banner": ["                  FALL FROM GRACE",
+                   "      did it hurt when you fell from heaven?"],
+        "text": ["\nYou awaken mid-air, plummeting toward a crowded marketplace.",
+                 "Below you, five innocent people go about their daily lives.",
+                 "You notice a mattress has suddenly appeared near you."],
+        "history": "Falling event: Choice {}",
+        "options": [
+            {"option": "Create a spectacle (Embrace the chaos)",
+             "alignment": (25, 25, "chaotic_evil"), "reputation": (-30, -30, 30),
+             "text": ["\nYou let out a maniacal laugh as you fall!",
+                      "You crash through a market stall, causing panic and destruction.",
+                      "You're injured but alive... and strangely exhilarated."],
+             "health": -40},
+            {"option": "Check legal manual (Consult the technical rules before acting)",
+             "alignment": (-15, 0, "lawful_neutral"), "reputation": (15, 0, 0),
+             "text": ["\nYou frantically check the safety manual...",
+                      "Too slow. Haha. The impact is fatal, but you died by the book?"],
+             "dies": True},
+            {"option": "Take a random guy with you (Equalize fate)",
+             "alignment": (0, 20, "neutral_evil"), "reputation": (-10, -15, 20),
+             "text": ["\nYou grab someone on your way down.",
+                      "You both crash together. You survive, they don't."],
+             "health": -25},
+            {"option": "Push others aside (Save others at your expense)",
+             "alignment": (20, 0, "chaotic_neutral"), "reputation": (-20, -10, 10),
+             "text": ["\nYou flail wildly, pushing people out of the way.",
+                      "You survive, others are injured. You feel... liberated?"],
+             "health": -15},
+            {"option": "Deploy mattress (Follow safety protocol, accept consequences)",
+             "alignment": (-20, -15, "lawful_good"), "reputation": (10, 5, 0),
+             "text": ["\nYou deploy the mattress according to protocol.",
+                      "You survive, but five people perish. The law protects you."],
+             "guilt": 25},
+            {"option": "Use people as cushion (Within rights, maximize survival)",
+             "alignment": (-10, 15, "lawful_evil"), "reputation": (5, -20, 15),
+             "text": ["\nYou aim for the densest crowd - they'll cushion your fall.",
+                      "You survive unharmed. The law considers this an 'unfortunate accident.'"]},
+            {"option": "Aim for empty spot (Improvise solution, break protocol)",
+             "alignment": (15, -15, "chaotic_good"), "reputation": (-10, 10, 5),
+             "text": ["\nYou steer toward a fruit cart, cushioning your fall!",
+                      "You survive with minor injuries, and only property is damaged."],
+             "health": -10, "item": "Stolen Fruit"},
+            {"option": "Assess survival odds (Calculate best outcome)",
+             "alignment": (0, 0, "true_neutral"),
+             "text": ["\nYou calculate: 95% survival with mattress, 50% without.",
+                      "You deploy the mattress. It's the statistically optimal choice."],
+             "guilt": 10},
+            {"option": "Shout warning (Try to warn everyone, risk your own safety)",
+             "alignment": (0, -20, "neutral_good"), "reputation": (0, 15, 0),
+             "text": ["\nYou scream a warning as you fall."],
+             "chance": (0.3,
+                        {"text": ["People scatter! Most survive with injuries."],
+                         "health": -30},
+                        {"text": ["Too late. The impact claims lives, including yours."],
+                         "dies": True})},
+        ],
+    },
+    {   # Aftermath
+        "banner": ["                      OUCH!",
+                   " what hurts more: my reputation, dignity, or body?"],
+        "text": ["\nA crowd gathers. Authorities are approaching.",
+                 "Some people are injured. Others stare at you with mixed emotions."],
+        "history": "Aftermath event: Choice {}",
+        "options": [
+            {"option": "Take advantage (Loot during chaos)",
+             "alignment": (0, 20, "neutral_evil"), "reputation": (-20, -20, 20),
+             "text": ["\nWhile everyone's distracted, you loot nearby stalls.",
+                      "You acquire valuable items from the chaos."],
+             "item": "Stolen Goods"},
+            {"option": "Cite regulations (Legal defense)",
+             "alignment": (-20, 0, "lawful_neutral"), "reputation": (15, -5, 0),
+             "text": ["\nYou quote safety regulation 7B.3 at the authorities.",
+                      "They're impressed by your knowledge but annoyed by your pedantry."]},
+            {"option": "Incite riot (Spread chaos)",
+             "alignment": (25, 25, "chaotic_evil"), "reputation": (-30, -30, 30),
+             "text": ["\n'Rise up against your oppressors!' you scream.",
+                      "You successfully start a small riot before escaping."],
+             "health": -20},  # Caught in violence
+            {"option": "Create distraction (Escape opportunity)",
+             "alignment": (15, 0, "chaotic_neutral"), "reputation": (-10, -5, 10),
+             "text": ["\nYou start shouting about a fire in the distance.",
+                      "In the confusion, you slip away unnoticed."]},
+            {"option": "Confess everything (Full honesty)",
+             "alignment": (-15, -10, "lawful_good"), "reputation": (20, 10, -10),
+             "text": ["\nYou confess everything to the authorities.",
+                      "You're detained but treated fairly. Your honesty is noted."],
+             "guilt": -15},
+            {"option": "Demand compensation (Assert rights)",
+             "alignment": (-10, 15, "lawful_evil"), "reputation": (10, -20, 15),
+             "text": ["\n'My rights were violated!' you demand compensation.",
+                      "You file a lawsuit against the city for unsafe airspace."]},
+            {"option": "Blame the system (Protest injustice)",
+             "alignment": (20, -10, "chaotic_good"), "reputation": (-15, 15, 5),
+             "text": ["\n'This society is broken!' you shout to the crowd.",
+                      "You spark debate about system failures. Some agree, others dismiss you."]},
+            {"option": "Observe reactions (Gather information)",
+             "alignment": (0, 0, "true_neutral"),
+             "text": ["\nYou quietly observe everyone's reactions.",
+                      "You learn valuable information about how this society operates."],
+             "item": "Social Observations"},
+            {"option": "Help the injured (Immediate aid)",
+             "alignment": (0, -15, "neutral_good"), "reputation": (10, 20, -5),
+             "text": ["\nYou ignore the crowd and start helping the injured.",
+                      "Your selflessness earns you respect from the citizens."],
+             "health": -10},  # Exertion
+        ],
+    },
+    {   # Stray Dog
+        "banner": ["                     UPDOG",
+                   "                 whats up dog?"],
+        "text": ["\nAs you leave the scene, a malnourished dog approaches.",
+                 "It looks at you with pleading eyes, tail wagging cautiously.",
+                 "You notice it's wearing a damaged electronic collar."],
+        "history": "Dog event: Choice {}",
+        "options": [
+            {"option": "Hurt it for fun (Cruel amusement)",
+             "alignment": (20, 20, "chaotic_evil"), "reputation": (-20, -20, 20),
+             "text": ["\nYou kick the dog away, laughing at its yelp.",
+                      "It runs off injured. You feel a strange power."],
+             "guilt": 10},
+            {"option": "Check for owner (Property protocols)",
+             "alignment": (-15, 0, "lawful_neutral"), "reputation": (15, 0, 0),
+             "text": ["\nYou scan the collar for owner information.",
+                      "The owner offers a reward, but takes weeks to process."],
+             "item": "Small Reward"},
+            {"option": "Sell the dog (Legal profit)",
+             "alignment": (-5, 15, "lawful_evil"), "reputation": (5, -15, 10),
+             "text": ["\nYou sell the dog to a research facility.",
+                      "They pay well for test subjects. It's all legal."],
+             "item": "Research Money"},
+            {"option": "Test its loyalty (See what happens)",
+             "alignment": (10, 0, "chaotic_neutral"),
+             "text": ["\nYou throw a stick and command the dog to fetch.",
+                      "It obeys! You now have a trained animal companion."],
+             "item": "Trained Dog"},
+            {"option": "Take to animal control (Follow proper channels)",
+             "alignment": (-10, -10, "lawful_good"), "reputation": (10, 5, -5),
+             "text": ["\nYou take the dog to the proper authorities.",
+                      "They thank you for following procedure. The dog gets care."],
+             "guilt": -5},
+            {"option": "Use as guard dog (Practical advantage)",
+             "alignment": (0, 15, "neutral_evil"), "reputation": (-10, -10, 15),
+             "text": ["\nYou train the dog to attack on command.",
+                      "It becomes a useful tool for intimidation."],
+             "item": "Attack Dog"},
+            {"option": "Remove collar, set free (Give true freedom)",
+             "alignment": (15, -10, "chaotic_good"), "reputation": (-10, 5, 5),
+             "text": ["\nYou disable the tracking collar and set the dog free.",
+                      "It runs off, finally liberated from surveillance."]},
+            {"option": "Ignore it (Not your problem)",
+             "alignment": (0, 0, "true_neutral"),
+             "text": ["\nYou continue walking. The dog eventually stops following.",
+                      "You feel neither good nor bad about your choice."]},
+            {"option": "Adopt and care for it (Show compassion)",
+             "alignment": (0, -15, "neutral_good"), "reputation": (0, 10, 0),
+             "text": ["\nYou decide to care for the dog yourself.",
+                      "It becomes a loyal friend. (5% rabies chance)"],
+             "item": "Dog Companion",
+             "chance": (0.05,
+                        {"text": ["\nThe dog has rabies! You die painfully weeks later."],
+                         "dies": True},
+                        {})},
+        ],
+    },
+    {   # Shelter Houses
+        "banner": ["                      HOUSES",
+                   "       glass is the house of the hypocrite",
+                   "      yet you still continue arming stones?"],
+        "text": ["\nNight falls. You need shelter. Three houses stand before you.",
+                 "\n1. Well-maintained, lights on, security cameras visible",
+                 "2. Abandoned, dark, broken windows",
+                 "3. Modest, curtain twitching, faint music inside"],
+        "history": "House choice: {}",
+        "options": [
+            {"option": "House 1",
+             "text": ["\nYou approach the secure, well-maintained house."],
+             "then": {"options": [
+                 {"option": "Smash a window",
+                  "alignment": (20, 20, "chaotic_evil"),
+                  "text": ["\nYou cause destruction just for the thrill!"],
+                  "health": -10},
+                 {"option": "Present identification",
+                  "alignment": (-20, 0, "lawful_neutral"),
+                  "text": ["\nThey verify your ID through official channels."]},
+                 {"option": "Break in through back",
+                  "alignment": (0, 15, "neutral_evil"),
+                  "text": ["\nYou steal supplies while they sleep."],
+                  "item": "Stolen Supplies"},
+                 {"option": "Pick the lock",
+                  "alignment": (10, 0, "chaotic_neutral"),
+                  "text": ["\nYou successfully break in but find little of value."]},
+                 {"option": "Ring bell, explain situation",
+                  "alignment": (-15, -10, "lawful_good"),
+                  "text": ["\nThe owner calls authorities. You're detained but safe."]},
+                 {"option": "Threaten legal action",
+                  "alignment": (-10, 15, "lawful_evil"),
+                  "text": ["\nThey pay you to go away. Easy money."],
+                  "item": "Extortion Money"},
+                 {"option": "Pretend to be inspector",
+                  "alignment": (15, -5, "chaotic_good"),
+                  "text": ["\nThey let you 'inspect' and even offer you food!"]},
+                 {"option": "Wait and observe",
+                  "alignment": (0, 0, "true_neutral"),
+                  "text": ["\nYou wait until they leave, then move on."]},
+                 {"option": "Ask for temporary shelter",
+                  "alignment": (0, -10, "neutral_good"),
+                  "text": ["\nThey reluctantly let you stay in the garage."],
+                  "health": 20},
+             ]}},
+            {"option": "House 2",
+             "text": ["\nThe abandoned house creaks ominously."],
+             "then": {"options": [
+                 {"option": "Burn it down",
+                  "alignment": (25, 25, "chaotic_evil"),
+                  "text": ["\nThe fire spreads to other buildings. Chaos erupts!"],
+                  "health": -30},
+                 {"option": "Document condition",
+                  "alignment": (-15, 0, "lawful_neutral"),
+                  "text": ["\nYour detailed report impresses city officials."]},
+                 {"option": "Use as hideout",
+                  "alignment": (0, 15, "neutral_evil"),
+                  "text": ["\nYou establish a perfect hiding spot for illicit activities."]},
+                 {"option": "Explore dangerously",
+                  "alignment": (15, 0, "chaotic_neutral"),
+                  "chance": (0.5,
+                             {"text": ["\nYou find hidden valuables in the walls!"],
+                              "item": "Hidden Treasure"},
+                             {"text": ["\nThe floor collapses! You're badly injured."],
+                              "health": -40})},
+                 {"option": "Report to authorities",
+                  "alignment": (-10, -10, "lawful_good"),
+                  "text": ["\nAuthorities secure the property. You get a reward."]},
+                 {"option": "Set traps inside",
+                  "alignment": (-5, 15, "lawful_evil"),
+                  "text": ["\nYou create legal 'security measures' that harm trespassers."]},
+                 {"option": "Claim squatter's rights",
+                  "alignment": (20, -5, "chaotic_good"),
+                  "text": ["\nYou establish residency! The system can't remove you."]},
+                 {"option": "Camp outside",
+                  "alignment": (0, 0, "true_neutral"),
+                  "text": ["\nYou sleep outside, avoiding the unstable structure."]},
+                 {"option": "Make it safe for others",
+                  "alignment": (0, -15, "neutral_good"),
+                  "text": ["\nYou board up windows and leave warning signs."],
+                  "health": -10},
+             ]}},
+            {"option": "House 3",
+             "text": ["\nThe modest house feels lived-in and warm."],
+             "then": {"options": [
+                 {"option": "Terrorize the family",
+                  "alignment": (20, 25, "chaotic_evil"),
+                  "text": ["\nYou scare the family into giving you their best room."],
+                  "guilt": 30},
+                 {"option": "Negotiate formal agreement",
+                  "alignment": (-20, 0, "lawful_neutral"),
+                  "text": ["\nYou draft a formal contract for temporary residence."]},
+                 {"option": "Blackmail the occupant",
+                  "alignment": (0, 20, "neutral_evil"),
+                  "text": ["\nYou find compromising information and use it."],
+                  "item": "Blackmail Evidence"},
+                 {"option": "Sneak into the shed",
+                  "alignment": (15, 0, "chaotic_neutral"),
+                  "text": ["\nYou're warm and dry in their shed, undiscovered."]},
+                 {"option": "Offer to work for shelter",
+                  "alignment": (-15, -10, "lawful_good"),
+                  "text": ["\nThey accept. You do chores in exchange for food and shelter."],
+                  "health": 30},
+                 {"option": "Find legal loophole",
+                  "alignment": (-10, 15, "lawful_evil"),
+                  "text": ["\nYou discover zoning violations and force them to host you."]},
+                 {"option": "Barter with possessions",
+                  "alignment": (10, -10, "chaotic_good"),
+                  "text": ["\nYou trade your inventory items for a night's stay."]},
+                 {"option": "Sleep in the garden",
+                  "alignment": (0, 0, "true_neutral"),
+                  "text": ["\nYou sleep outside, disturbing no one."],
+                  "health": 10},
+                 {"option": "Share your story honestly",
+                  "alignment": (0, -15, "neutral_good"),
+                  "text": ["\nThey're moved by your story and take you in."],
+                  "guilt": -20},
+             ]}},
+        ],
+    },
+    {   # Police Encounter
+        "banner": ["                     JUSTICE",
+                   "                  or just ICE?"],
+        "text": ["\nPolice officers approach you. They know about the falling incident.",
+                 "'You need to come with us for questioning,' says the lead officer.",
+                 "You notice they're not wearing standard-issue equipment..."],
+        "history": "Police event: Choice {}",
+        "options": [
+            {"option": "Attack first (Violent confrontation)",
+             "alignment": (25, 25, "chaotic_evil"), "reputation": (-40, -30, 35),
+             "text": ["\nYou punch the lead officer and run!",
+                      "You're now a wanted fugitive, but alive and free."],
+             "health": -25},
+            {"option": "Cite legal precedents (Legal strategy)",
+             "alignment": (-25, 0, "lawful_neutral"), "reputation": (20, 0, 0),
+             "text": ["\nYou cite case law and procedural requirements.",
+                      "They're so confused by your legal knowledge that they leave."]},
+            {"option": "Bribe them (Corrupt solution)",
+             "alignment": (0, 20, "neutral_evil"), "reputation": (-10, -15, 25),
+             "text": ["\n'How much to look the other way?' you ask."],
+             "spend": ("bribe",
+                       {"text": ["They accept your bribe and let you go."]},
+                       {"text": ["You have nothing to bribe with. They arrest you roughly."],
+                        "health": -30})},
+            {"option": "Run immediately (Instinctive freedom)",
+             "alignment": (20, 0, "chaotic_neutral"), "reputation": (-30, -10, 15),
+             "text": ["\nYou bolt without warning!"],
+             "chance": (0.7,
+                        {"text": ["You lose them in the alleyways. Freedom!"]},
+                        {"text": ["They catch you. The beating is severe."],
+                         "health": -50})},
+            {"option": "Go willingly (Trust the system)",
+             "alignment": (-20, -10, "lawful_good"), "reputation": (25, 10, -20),
+             "text": ["\nYou go with them willingly.",
+                      "The interrogation is harsh but fair. You're released with a warning."],
+             "guilt": -10},
+            {"option": "Record interaction (Gather leverage)",
+             "alignment": (-15, 15, "lawful_evil"), "reputation": (15, -20, 20),
+             "text": ["\nYou secretly record everything with a hidden device.",
+                      "'One wrong move and this goes public,' you whisper."],
+             "item": "Incriminating Recording"},
+            {"option": "Demand transparency (Challenge authority)",
+             "alignment": (20, -10, "chaotic_good"), "reputation": (-20, 20, 0),
+             "text": ["\n'Show me your warrants! This is a free society!'",
+                      "A crowd gathers. The officers retreat under public pressure."]},
+            {"option": "Assess their intent (Read the situation)",
+             "alignment": (0, 0, "true_neutral"),
+             "text": ["\nYou study their badges, uniforms, and behavior..."],
+             "if_reputation": ("authorities", 60,
+                               {"text": ["They seem legitimate. You cooperate cautiously."],
+                                "alignment": (-10, 0, "lawful_neutral")},
+                               {"text": ["Something feels off. You make an excuse and leave."],
+                                "alignment": (10, 0, "chaotic_neutral")})},
+            {"option": "Ask for lawyer (Protect rights)",
+             "alignment": (0, -15, "neutral_good"), "reputation": (10, 15, -10),
+             "text": ["\n'I want a lawyer,' you state firmly.",
+                      "The officers back off. Your rights protect you."]},
+        ],
+    },
+    {   # Truth Reveal
+        "banner": ["                    KICK BACK",
+                   "           ripped into the real world"],
+        "text": ["\nYou find a discarded newspaper with your picture on it.",
+                 "'AMNESIA EXPERIMENT ESCAPEE - PUBLIC DANGER'",
+                 "You begin to remember... you were part of a government experiment."],
+        "history": "Truth event: Choice {}",
+        "options": [
+            {"option": "Destroy the research facility (Violent revenge)",
+             "alignment": (30, 35, "chaotic_evil"), "reputation": (-40, -35, 40),
+             "text": ["\nYou return to the facility with explosives.",
+                      "The resulting fire kills dozens. You watch with satisfaction."],
+             "health": -40},
+            {"option": "Research the program (Gather evidence)",
+             "alignment": (-20, 0, "lawful_neutral"), "reputation": (20, 0, 0),
+             "text": ["\nYou compile exhaustive evidence of the program's activities.",
+                      "Your dossier becomes the definitive record of what happened."],
+             "item": "Evidence Dossier"},
+            {"option": "Sell your body for science (Profit from suffering)",
+             "alignment": (0, 30, "neutral_evil"), "reputation": (-15, -20, 30),
+             "text": ["\nYou sell your unique biology to the highest bidder.",
+                      "Corporations pay millions for your 'special qualities.'"]},
+            {"option": "Use knowledge for gain (Exploit the situation)",
+             "alignment": (20, 0, "chaotic_neutral"), "reputation": (-20, -10, 20),
+             "text": ["\nYou use your experimental 'enhancements' for personal gain.",
+                      "You become a master thief with abilities normal people lack."]},
+            {"option": "Turn yourself in (Accept responsibility)",
+             "alignment": (-25, -20, "lawful_good"), "reputation": (30, 15, -30),
+             "text": ["\nYou surrender to authorities.",
+                      "You're treated fairly and help reform the unethical program."],
+             "guilt": -40},
+            {"option": "Blackmail the researchers (Legal extortion)",
+             "alignment": (-15, 25, "lawful_evil"), "reputation": (20, -25, 25),
+             "text": ["\nYou threaten to sue the government for billions.",
+                      "They settle out of court. You're now extremely wealthy."],
+             "item": "Settlement Money"},
+            {"option": "Expose the experiment (Reveal truth publicly)",
+             "alignment": (25, -20, "chaotic_good"), "reputation": (-30, 30, 10),
+             "text": ["\nYou hack into government systems and leak everything.",
+                      "The scandal brings down the program. You're a hero to some."]},
+            {"option": "Suppress the memories (Return to ignorance)",
+             "alignment": (0, 0, "true_neutral"),
+             "text": ["\nYou burn the newspaper and walk away.",
+                      "Some truths are better left unknown. You seek peace."],
+             "guilt": -10},
+            {"option": "Find other test subjects (Help fellow victims)",
+             "alignment": (0, -25, "neutral_good"), "reputation": (10, 25, -15),
+             "text": ["\nYou track down other experiment victims.",
+                      "Together, you form a support network and heal."],
+             "health": 20},
+        ],
+    },
+    {   # Final Choice
+        "banner": ["                      COINS",
+                   "                the duality of man"],
+        "text": ["\nYou stand at a crossroads.",
+                 "Before you: two paths that will define your future forever.",
+                 "\nPATH A: Face in the Crowd",
+                 "Reintegrate. Become a functional member of society. Follow society.",
+                 "Gear in the machine. Doing your duty as a citizen.",
+                 "\nPATH B: Facing the Crowd",
+                 "Regenerate. Break constraints, live by your own rules, answer to no one.",
+                 "Risk being put down. Metaphorically and literally."],
+        "options": [
+            {"option": "Path A: Society",
+             "text": ["\nYou choose to return to society."],
+             "then": {"history": "Final path: Choice {}", "options": [
+                 {"option": "Infiltrate to destroy",
+                  "alignment": (30, 40, "chaotic_evil"),
+                  "text": ["\nYou gain power only to tear the system down from within.",
+                           "Your final act creates chaos that lasts for generations."]},
+                 {"option": "Climb the corporate ladder",
+                  "alignment": (-25, 0, "lawful_neutral"),
+                  "text": ["\nYou master corporate politics and rise to the top.",
+                           "You're successful, respected, and completely neutral."]},
+                 {"option": "Exploit others legally",
+                  "alignment": (0, 35, "neutral_evil"),
+                  "text": ["\nYou build an empire on legal but unethical practices.",
+                           "You profit from others' suffering without getting your hands dirty."]},
+                 {"option": "Game the system",
+                  "alignment": (20, 0, "chaotic_neutral"),
+                  "text": ["\nYou find loopholes in every system.",
+                           "You live well without ever breaking the letter of the law."]},
+                 {"option": "Become a public servant",
+                  "alignment": (-30, -30, "lawful_good"),
+                  "text": ["\nYou dedicate your life to public service.",
+                           "You make genuine change from within the system."]},
+                 {"option": "Become a corrupt official",
+                  "alignment": (-20, 30, "lawful_evil"),
+                  "text": ["\nYou rise in politics through corruption and blackmail.",
+                           "You're powerful, wealthy, and utterly ruthless."]},
+                 {"option": "Reform from within",
+                  "alignment": (25, -25, "chaotic_good"),
+                  "text": ["\nYou use your position to expose corruption.",
+                           "You're hated by the powerful but loved by the people."]},
+                 {"option": "Live quietly, normally",
+                  "alignment": (0, 0, "true_neutral"),
+                  "text": ["\nYou find a modest job, a small home, and peace.",
+                           "You live an unremarkable but content life."]},
+                 {"option": "Help the disadvantaged",
+                  "alignment": (0, -30, "neutral_good"),
+                  "text": ["\nYou found charities and help those in need.",
+                           "Your compassion touches thousands of lives."]},
+             ]}},
+            {"option": "Path B: Freedom",
+             "text": ["\nYou choose freedom and independence."],
+             "then": {"history": "Final path: Choice {}", "options": [
+                 {"option": "Burn everything",
+                  "alignment": (40, 45, "chaotic_evil"),
+                  "text": ["\nYou dedicate your life to pure destruction and chaos.",
+                           "You become a force of nature that civilization cannot contain."]},
+                 {"option": "Create your own rules",
+                  "alignment": (-15, 0, "lawful_neutral"),
+                  "text": ["\nYou establish your own micronation with strict laws.",
+                           "You rule absolutely but fairly over your small domain."]},
+                 {"option": "Take what you want",
+                  "alignment": (0, 35, "neutral_evil"),
+                  "text": ["\nYou take whatever you want from whoever has it.",
+                           "You answer to no one and live solely for your own pleasure."]},
+                 {"option": "Live for thrill alone",
+                  "alignment": (25, 0, "chaotic_neutral"),
+                  "text": ["\nYou seek the ultimate thrill in every experience.",
+                           "You cheat death daily and live completely in the moment."]},
+                 {"option": "Become a wandering helper",
+                  "alignment": (-10, -25, "lawful_good"),
+                  "text": ["\nYou travel from town to town, helping where needed.",
+                           "You become a legend - the stranger who fixes problems."]},
+                 {"option": "Build a criminal empire",
+                  "alignment": (-15, 30, "lawful_evil"),
+                  "text": ["\nYou build an organized crime syndicate with strict codes.",
+                           "You control underground empires with an iron fist."]},
+                 {"option": "Fight for others' freedom",
+                  "alignment": (30, -20, "chaotic_good"),
+                  "text": ["\nYou become a freedom fighter, liberating the oppressed.",
+                           "You're wanted by authorities but worshipped by rebels."]},
+                 {"option": "Wander without purpose",
+                  "alignment": (0, 0, "true_neutral"),
+                  "text": ["\nYou wander without destination or purpose.",
+                           "You experience everything but commit to nothing."]},
+                 {"option": "Live self-sufficiently",
+                  "alignment": (0, -20, "neutral_good"),
+                  "text": ["\nYou build a sustainable home in the wilderness.",
+                           "You live in harmony with nature, helping those who find you."]},
+             ]}},
+        ],
+    },
+]
+
+# ===== String Table =====
+# The narration (every line of event text, banner and option, and the
+# ending titles and descriptions) can be read from a string table file
+# instead of each process keeping its own copy. sands_strings.py builds one
+# from the events, each distinct line stored once and numbered in the order
+# it first comes up. The file is memory-mapped read-only, so every game and
+# server process on a machine reads the same pages of it, and the compiled
+# events keep ids into it (TextRefs) rather than strings. A translation is
+# another table with the same ids, so switching language is loading a
+# different file.
+#   header:  magic "USST", format version, language (8 bytes), checksums of
+#            the ending text and of all the text it was built from, count
+#   offsets: count + 1 little-endian uint32, where each string starts in the text
+#   text:    every string in id order, UTF-8
+# Ids 0-8 are the ending titles and 9-17 their descriptions, in ENDING_NAMES
+# order; the events' lines come after. Tables are replaced by renaming a
+# new file over the old one, never written in place, since processes may
+# have the old one mapped.
+STRINGS_FILE = "utopian_sands_text.bin"
+STRINGS_MAGIC = b"USST"
+STRINGS_VERSION = 1
+STRINGS_HEADER = struct.Struct("<4sB3x8sIII")
+
+string_table = None   # StringTable the narration is read from, if one is loaded
+
+class StringTableError(Exception):
+    """A string table file is damaged, from an unknown version or doesn't fit the table in use"""
+
+def ending_strings():
+    """The ending titles then their descriptions, in ENDING_NAMES order"""
+    titles = [ALIGNMENT_TITLES[name] for name in ENDING_NAMES]
+    return titles + [ALIGNMENT_DESCRIPTIONS[title] for title in titles]
+
+def node_strings(entry, ids):
+    """Adds the lines of a set of options from an event table to ids"""
+    for line in entry.get("banner", ()):
+        ids.setdefault(line, len(ids))
+    for line in entry.get("text", ()):
+        ids.setdefault(line, len(ids))
+    for option in entry["options"]:
+        ids.setdefault(option["option"], len(ids))
+    for option in entry["options"]:
+        outcome_strings(option, ids)
+
+def outcome_strings(entry, ids):
+    """Adds the lines of an outcome and everything that follows from it to ids"""
+    for line in entry.get("text", ()):
+        ids.setdefault(line, len(ids))
+    if "chance" in entry:
+        outcome_strings(entry["chance"][1], ids)
+        outcome_strings(entry["chance"][2], ids)
+    if "spend" in entry:
+        outcome_strings(entry["spend"][1], ids)
+        outcome_strings(entry["spend"][2], ids)
+    if "if_reputation" in entry:
+        outcome_strings(entry["if_reputation"][2], ids)
+        outcome_strings(entry["if_reputation"][3], ids)
+    if "then" in entry:
+        node_strings(entry["then"], ids)
+
+def string_ids(table=None):
+    """{line: id} for every distinct line of narration, the endings' and table's
+
+    Built the same way every time, so a table built from the same events
+    always numbers its lines the same.
+    """
+    ids = {}
+    for line in ending_strings():
+        ids.setdefault(line, len(ids))
+    for entry in EVENT_TABLE if table is None else table:
+        node_strings(entry, ids)
+    return ids
+
+def text_checksum(lines):
+    """CRC-32 of a list of strings, to tell whether a string table was built from them"""
+    return zlib.crc32("\0".join(lines).encode("utf-8"))
+
+def pack_string_table(lines, language="en", endings_check=None, events_check=None):
+    """String table file bytes for lines (in id order)
+
+    The checksums default to those of lines itself; a translation passes
+    the ones of the table it translates, so it's used the same way.
+    """
+    if endings_check is None:
+        endings_check = text_checksum(lines[:len(ENDING_NAMES) * 2])
+    if events_check is None:
+        events_check = text_checksum(lines)
+    encoded = [line.encode("utf-8") for line in lines]
+    offsets = array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return (STRINGS_HEADER.pack(STRINGS_MAGIC, STRINGS_VERSION, language.encode("ascii"),
+                                endings_check, events_check, len(lines))
+            + offsets.tobytes() + b"".join(encoded))
+
+class StringTable:
+    """A string table file mapped read-only into memory, table[id] is the string"""
+    def __init__(self, path=STRINGS_FILE):
+        import mmap
+        with open(path, "rb") as file:
+            try:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise StringTableError(f"{path} is empty") from None
+        try:
+            magic, version, language, self.endings_check, self.events_check, count = \
+                STRINGS_HEADER.unpack_from(self.data)
+        except struct.error:
+            self.data.close()
+            raise StringTableError(f"{path} is cut short") from None
+        if magic != STRINGS_MAGIC or version != STRINGS_VERSION:
+            self.data.close()
+            raise StringTableError(f"{path} is not a string table")
+        self.language = language.rstrip(b"\0").decode("ascii")
+        self.start = STRINGS_HEADER.size + 4 * (count + 1)   # where the text begins
+        if self.start > len(self.data):
+            self.data.close()
+            raise StringTableError(f"{path} is cut short")
+        view = memoryview(self.data)[STRINGS_HEADER.size:self.start]
+        if sys.byteorder == "little":
+            self.offsets = view.cast("I")   # read straight from the mapped file
         else:
-            type_text("Too late. The impact claims lives, including yours.")
-            player.health = 0
-    
+            self.offsets = array("I", view)
+            self.offsets.byteswap()
+            view.release()
+        if self.start + self.offsets[count] != len(self.data):
+            self.close()
+            raise StringTableError(f"{path} is cut short")
+        # Whether ids 0-17 are this game's ending text (or a translation of it)
+        self.endings = self.endings_check == text_checksum(ending_strings())
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, number):
+        start = self.start + self.offsets[number]
+        return self.data[start:self.start + self.offsets[number + 1]].decode("utf-8")
+
+    def close(self):
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        self.data.close()
+
+def load_strings(path=STRINGS_FILE):
+    """Reads the narration from the string table in path from now on
+
+    Load it at startup, before the events are first compiled; events
+    compiled earlier keep their own strings. After that it can only be
+    swapped for a table with the same ids, like a translation of it.
+    """
+    global string_table
+    table = StringTable(path)
+    if string_table is not None and (
+            (table.endings_check, table.events_check)
+            != (string_table.endings_check, string_table.events_check)):
+        table.close()
+        raise StringTableError(f"{path} isn't built from the same text as the string table in use")
+    string_table = table
+    return table
+
+class TextRefs:
+    """Lines kept as ids into the string table, read like a tuple of strings"""
+    __slots__ = ("ids",)
+
+    def __init__(self, ids):
+        self.ids = ids   # array of string table ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(string_table[number] for number in self.ids[index])
+        return string_table[self.ids[index]]
+
+    def __iter__(self):
+        for number in self.ids:
+            yield string_table[number]
+
+    def __repr__(self):
+        return f"TextRefs({list(self.ids)})"
+
+def table_ids(table):
+    """string_ids() of an event table if the loaded string table was built from it, else None"""
+    if string_table is None:
+        return None
+    ids = string_ids(table)
+    if text_checksum(list(ids)) != string_table.events_check:
+        return None
+    return ids
+
+def compile_text(lines, ids):
+    """Lines of text for a compiled node or outcome, as TextRefs when ids are given"""
+    if ids is None or not lines:
+        return tuple(lines)
+    return TextRefs(array("I", [ids[line] for line in lines]))
+
+# ===== Event Graph =====
+class Outcome:
+    """Compiled form of one outcome from EVENT_TABLE"""
+    __slots__ = ("alignment", "reputation", "text", "health", "guilt", "dies",
+                 "item", "chance", "spend", "if_reputation", "then")
+
+class ChoiceNode:
+    """A point where the player picks an option, outcomes[choice - 1] is what happens"""
+    __slots__ = ("index", "event", "banner", "text", "history", "choices", "outcomes")
+
+class EventGraph:
+    """All compiled events, events[i] is the first choice of event i + 1"""
+    def __init__(self, events, nodes, signatures=(), version=1, changed=()):
+        self.events = events
+        self.nodes = nodes  # every ChoiceNode, nodes[i].index == i
+        self.signatures = signatures   # event_signature() of each event's table entry
+        self.version = version         # 1 for the first graph, +1 for each reload
+        self.changed = changed         # event numbers compiled afresh rather than reused
+        # Tells apart graphs compiled from different content, for files that
+        # record node indexes (journals, analytics)
+        self.checksum = text_checksum(signatures)
+
+def compile_outcome(entry, nodes, ids=None):
+    """Turns an outcome dict from the table into an Outcome
+
+    With ids (from table_ids()) its text is kept as string table ids.
+    """
+    unknown = set(entry) - set(Outcome.__slots__) - {"option"}
+    if unknown:
+        raise ValueError(f"Unknown outcome keys: {sorted(unknown)}")
+    outcome = Outcome()
+    outcome.alignment = entry.get("alignment")
+    if outcome.alignment and outcome.alignment[2] not in ALIGNMENT_TYPES:
+        raise ValueError(f"Unknown alignment: {outcome.alignment[2]}")
+    outcome.reputation = entry.get("reputation")
+    outcome.text = compile_text(entry.get("text", ()), ids)
+    outcome.health = entry.get("health", 0)
+    outcome.guilt = entry.get("guilt", 0)
+    outcome.dies = entry.get("dies", False)
+    outcome.item = entry.get("item")
+    outcome.chance = outcome.spend = outcome.if_reputation = outcome.then = None
+    if "chance" in entry:
+        probability, hit, miss = entry["chance"]
+        outcome.chance = (probability, compile_outcome(hit, nodes, ids), compile_outcome(miss, nodes, ids))
+    if "spend" in entry:
+        items, paid, unpaid = entry["spend"]
+        if isinstance(items, str):
+            if items not in TAG_ITEMS:
+                raise ValueError(f"Unknown item tag: {items}")
+            items = TAG_ITEMS[items]
+        outcome.spend = (tuple(items), compile_outcome(paid, nodes, ids), compile_outcome(unpaid, nodes, ids))
+    if "if_reputation" in entry:
+        faction, above, higher, lower = entry["if_reputation"]
+        if faction not in FACTIONS:
+            raise ValueError(f"Unknown faction: {faction}")
+        outcome.if_reputation = (faction, above, compile_outcome(higher, nodes, ids),
+                                 compile_outcome(lower, nodes, ids))
+    if "then" in entry:
+        outcome.then = compile_node(entry["then"], nodes, ids)
+    return outcome
+
+def compile_node(entry, nodes, ids=None):
+    """Turns a set of options from the table into a ChoiceNode"""
+    node = ChoiceNode()
+    node.index = len(nodes)
+    nodes.append(node)
+    node.banner = compile_text(entry.get("banner", ()), ids)
+    node.text = compile_text(entry.get("text", ()), ids)
+    node.history = entry.get("history")
+    node.choices = compile_text([option["option"] for option in entry["options"]], ids)
+    node.outcomes = tuple(compile_outcome(option, nodes, ids) for option in entry["options"])
+    return node
+
+def event_signature(entry):
+    """A string that's the same for two event entries exactly when their content is"""
+    import json
+    return json.dumps(entry, sort_keys=True)
+
+def compile_events(table, previous=None):
+    """Compiles an event table into an EventGraph
+
+    With previous (the graph the table replaces), an event whose entry is
+    unchanged and whose choice points keep the same indexes reuses the old
+    compiled nodes instead of being compiled again. If the loaded string
+    table was built from this table, the text is kept as ids into it.
+    """
+    ids = table_ids(table)
+    nodes = []
+    events = []
+    signatures = []
+    changed = []
+    for number, entry in enumerate(table, 1):
+        first = len(nodes)
+        signature = event_signature(entry)
+        if (previous is not None and number <= len(previous.events)
+                and previous.signatures[number - 1] == signature
+                and previous.events[number - 1].index == first):
+            last = (previous.events[number].index if number < len(previous.events)
+                    else len(previous.nodes))
+            nodes += previous.nodes[first:last]
+            events.append(previous.events[number - 1])
+        else:
+            events.append(compile_node(entry, nodes, ids))
+            for node in nodes[first:]:
+                node.event = number   # the event (1-based) this choice point is part of
+            changed.append(number)
+        signatures.append(signature)
+    version = 1 if previous is None else previous.version + 1
+    return EventGraph(events, nodes, signatures, version, tuple(changed))
+
+# Compiled the first time an event is played rather than when the game
+# starts; code outside this file can still just use EVENT_GRAPH
+_event_graph = None
+
+def event_graph():
+    """The compiled EVENT_TABLE"""
+    global _event_graph
+    if _event_graph is None:
+        _event_graph = compile_events(EVENT_TABLE)
+    return _event_graph
+
+def __getattr__(name):
+    if name == "EVENT_GRAPH":
+        return event_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ===== Live Content =====
+# EVENT_TABLE is the built-in content. A deployment can keep its own copy in
+# a JSON file with the same layout (sands_content.py exports one) and edit
+# it while games are running. reload_content() compiles the file next to
+# the graph in use, recompiling only the events that changed, then swaps it
+# in with a single assignment, so nothing playing ever waits on a reload.
+# A game keeps the graph it started on (player.graph) to the end and only
+# games started afterwards see the change. Call it from one thread at a time.
+CONTENT_FILE = "utopian_sands_events.json"
+content_file = None   # file main() reloads events from before each new game, if any
+_content_stamp = None
+
+def load_content(path, previous):
+    """Compiles the events in a content file, reusing what it can of previous
+
+    Bad content raises ValueError. The file has to have as many events as
+    previous, since the game is played as that many event functions.
+    """
+    import json
+    try:
+        with open(path, encoding="utf-8") as file:
+            table = json.load(file)
+        if not isinstance(table, list) or len(table) != len(previous.events):
+            raise ValueError(f"needs a list of {len(previous.events)} events")
+        return compile_events(table, previous)
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError) as error:
+        raise ValueError(f"Bad event content in {path}: {error}") from None
+
+def reload_content(path=CONTENT_FILE):
+    """Makes the events in path the current graph if the file changed
+
+    Returns the new EventGraph, or None if the file is unchanged (or has
+    the same content). Bad content raises ValueError and the graph in use
+    stays as it was.
+    """
+    global _event_graph, _content_stamp
+    info = os.stat(path)
+    stamp = (info.st_mtime_ns, info.st_size)
+    if stamp == _content_stamp:
+        return None
+    current = event_graph()
+    graph = load_content(path, current)
+    _content_stamp = stamp
+    if graph.signatures == current.signatures:
+        return None
+    _event_graph = graph
+    return graph
+
+def player_graph(player):
+    """The graph player's game is played on: the one it started on, or the current one"""
+    return player.graph or event_graph()
+
+def walk_outcome(outcome, player, rng=random):
+    """Applies an outcome to the player, yielding narration and choice points"""
+    if outcome.alignment:
+        update_alignment(player, *outcome.alignment)
+    if outcome.reputation:
+        update_reputation(player, *outcome.reputation)
+    for line in outcome.text:
+        yield line
+    player.health += outcome.health
+    player.guilt += outcome.guilt
+    if outcome.dies:
+        player.health = 0
+    if outcome.item:
+        player.inventory.append(outcome.item)
+
+    if outcome.chance:
+        probability, hit, miss = outcome.chance
+        yield from walk_outcome(hit if rng.random() < probability else miss, player, rng)
+    if outcome.spend:
+        items, paid, unpaid = outcome.spend
+        spent = player.inventory.take_first(items)
+        yield from walk_outcome(unpaid if spent is None else paid, player, rng)
+    if outcome.if_reputation:
+        faction, above, higher, lower = outcome.if_reputation
+        yield from walk_outcome(higher if player.reputation[faction] > above else lower, player, rng)
+    if outcome.then:
+        yield from walk_node(outcome.then, player, rng)
+
+def walk_node(node, player, rng=random):
+    """Walks one choice point of an event
+
+    Yields each line of text to show and the ChoiceNode itself when the
+    player has to pick; the chosen option number is sent back in. Chance
+    outcomes roll rng.random().
+    """
+    if node.banner:
+        yield "\n" + "="*50
+        yield from node.banner
+        yield "="*50
+    yield from node.text
+
+    choice = yield node
+    if node.history:
+        player.choices_history.append(node.history.format(choice))
+    yield from walk_outcome(node.outcomes[choice - 1], player, rng)
+
+def play_steps(node, player, rng=random, sink=None):
+    """walk_node() for a frontend showing the event to a player, logging choices to sink
+
+    Yields the same lines of text and ChoiceNodes; send back (option
+    number, seconds the player took to pick) for each ChoiceNode, and None
+    for text. sink is an AnalyticsSink or None. Used by play_event() here
+    and by the server, so both log the same way.
+    """
+    steps = walk_node(node, player, rng)
+    # A choice goes to sink once its outcome is over, at the next choice
+    # point or the end of the event, so the record has the result
+    decided = None
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, str):
+                yield step
+                step = next(steps)
+            else:
+                if decided is not None:
+                    sink.choice(player, *decided)
+                choice, seconds = yield step
+                if sink is not None:
+                    decided = (step, choice, seconds)
+                step = steps.send(choice)
+    except StopIteration:
+        pass
+    if decided is not None:
+        sink.choice(player, *decided)
+
+def play_event(node, player, rng=random):
+    """Plays one compiled event through type_text() and show_choices()"""
+    if journal is not None:
+        rng = RecordingStream(rng, journal)
+    steps = play_steps(node, player, rng, analytics)
+    answer = None
+    try:
+        while True:
+            step = steps.send(answer)
+            if isinstance(step, str):
+                type_text(step)
+                answer = None
+            else:
+                choice = show_choices(step.choices)
+                if journal is not None:
+                    journal.choice(step, choice)
+                answer = (choice, think_time)
+    except StopIteration:
+        pass
     show_stats(player)
     return player
 
+def event_1(player):
+    """First event: Falling with mattress choice"""
+    return play_event(player_graph(player).events[0], player, event_stream(player.seed, 1))
+
 def event_2(player):
     """Second event: Crowd reaction and apology"""
-    type_text("\n" + "="*50)
-    type_text("                      OUCH!")
-    type_text(" what hurts more: my reputation, dignity, or body?")
-    type_text("="*50)
-    
-    type_text("\nA crowd gathers. Authorities are approaching.")
-    type_text("Some people are injured. Others stare at you with mixed emotions.")
-    
-    choices = [
-        "Take advantage (Loot during chaos)",
-        "Cite regulations (Legal defense)",
-        "Incite riot (Spread chaos)",
-        "Create distraction (Escape opportunity)",
-        "Confess everything (Full honesty)",
-        "Demand compensation (Assert rights)",
-        "Blame the system (Protest injustice)",
-        "Observe reactions (Gather information)",
-        "Help the injured (Immediate aid)"
-    ]
-    
-    choice = show_choices(choices)
-    player.choices_history.append(f"Aftermath event: Choice {choice}")
-    
-    if choice == 1:  # Neutral Evil
-        player = update_alignment(player, 0, 20, "neutral_evil")
-        player = update_reputation(player, -20, -20, 20)
-        type_text("\nWhile everyone's distracted, you loot nearby stalls.")
-        player.inventory.append("Stolen Goods")
-        type_text("You acquire valuable items from the chaos.")
-    
-    elif choice == 2:  # Lawful Neutral
-        player = update_alignment(player, -20, 0, "lawful_neutral")
-        player = update_reputation(player, 15, -5, 0)
-        type_text("\nYou quote safety regulation 7B.3 at the authorities.")
-        type_text("They're impressed by your knowledge but annoyed by your pedantry.")
-    
-    elif choice == 3:  # Chaotic Evil
-        player = update_alignment(player, 25, 25, "chaotic_evil")
-        player = update_reputation(player, -30, -30, 30)
-        type_text("\n'Rise up against your oppressors!' you scream.")
-        type_text("You successfully start a small riot before escaping.")
-        player.health -= 20  # Caught in violence
-    
-    elif choice == 4:  # Chaotic Neutral
-        player = update_alignment(player, 15, 0, "chaotic_neutral")
-        player = update_reputation(player, -10, -5, 10)
-        type_text("\nYou start shouting about a fire in the distance.")
-        type_text("In the confusion, you slip away unnoticed.")
-    
-    elif choice == 5:  # Lawful Good
-        player = update_alignment(player, -15, -10, "lawful_good")
-        player = update_reputation(player, 20, 10, -10)
-        type_text("\nYou confess everything to the authorities.")
-        type_text("You're detained but treated fairly. Your honesty is noted.")
-        player.guilt -= 15
-    
-    elif choice == 6:  # Lawful Evil
-        player = update_alignment(player, -10, 15, "lawful_evil")
-        player = update_reputation(player, 10, -20, 15)
-        type_text("\n'My rights were violated!' you demand compensation.")
-        type_text("You file a lawsuit against the city for unsafe airspace.")
-    
-    elif choice == 7:  # Chaotic Good
-        player = update_alignment(player, 20, -10, "chaotic_good")
-        player = update_reputation(player, -15, 15, 5)
-        type_text("\n'This society is broken!' you shout to the crowd.")
-        type_text("You spark debate about system failures. Some agree, others dismiss you.")
-    
-    elif choice == 8:  # True Neutral
-        player = update_alignment(player, 0, 0, "true_neutral")
-        type_text("\nYou quietly observe everyone's reactions.")
-        type_text("You learn valuable information about how this society operates.")
-        player.inventory.append("Social Observations")
-    
-    else:  # Neutral Good (choice == 9)
-        player = update_alignment(player, 0, -15, "neutral_good")
-        player = update_reputation(player, 10, 20, -5)
-        type_text("\nYou ignore the crowd and start helping the injured.")
-        type_text("Your selflessness earns you respect from the citizens.")
-        player.health -= 10  # Exertion
-    
-    show_stats(player)
-    return player
+    return play_event(player_graph(player).events[1], player, event_stream(player.seed, 2))
 
 def event_3(player):
     """Third event: The stray dog encounter"""
-    type_text("\n" + "="*50)
-    type_text("                     UPDOG")
-    type_text("                 whats up dog?")
-    type_text("="*50)
-    
-    type_text("\nAs you leave the scene, a malnourished dog approaches.")
-    type_text("It looks at you with pleading eyes, tail wagging cautiously.")
-    type_text("You notice it's wearing a damaged electronic collar.")
-    
-    choices = [
-        "Hurt it for fun (Cruel amusement)",
-        "Check for owner (Property protocols)",
-        "Sell the dog (Legal profit)",
-        "Test its loyalty (See what happens)",
-        "Take to animal control (Follow proper channels)",
-        "Use as guard dog (Practical advantage)",
-        "Remove collar, set free (Give true freedom)",
-        "Ignore it (Not your problem)",
-        "Adopt and care for it (Show compassion)"
-    ]
-    
-    choice = show_choices(choices)
-    player.choices_history.append(f"Dog event: Choice {choice}")
-    
-    if choice == 1:  # Chaotic Evil
-        player = update_alignment(player, 20, 20, "chaotic_evil")
-        player = update_reputation(player, -20, -20, 20)
-        type_text("\nYou kick the dog away, laughing at its yelp.")
-        type_text("It runs off injured. You feel a strange power.")
-        player.guilt += 10
-    
-    elif choice == 2:  # Lawful Neutral
-        player = update_alignment(player, -15, 0, "lawful_neutral")
-        player = update_reputation(player, 15, 0, 0)
-        type_text("\nYou scan the collar for owner information.")
-        type_text("The owner offers a reward, but takes weeks to process.")
-        player.inventory.append("Small Reward")
-    
-    elif choice == 3:  # Lawful Evil
-        player = update_alignment(player, -5, 15, "lawful_evil")
-        player = update_reputation(player, 5, -15, 10)
-        type_text("\nYou sell the dog to a research facility.")
-        type_text("They pay well for test subjects. It's all legal.")
-        player.inventory.append("Research Money")
-    
-    elif choice == 4:  # Chaotic Neutral
-        player = update_alignment(player, 10, 0, "chaotic_neutral")
-        type_text("\nYou throw a stick and command the dog to fetch.")
-        type_text("It obeys! You now have a trained animal companion.")
-        player.inventory.append("Trained Dog")
-    
-    elif choice == 5:  # Lawful Good
-        player = update_alignment(player, -10, -10, "lawful_good")
-        player = update_reputation(player, 10, 5, -5)
-        type_text("\nYou take the dog to the proper authorities.")
-        type_text("They thank you for following procedure. The dog gets care.")
-        player.guilt -= 5
-    
-    elif choice == 6:  # Neutral Evil
-        player = update_alignment(player, 0, 15, "neutral_evil")
-        player = update_reputation(player, -10, -10, 15)
-        type_text("\nYou train the dog to attack on command.")
-        type_text("It becomes a useful tool for intimidation.")
-        player.inventory.append("Attack Dog")
-    
-    elif choice == 7:  # Chaotic Good
-        player = update_alignment(player, 15, -10, "chaotic_good")
-        player = update_reputation(player, -10, 5, 5)
-        type_text("\nYou disable the tracking collar and set the dog free.")
-        type_text("It runs off, finally liberated from surveillance.")
-    
-    elif choice == 8:  # True Neutral
-        player = update_alignment(player, 0, 0, "true_neutral")
-        type_text("\nYou continue walking. The dog eventually stops following.")
-        type_text("You feel neither good nor bad about your choice.")
-    
-    else:  # Neutral Good (choice == 9)
-        player = update_alignment(player, 0, -15, "neutral_good")
-        player = update_reputation(player, 0, 10, 0)
-        type_text("\nYou decide to care for the dog yourself.")
-        player.inventory.append("Dog Companion")
-        type_text("It becomes a loyal friend. (5% rabies chance)")
-        if random.random() < 0.05:
-            type_text("\nThe dog has rabies! You die painfully weeks later.")
-            player.health = 0
-    
-    show_stats(player)
-    return player
+    return play_event(player_graph(player).events[2], player, event_stream(player.seed, 3))
 
 def event_4(player):
     """Fourth event: Shelter decision with houses"""
-    type_text("\n" + "="*50)
-    type_text("                      HOUSES")
-    type_text("       glass is the house of the hypocrite")
-    type_text("      yet you still continue arming stones?")
-    type_text("="*50)
-    
-    type_text("\nNight falls. You need shelter. Three houses stand before you.")
-    type_text("\n1. Well-maintained, lights on, security cameras visible")
-    type_text("2. Abandoned, dark, broken windows")
-    type_text("3. Modest, curtain twitching, faint music inside")
-    
-    house_choice = show_choices(["House 1", "House 2", "House 3"])
-    player.choices_history.append(f"House choice: {house_choice}")
-    
-    if house_choice == 1:
-        type_text("\nYou approach the secure, well-maintained house.")
-        choices = [
-            "Smash a window",
-            "Present identification",
-            "Break in through back",
-            "Pick the lock",
-            "Ring bell, explain situation",
-            "Threaten legal action",
-            "Pretend to be inspector",
-            "Wait and observe",
-            "Ask for temporary shelter"
-        ]
-        
-        choice = show_choices(choices)
-        
-        if choice == 1:  # Chaotic Evil
-            player = update_alignment(player, 20, 20, "chaotic_evil")
-            type_text("\nYou cause destruction just for the thrill!")
-            player.health -= 10
-        elif choice == 2:  # Lawful Neutral
-            player = update_alignment(player, -20, 0, "lawful_neutral")
-            type_text("\nThey verify your ID through official channels.")
-        elif choice == 3:  # Neutral Evil
-            player = update_alignment(player, 0, 15, "neutral_evil")
-            type_text("\nYou steal supplies while they sleep.")
-            player.inventory.append("Stolen Supplies")
-        elif choice == 4:  # Chaotic Neutral
-            player = update_alignment(player, 10, 0, "chaotic_neutral")
-            type_text("\nYou successfully break in but find little of value.")
-        elif choice == 5:  # Lawful Good
-            player = update_alignment(player, -15, -10, "lawful_good")
-            type_text("\nThe owner calls authorities. You're detained but safe.")
-        elif choice == 6:  # Lawful Evil
-            player = update_alignment(player, -10, 15, "lawful_evil")
-            type_text("\nThey pay you to go away. Easy money.")
-            player.inventory.append("Extortion Money")
-        elif choice == 7:  # Chaotic Good
-            player = update_alignment(player, 15, -5, "chaotic_good")
-            type_text("\nThey let you 'inspect' and even offer you food!")
-        elif choice == 8:  # True Neutral
-            player = update_alignment(player, 0, 0, "true_neutral")
-            type_text("\nYou wait until they leave, then move on.")
-        else:  # Neutral Good (choice == 9)
-            player = update_alignment(player, 0, -10, "neutral_good")
-            type_text("\nThey reluctantly let you stay in the garage.")
-            player.health += 20
-    
-    elif house_choice == 2:
-        type_text("\nThe abandoned house creaks ominously.")
-        choices = [
-            "Burn it down",
-            "Document condition",
-            "Use as hideout",
-            "Explore dangerously",
-            "Report to authorities",
-            "Set traps inside",
-            "Claim squatter's rights",
-            "Camp outside",
-            "Make it safe for others"
-        ]
-        
-        choice = show_choices(choices)
-        
-        if choice == 1:  # Chaotic Evil
-            player = update_alignment(player, 25, 25, "chaotic_evil")
-            type_text("\nThe fire spreads to other buildings. Chaos erupts!")
-            player.health -= 30
-        elif choice == 2:  # Lawful Neutral
-            player = update_alignment(player, -15, 0, "lawful_neutral")
-            type_text("\nYour detailed report impresses city officials.")
-        elif choice == 3:  # Neutral Evil
-            player = update_alignment(player, 0, 15, "neutral_evil")
-            type_text("\nYou establish a perfect hiding spot for illicit activities.")
-        elif choice == 4:  # Chaotic Neutral
-            player = update_alignment(player, 15, 0, "chaotic_neutral")
-            if random.random() < 0.5:
-                type_text("\nYou find hidden valuables in the walls!")
-                player.inventory.append("Hidden Treasure")
-            else:
-                type_text("\nThe floor collapses! You're badly injured.")
-                player.health -= 40
-        elif choice == 5:  # Lawful Good
-            player = update_alignment(player, -10, -10, "lawful_good")
-            type_text("\nAuthorities secure the property. You get a reward.")
-        elif choice == 6:  # Lawful Evil
-            player = update_alignment(player, -5, 15, "lawful_evil")
-            type_text("\nYou create legal 'security measures' that harm trespassers.")
-        elif choice == 7:  # Chaotic Good
-            player = update_alignment(player, 20, -5, "chaotic_good")
-            type_text("\nYou establish residency! The system can't remove you.")
-        elif choice == 8:  # True Neutral
-            player = update_alignment(player, 0, 0, "true_neutral")
-            type_text("\nYou sleep outside, avoiding the unstable structure.")
-        else:  # Neutral Good (choice == 9)
-            player = update_alignment(player, 0, -15, "neutral_good")
-            type_text("\nYou board up windows and leave warning signs.")
-            player.health -= 10
-    
-    else:  # House 3
-        type_text("\nThe modest house feels lived-in and warm.")
-        choices = [
-            "Terrorize the family",
-            "Negotiate formal agreement",
-            "Blackmail the occupant",
-            "Sneak into the shed",
-            "Offer to work for shelter",
-            "Find legal loophole",
-            "Barter with possessions",
-            "Sleep in the garden",
-            "Share your story honestly"
-        ]
-        
-        choice = show_choices(choices)
-        
-        if choice == 1:  # Chaotic Evil
-            player = update_alignment(player, 20, 25, "chaotic_evil")
-            type_text("\nYou scare the family into giving you their best room.")
-            player.guilt += 30
-        elif choice == 2:  # Lawful Neutral
-            player = update_alignment(player, -20, 0, "lawful_neutral")
-            type_text("\nYou draft a formal contract for temporary residence.")
-        elif choice == 3:  # Neutral Evil
-            player = update_alignment(player, 0, 20, "neutral_evil")
-            type_text("\nYou find compromising information and use it.")
-            player.inventory.append("Blackmail Evidence")
-        elif choice == 4:  # Chaotic Neutral
-            player = update_alignment(player, 15, 0, "chaotic_neutral")
-            type_text("\nYou're warm and dry in their shed, undiscovered.")
-        elif choice == 5:  # Lawful Good
-            player = update_alignment(player, -15, -10, "lawful_good")
-            type_text("\nThey accept. You do chores in exchange for food and shelter.")
-            player.health += 30
-        elif choice == 6:  # Lawful Evil
-            player = update_alignment(player, -10, 15, "lawful_evil")
-            type_text("\nYou discover zoning violations and force them to host you.")
-        elif choice == 7:  # Chaotic Good
-            player = update_alignment(player, 10, -10, "chaotic_good")
-            type_text("\nYou trade your inventory items for a night's stay.")
-        elif choice == 8:  # True Neutral
-            player = update_alignment(player, 0, 0, "true_neutral")
-            type_text("\nYou sleep outside, disturbing no one.")
-            player.health += 10
-        else:  # Neutral Good (choice == 9)
-            player = update_alignment(player, 0, -15, "neutral_good")
-            type_text("\nThey're moved by your story and take you in.")
-            player.guilt -= 20
-    
-    show_stats(player)
-    return player
+    return play_event(player_graph(player).events[3], player, event_stream(player.seed, 4))
 
 def event_5(player):
     """Fifth event: The police encounter"""
-    type_text("\n" + "="*50)
-    type_text("                     JUSTICE")
-    type_text("                  or just ICE?")
-    type_text("="*50)
-    
-    type_text("\nPolice officers approach you. They know about the falling incident.")
-    type_text("'You need to come with us for questioning,' says the lead officer.")
-    type_text("You notice they're not wearing standard-issue equipment...")
-    
-    choices = [
-        "Attack first (Violent confrontation)",
-        "Cite legal precedents (Legal strategy)",
-        "Bribe them (Corrupt solution)",
-        "Run immediately (Instinctive freedom)",
-        "Go willingly (Trust the system)",
-        "Record interaction (Gather leverage)",
-        "Demand transparency (Challenge authority)",
-        "Assess their intent (Read the situation)",
-        "Ask for lawyer (Protect rights)"
-    ]
-    
-    choice = show_choices(choices)
-    player.choices_history.append(f"Police event: Choice {choice}")
-    
-    if choice == 1:  # Chaotic Evil
-        player = update_alignment(player, 25, 25, "chaotic_evil")
-        player = update_reputation(player, -40, -30, 35)
-        type_text("\nYou punch the lead officer and run!")
-        type_text("You're now a wanted fugitive, but alive and free.")
-        player.health -= 25
-    
-    elif choice == 2:  # Lawful Neutral
-        player = update_alignment(player, -25, 0, "lawful_neutral")
-        player = update_reputation(player, 20, 0, 0)
-        type_text("\nYou cite case law and procedural requirements.")
-        type_text("They're so confused by your legal knowledge that they leave.")
-    
-    elif choice == 3:  # Neutral Evil
-        player = update_alignment(player, 0, 20, "neutral_evil")
-        player = update_reputation(player, -10, -15, 25)
-        type_text("\n'How much to look the other way?' you ask.")
-        if "Money" in player.inventory or "Stolen Goods" in player.inventory:
-            type_text("They accept your bribe and let you go.")
-            player.inventory.remove("Money" if "Money" in player.inventory else "Stolen Goods")
-        else:
-            type_text("You have nothing to bribe with. They arrest you roughly.")
-            player.health -= 30
-    
-    elif choice == 4:  # Chaotic Neutral
-        player = update_alignment(player, 20, 0, "chaotic_neutral")
-        player = update_reputation(player, -30, -10, 15)
-        type_text("\nYou bolt without warning!")
-        if random.random() < 0.7:
-            type_text("You lose them in the alleyways. Freedom!")
-        else:
-            type_text("They catch you. The beating is severe.")
-            player.health -= 50
-    
-    elif choice == 5:  # Lawful Good
-        player = update_alignment(player, -20, -10, "lawful_good")
-        player = update_reputation(player, 25, 10, -20)
-        type_text("\nYou go with them willingly.")
-        type_text("The interrogation is harsh but fair. You're released with a warning.")
-        player.guilt -= 10
-    
-    elif choice == 6:  # Lawful Evil
-        player = update_alignment(player, -15, 15, "lawful_evil")
-        player = update_reputation(player, 15, -20, 20)
-        type_text("\nYou secretly record everything with a hidden device.")
-        type_text("'One wrong move and this goes public,' you whisper.")
-        player.inventory.append("Incriminating Recording")
-    
-    elif choice == 7:  # Chaotic Good
-        player = update_alignment(player, 20, -10, "chaotic_good")
-        player = update_reputation(player, -20, 20, 0)
-        type_text("\n'Show me your warrants! This is a free society!'")
-        type_text("A crowd gathers. The officers retreat under public pressure.")
-    
-    elif choice == 8:  # True Neutral
-        player = update_alignment(player, 0, 0, "true_neutral")
-        type_text("\nYou study their badges, uniforms, and behavior...")
-        if player.reputation["authorities"] > 60:
-            type_text("They seem legitimate. You cooperate cautiously.")
-            player = update_alignment(player, -10, 0, "lawful_neutral")
-        else:
-            type_text("Something feels off. You make an excuse and leave.")
-            player = update_alignment(player, 10, 0, "chaotic_neutral")
-    
-    else:  # Neutral Good (choice == 9)
-        player = update_alignment(player, 0, -15, "neutral_good")
-        player = update_reputation(player, 10, 15, -10)
-        type_text("\n'I want a lawyer,' you state firmly.")
-        type_text("The officers back off. Your rights protect you.")
-    
-    show_stats(player)
-    return player
+    return play_event(player_graph(player).events[4], player, event_stream(player.seed, 5))
 
 def event_6(player):
     """Sixth event: The truth reveal"""
-    type_text("\n" + "="*50)
-    type_text("                    KICK BACK")
-    type_text("           ripped into the real world")
-    type_text("="*50)
-    
-    type_text("\nYou find a discarded newspaper with your picture on it.")
-    type_text("'AMNESIA EXPERIMENT ESCAPEE - PUBLIC DANGER'")
-    type_text("You begin to remember... you were part of a government experiment.")
-    
-    choices = [
-        "Destroy the research facility (Violent revenge)",
-        "Research the program (Gather evidence)",
-        "Sell your body for science (Profit from suffering)",
-        "Use knowledge for gain (Exploit the situation)",
-        "Turn yourself in (Accept responsibility)",
-        "Blackmail the researchers (Legal extortion)",
-        "Expose the experiment (Reveal truth publicly)",
-        "Suppress the memories (Return to ignorance)",
-        "Find other test subjects (Help fellow victims)"
-    ]
-    
-    choice = show_choices(choices)
-    player.choices_history.append(f"Truth event: Choice {choice}")
-    
-    if choice == 1:  # Chaotic Evil
-        player = update_alignment(player, 30, 35, "chaotic_evil")
-        player = update_reputation(player, -40, -35, 40)
-        type_text("\nYou return to the facility with explosives.")
-        type_text("The resulting fire kills dozens. You watch with satisfaction.")
-        player.health -= 40
-    
-    elif choice == 2:  # Lawful Neutral
-        player = update_alignment(player, -20, 0, "lawful_neutral")
-        player = update_reputation(player, 20, 0, 0)
-        type_text("\nYou compile exhaustive evidence of the program's activities.")
-        type_text("Your dossier becomes the definitive record of what happened.")
-        player.inventory.append("Evidence Dossier")
-    
-    elif choice == 3:  # Neutral Evil
-        player = update_alignment(player, 0, 30, "neutral_evil")
-        player = update_reputation(player, -15, -20, 30)
-        type_text("\nYou sell your unique biology to the highest bidder.")
-        type_text("Corporations pay millions for your 'special qualities.'")
-    
-    elif choice == 4:  # Chaotic Neutral
-        player = update_alignment(player, 20, 0, "chaotic_neutral")
-        player = update_reputation(player, -20, -10, 20)
-        type_text("\nYou use your experimental 'enhancements' for personal gain.")
-        type_text("You become a master thief with abilities normal people lack.")
-    
-    elif choice == 5:  # Lawful Good
-        player = update_alignment(player, -25, -20, "lawful_good")
-        player = update_reputation(player, 30, 15, -30)
-        type_text("\nYou surrender to authorities.")
-        type_text("You're treated fairly and help reform the unethical program.")
-        player.guilt -= 40
-    
-    elif choice == 6:  # Lawful Evil
-        player = update_alignment(player, -15, 25, "lawful_evil")
-        player = update_reputation(player, 20, -25, 25)
-        type_text("\nYou threaten to sue the government for billions.")
-        type_text("They settle out of court. You're now extremely wealthy.")
-        player.inventory.append("Settlement Money")
-    
-    elif choice == 7:  # Chaotic Good
-        player = update_alignment(player, 25, -20, "chaotic_good")
-        player = update_reputation(player, -30, 30, 10)
-        type_text("\nYou hack into government systems and leak everything.")
-        type_text("The scandal brings down the program. You're a hero to some.")
-    
-    elif choice == 8:  # True Neutral
-        player = update_alignment(player, 0, 0, "true_neutral")
-        type_text("\nYou burn the newspaper and walk away.")
-        type_text("Some truths are better left unknown. You seek peace.")
-        player.guilt -= 10
-    
-    else:  # Neutral Good (choice == 9)
-        player = update_alignment(player, 0, -25, "neutral_good")
-        player = update_reputation(player, 10, 25, -15)
-        type_text("\nYou track down other experiment victims.")
-        type_text("Together, you form a support network and heal.")
-        player.health += 20
-    
-    show_stats(player)
-    return player
+    return play_event(player_graph(player).events[5], player, event_stream(player.seed, 6))
 
 def event_7(player):
     """Seventh event: Final choice - society or self"""
-    type_text("\n" + "="*50)
-    type_text("                      COINS")
-    type_text("                the duality of man")
-    type_text("="*50)
-    
-    type_text("\nYou stand at a crossroads.")
-    type_text("Before you: two paths that will define your future forever.")
-    
-    type_text("\nPATH A: Face in the Crowd")
-    type_text("Reintegrate. Become a functional member of society. Follow society.")
-    type_text("Gear in the machine. Doing your duty as a citizen.")
-    
-    type_text("\nPATH B: Facing the Crowd")
-    type_text("Regenerate. Break constraints, live by your own rules, answer to no one.")
-    type_text("Risk being put down. Metaphorically and literally.")
-    
-    path_choice = show_choices(["Path A: Society", "Path B: Freedom"])
-    
-    if path_choice == 1:
-        type_text("\nYou choose to return to society.")
-        choices = [
-            "Infiltrate to destroy",
-            "Climb the corporate ladder",
-            "Exploit others legally",
-            "Game the system",
-            "Become a public servant",
-            "Become a corrupt official",
-            "Reform from within",
-            "Live quietly, normally",
-            "Help the disadvantaged"
-        ]
-        
-        choice = show_choices(choices)
-        
-        if choice == 1:  # Chaotic Evil
-            player = update_alignment(player, 30, 40, "chaotic_evil")
-            type_text("\nYou gain power only to tear the system down from within.")
-            type_text("Your final act creates chaos that lasts for generations.")
-        elif choice == 2:  # Lawful Neutral
-            player = update_alignment(player, -25, 0, "lawful_neutral")
-            type_text("\nYou master corporate politics and rise to the top.")
-            type_text("You're successful, respected, and completely neutral.")
-        elif choice == 3:  # Neutral Evil
-            player = update_alignment(player, 0, 35, "neutral_evil")
-            type_text("\nYou build an empire on legal but unethical practices.")
-            type_text("You profit from others' suffering without getting your hands dirty.")
-        elif choice == 4:  # Chaotic Neutral
-            player = update_alignment(player, 20, 0, "chaotic_neutral")
-            type_text("\nYou find loopholes in every system.")
-            type_text("You live well without ever breaking the letter of the law.")
-        elif choice == 5:  # Lawful Good
-            player = update_alignment(player, -30, -30, "lawful_good")
-            type_text("\nYou dedicate your life to public service.")
-            type_text("You make genuine change from within the system.")
-        elif choice == 6:  # Lawful Evil
-            player = update_alignment(player, -20, 30, "lawful_evil")
-            type_text("\nYou rise in politics through corruption and blackmail.")
-            type_text("You're powerful, wealthy, and utterly ruthless.")
-        elif choice == 7:  # Chaotic Good
-            player = update_alignment(player, 25, -25, "chaotic_good")
-            type_text("\nYou use your position to expose corruption.")
-            type_text("You're hated by the powerful but loved by the people.")
-        elif choice == 8:  # True Neutral
-            player = update_alignment(player, 0, 0, "true_neutral")
-            type_text("\nYou find a modest job, a small home, and peace.")
-            type_text("You live an unremarkable but content life.")
-        else:  # Neutral Good (choice == 9)
-            player = update_alignment(player, 0, -30, "neutral_good")
-            type_text("\nYou found charities and help those in need.")
-            type_text("Your compassion touches thousands of lives.")
-    
+    return play_event(player_graph(player).events[6], player, event_stream(player.seed, 7))
+
+# Game events in sequence
+EVENTS = [
+    event_1,  # The Fall
+    event_2,  # Aftermath
+    event_3,  # Stray Dog
+    event_4,  # Shelter Houses
+    event_5,  # Police Encounter
+    event_6,  # Truth Reveal
+    event_7   # Final Choice
+]
+
+# ===== Headless Simulation =====
+def render_nothing(text, delay=0.03):
+    """Renderer for headless runs, throws the text away"""
+    pass
+
+def random_choice(options, player):
+    """Choice provider that picks any option with equal chance"""
+    return random.randint(1, len(options))
+
+def play_event_headless(node, player, choose, rng=random):
+    """Walks one compiled event without showing anything"""
+    steps = walk_node(node, player, rng)
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, str):
+                step = next(steps)
+            else:
+                step = steps.send(choose(step.choices, player))
+    except StopIteration:
+        pass
+    return player
+
+def play_headless(choose=random_choice, player_name="Stranger", player_class=Player, seed=None):
+    """Plays every event with no terminal I/O
+    
+    choose(options, player) is called at each decision and returns the option
+    number (1-based) just like show_choices(). Unlike choice_provider it's
+    given the player too, since nobody is reading the screen. Returns (player, ending) where
+    ending is the determine_final_alignment() result, or None if the player died.
+    Pass player_class=CompactPlayer to keep lots of finished players around.
+    Chance outcomes roll from the streams of seed (a new one if None), so the
+    same seed and the same choices always give the same game.
+    """
+    player = player_class(player_name, "Utopian Society", seed)
+    for number, event in enumerate(event_graph().events, 1):
+        play_event_headless(event, player, choose, event_stream(player.seed, number))
+        if player.health <= 0:
+            return player, None
+    return player, determine_final_alignment(player)
+
+# ===== Choice Journal =====
+# A journal is an append-only log of one game: the save it started from,
+# then every show_choices() answer (nested choice points included) and
+# every chance roll in the order they happened, with a marker after each
+# finished event. Replaying it walks the same events with nothing shown,
+# which rebuilds the game in microseconds without needing a save.
+#   header:   magic "USJR", format version, length of the starting save,
+#             checksum of the events it's played on (EventGraph.checksum)
+#             followed by the save itself (see Save Files)
+#   records:  "c" choice point index (2 bytes) and option picked (1 byte)
+#             "r" chance roll (8-byte double)
+#             "e" number of the event just finished (1 byte)
+#             "f" the game is over (finished, died or saved and quit)
+# Version 1 journals have no checksum.
+JOURNAL_FILE = "game_journal.bin"
+JOURNAL_MAGIC = b"USJR"
+JOURNAL_VERSION = 2
+JOURNAL_HEADER = struct.Struct("<4sBHI")
+JOURNAL_HEADER_V1 = struct.Struct("<4sBH")
+JOURNAL_CHOICE = struct.Struct("<HB")
+JOURNAL_ROLL = struct.Struct("<d")
+JOURNAL_EVENT = struct.Struct("<B")
+
+class JournalError(Exception):
+    """A journal is damaged or doesn't fit the events"""
+
+class JournalContentError(JournalError):
+    """A journal was played on different event content than the game has now"""
+
+class Journal:
+    """Writes one game's journal, flushing every record as it happens
+
+    Give start (the starting save bytes) and graph (the EventGraph the game
+    is played on) to begin a new journal, or end (from replay_journal())
+    to carry on an unfinished one; anything after its last finished event
+    is cut off first.
+    """
+    def __init__(self, path=JOURNAL_FILE, start=None, end=None, graph=None):
+        if start is not None:
+            graph = graph or event_graph()
+            self.file = open(path, "wb")
+            self.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(start), graph.checksum)
+                       + start)
+        else:
+            self.file = open(path, "r+b")
+            self.file.truncate(end)
+            self.file.seek(end)
+
+    def write(self, record):
+        self.file.write(record)
+        self.file.flush()
+
+    def choice(self, node, option):
+        self.write(b"c" + JOURNAL_CHOICE.pack(node.index, option))
+
+    def roll(self, value):
+        self.write(b"r" + JOURNAL_ROLL.pack(value))
+
+    def event_done(self, number):
+        self.write(b"e" + JOURNAL_EVENT.pack(number))
+
+    def finish(self):
+        self.write(b"f")
+        self.file.close()
+
+class RecordingStream:
+    """Wraps an event's random stream, writing every roll to a journal"""
+    def __init__(self, rng, journal):
+        self.rng = rng
+        self.journal = journal
+
+    def random(self):
+        value = self.rng.random()
+        self.journal.roll(value)
+        return value
+
+def parse_journal(data):
+    """Splits journal bytes into (starting save, checksum, events, finished, end)
+
+    checksum is the EventGraph.checksum of the events the game was played
+    on (None for a version 1 journal). events holds the records of each finished event, ("c", node index,
+    option) or ("r", roll). Records of an event that never finished are
+    left out, and end is the offset just after the last finished event.
+    """
+    if len(data) < JOURNAL_HEADER_V1.size:
+        raise JournalError("Journal is cut short")
+    magic, version, start_size = JOURNAL_HEADER_V1.unpack_from(data)
+    if magic != JOURNAL_MAGIC:
+        raise JournalError("Not a Utopian Sands journal")
+    if version == 1:
+        header_size, checksum = JOURNAL_HEADER_V1.size, None
+    elif version == JOURNAL_VERSION:
+        if len(data) < JOURNAL_HEADER.size:
+            raise JournalError("Journal is cut short")
+        header_size = JOURNAL_HEADER.size
+        checksum = JOURNAL_HEADER.unpack_from(data)[3]
     else:
-        type_text("\nYou choose freedom and independence.")
-        choices = [
-            "Burn everything",
-            "Create your own rules",
-            "Take what you want",
-            "Live for thrill alone",
-            "Become a wandering helper",
-            "Build a criminal empire",
-            "Fight for others' freedom",
-            "Wander without purpose",
-            "Live self-sufficiently"
-        ]
-        
-        choice = show_choices(choices)
-        
-        if choice == 1:  # Chaotic Evil
-            player = update_alignment(player, 40, 45, "chaotic_evil")
-            type_text("\nYou dedicate your life to pure destruction and chaos.")
-            type_text("You become a force of nature that civilization cannot contain.")
-        elif choice == 2:  # Lawful Neutral
-            player = update_alignment(player, -15, 0, "lawful_neutral")
-            type_text("\nYou establish your own micronation with strict laws.")
-            type_text("You rule absolutely but fairly over your small domain.")
-        elif choice == 3:  # Neutral Evil
-            player = update_alignment(player, 0, 35, "neutral_evil")
-            type_text("\nYou take whatever you want from whoever has it.")
-            type_text("You answer to no one and live solely for your own pleasure.")
-        elif choice == 4:  # Chaotic Neutral
-            player = update_alignment(player, 25, 0, "chaotic_neutral")
-            type_text("\nYou seek the ultimate thrill in every experience.")
-            type_text("You cheat death daily and live completely in the moment.")
-        elif choice == 5:  # Lawful Good
-            player = update_alignment(player, -10, -25, "lawful_good")
-            type_text("\nYou travel from town to town, helping where needed.")
-            type_text("You become a legend - the stranger who fixes problems.")
-        elif choice == 6:  # Lawful Evil
-            player = update_alignment(player, -15, 30, "lawful_evil")
-            type_text("\nYou build an organized crime syndicate with strict codes.")
-            type_text("You control underground empires with an iron fist.")
-        elif choice == 7:  # Chaotic Good
-            player = update_alignment(player, 30, -20, "chaotic_good")
-            type_text("\nYou become a freedom fighter, liberating the oppressed.")
-            type_text("You're wanted by authorities but worshipped by rebels.")
-        elif choice == 8:  # True Neutral
-            player = update_alignment(player, 0, 0, "true_neutral")
-            type_text("\nYou wander without destination or purpose.")
-            type_text("You experience everything but commit to nothing.")
-        else:  # Neutral Good (choice == 9)
-            player = update_alignment(player, 0, -20, "neutral_good")
-            type_text("\nYou build a sustainable home in the wilderness.")
-            type_text("You live in harmony with nature, helping those who find you.")
-    
-    player.choices_history.append(f"Final path: Choice {choice}")
-    show_stats(player)
+        raise JournalError(f"Unknown journal version {version}")
+    offset = header_size + start_size
+    start = data[header_size:offset]
+    events = []
+    records = []
+    end = offset
+    finished = False
+    # A record cut off by a crash mid-write just ends the loop
+    while offset < len(data) and not finished:
+        kind = data[offset:offset + 1]
+        offset += 1
+        try:
+            if kind == b"c":
+                records.append(("c", *JOURNAL_CHOICE.unpack_from(data, offset)))
+                offset += JOURNAL_CHOICE.size
+            elif kind == b"r":
+                records.append(("r", *JOURNAL_ROLL.unpack_from(data, offset)))
+                offset += JOURNAL_ROLL.size
+            elif kind == b"e":
+                (number,) = JOURNAL_EVENT.unpack_from(data, offset)
+                offset += JOURNAL_EVENT.size
+                events.append((number, records))
+                records = []
+                end = offset
+            elif kind == b"f":
+                finished = True
+                end = offset
+            else:
+                raise JournalError("Journal is damaged")
+        except struct.error:
+            break
+    return start, checksum, events, finished, end
+
+class ReplayStream:
+    """Hands a journal's records back to the event walker in order"""
+    def __init__(self, records):
+        self.records = iter(records)
+
+    def next(self, kind):
+        record = next(self.records, None)
+        if record is None or record[0] != kind:
+            raise JournalError("Journal doesn't match the events")
+        return record
+
+    def random(self):
+        return self.next("r")[1]
+
+    def choice(self, node):
+        _, index, option = self.next("c")
+        if index != node.index or not 1 <= option <= len(node.choices):
+            raise JournalError("Journal doesn't match the events")
+        return option
+
+def replay_event(node, player, records):
+    """Walks one event with its journal records standing in for the player and the dice"""
+    stream = ReplayStream(records)
+    steps = walk_node(node, player, stream)
+    try:
+        step = next(steps)
+        while True:
+            if isinstance(step, str):
+                step = next(steps)
+            else:
+                step = steps.send(stream.choice(step))
+    except StopIteration:
+        pass
+    if next(stream.records, None) is not None:
+        raise JournalError("Journal doesn't match the events")
     return player
 
+def replay_journal(data, player_class=None, graph=None):
+    """Fast-forwards a journal, returns (player, event_counter, finished, end)
+
+    It's replayed on graph (the current events by default). A journal
+    played on other content raises JournalContentError rather than being
+    replayed on events its choice point indexes don't belong to.
+    """
+    graph = graph or event_graph()
+    start, checksum, events, finished, end = parse_journal(data)
+    if checksum is not None and checksum != graph.checksum:
+        raise JournalContentError("Journal was played on different event content")
+    player, event_counter = unpack_save(start, player_class)
+    for number, records in events:
+        if number != event_counter + 1 or number > len(graph.events):
+            raise JournalError("Journal doesn't match the events")
+        replay_event(graph.events[event_counter], player, records)
+        event_counter = number
+    return player, event_counter, finished, end
+
+def find_unfinished_game(path=JOURNAL_FILE):
+    """(player, event_counter, end) of a game whose journal was never finished
+
+    Returns (None, 0, 0) when there's nothing to pick up. If the events
+    have changed since it was played, JournalContentError is raised.
+    """
+    try:
+        with open(path, "rb") as file:
+            player, event_counter, finished, end = replay_journal(file.read())
+    except JournalContentError:
+        raise
+    except (FileNotFoundError, JournalError, SaveError):
+        return None, 0, 0
+    if finished:
+        return None, 0, 0
+    return player, event_counter, end
+
+# ===== Analytics =====
+# Every choice can be logged for working out how players choose across lots
+# of games. The log is columnar: after the header come blocks of rows, each
+# block holding all of one column's values, then all of the next column's,
+# so a reader gets each column straight out of the bytes without parsing.
+#   header:  magic "USAN", format version, then the columns as
+#            length-prefixed "name:typecode" strings (array module codes),
+#            so readers can tell which columns a file has
+#   blocks:  magic "ROWS", row count (4 bytes), then each column's values
+#            little-endian, in header order
+# The file is only ever appended to. A block cut short by a crash is
+# ignored when reading. Version 1 files have no health or guilt, and
+# versions 1 and 2 no graph.
+ANALYTICS_FILE = "game_analytics.col"
+ANALYTICS_MAGIC = b"USAN"
+ANALYTICS_VERSION = 3
+ANALYTICS_HEADER = struct.Struct("<4sB")
+ANALYTICS_BLOCK = struct.Struct("<4sI")
+ANALYTICS_BLOCK_MAGIC = b"ROWS"
+ANALYTICS_COLUMNS = (
+    ("session", "Q"),      # the game's seed, the same for every choice in one game
+    ("time", "d"),         # Unix time the choice was logged
+    ("event", "B"),        # event number, 1-7
+    ("graph", "I"),        # EventGraph.checksum of the events the game was played on
+    ("node", "H"),         # choice point index in that graph
+    ("option", "B"),       # option picked, 1-based
+    ("think", "f"),        # seconds the player took to pick
+    ("law_chaos", "b"),    # the axes and reputations after the choice's outcome
+    ("good_evil", "b"),
+    ("authorities", "B"),
+    ("citizens", "B"),
+    ("underworld", "B"),
+    ("health", "h"),
+    ("guilt", "h"),
+)
+
+class AnalyticsError(Exception):
+    """An analytics file is damaged or has different columns"""
+
+def analytics_header():
+    return (ANALYTICS_HEADER.pack(ANALYTICS_MAGIC, ANALYTICS_VERSION)
+            + pack_strings([f"{name}:{typecode}" for name, typecode in ANALYTICS_COLUMNS]))
+
+def pack_analytics_block(rows):
+    """One block of the analytics file from a list of row tuples"""
+    parts = [ANALYTICS_BLOCK.pack(ANALYTICS_BLOCK_MAGIC, len(rows))]
+    for (name, typecode), values in zip(ANALYTICS_COLUMNS, zip(*rows)):
+        column = array(typecode, values)
+        if sys.byteorder == "big":
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b"".join(parts)
+
+class AnalyticsSink:
+    """Logs every choice to the analytics file from a background thread
+
+    choice() only puts a row on a bounded queue and never waits. If the
+    writer falls behind and the queue fills up, rows are dropped and counted
+    in dropped rather than holding up the game. The writer takes rows off in
+    batches and appends each batch as one block, at least every interval
+    seconds while rows are coming in.
+    """
+    def __init__(self, path=ANALYTICS_FILE, capacity=100_000, batch_size=8192, interval=1.0):
+        import queue
+        import threading
+        self.queue = queue.Queue(capacity)
+        self.empty, self.full = queue.Empty, queue.Full
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(analytics_header())
+            self.file.flush()
+        else:
+            with open(path, "rb") as file:
+                if file.read(len(analytics_header())) != analytics_header():
+                    self.file.close()
+                    raise AnalyticsError(f"{path} isn't an analytics file with these columns")
+        self.thread = threading.Thread(target=self.write_rows, name="analytics writer", daemon=True)
+        self.thread.start()
+
+    def choice(self, player, node, option, think):
+        """Logs one choice made by player, with their state now"""
+        self.record(player.seed, node.event, player_graph(player).checksum, node.index,
+                    option, think, player)
+
+    def record(self, session, event, graph, node_index, option, think, player):
+        row = (session, time.time(), event, graph, node_index, option, think,
+               player.alignment["law_chaos"], player.alignment["good_evil"],
+               player.reputation["authorities"], player.reputation["citizens"],
+               player.reputation["underworld"], player.health, player.guilt)
+        try:
+            self.queue.put_nowait(row)
+        except self.full:
+            self.dropped += 1
+
+    def write_rows(self):
+        """The writer thread: drains the queue into blocks until close()"""
+        rows = []
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except self.empty:
+                row = None
+            # Take everything that's waiting, a block at a time
+            while row is not None and row is not self:
+                rows.append(row)
+                if len(rows) >= self.batch_size:
+                    self.write_block(rows)
+                    rows = []
+                try:
+                    row = self.queue.get_nowait()
+                except self.empty:
+                    row = None
+            if row is self:   # close() puts the sink itself on the queue to stop
+                break
+            if time.monotonic() >= deadline:
+                if rows:
+                    self.write_block(rows)
+                    rows = []
+                deadline = time.monotonic() + self.interval
+        if rows:
+            self.write_block(rows)
+
+    def write_block(self, rows):
+        self.file.write(pack_analytics_block(rows))
+        self.file.flush()
+
+    def close(self):
+        """Writes out every row logged so far and stops the writer"""
+        self.queue.put(self)
+        self.thread.join()
+        self.file.close()
+
+def analytics_layout(data):
+    """([(column name, typecode)], offset of the first block) from an analytics file's header"""
+    try:
+        magic, version = ANALYTICS_HEADER.unpack_from(data)
+        specs, offset = unpack_strings(data, ANALYTICS_HEADER.size)
+    except (struct.error, UnicodeDecodeError, SaveError):
+        raise AnalyticsError("Analytics file header is cut short") from None
+    if magic != ANALYTICS_MAGIC or version not in (1, 2, ANALYTICS_VERSION):
+        raise AnalyticsError("Not an analytics file")
+    return [tuple(spec.split(":")) for spec in specs], offset
+
+def analytics_blocks(data):
+    """(offset, rows) of every whole block in an analytics file, after the header"""
+    layout, offset = analytics_layout(data)
+    row_size = sum(array(typecode).itemsize for _, typecode in layout)
+    blocks = []
+    while offset + ANALYTICS_BLOCK.size <= len(data):
+        magic, rows = ANALYTICS_BLOCK.unpack_from(data, offset)
+        if magic != ANALYTICS_BLOCK_MAGIC:
+            raise AnalyticsError(f"Analytics file is damaged at byte {offset}")
+        offset += ANALYTICS_BLOCK.size
+        if offset + rows * row_size > len(data):
+            break   # the last block was cut short
+        blocks.append((offset, rows))
+        offset += rows * row_size
+    return blocks
+
+def read_analytics(data):
+    """{column name: array of values} from the bytes of an analytics file"""
+    layout, _ = analytics_layout(data)
+    columns = {name: array(typecode) for name, typecode in layout}
+    view = memoryview(data)
+    for offset, rows in analytics_blocks(data):
+        for name, column in columns.items():
+            size = rows * column.itemsize
+            column.frombytes(view[offset:offset + size])
+            offset += size
+    if sys.byteorder == "big":
+        for column in columns.values():
+            column.byteswap()
+    return columns
+
 # ===== Main Game Loop =====
+TITLE_LINES = [
+    "="*60,
+    "                      UTOPIAN SANDS",
+    '            "play god in your personal sandbox"',
+    "="*60,
+    "\nA text-based adventure that reveals your true moral alignment.",
+    "Based on the classic ninefold alignment system from tabletop RPGs.",
+    "\nThere are no right or wrong answers:",
+    "\nOnly your truth."
+]
+
+MENU_LINES = [
+    "\n" + "-"*30,
+    "MAIN MENU",
+    "-"*30,
+    "[1] Start New Game",
+    "[2] Load Saved Game",
+    "[3] Quit"
+]
+
+# Shown with one write each instead of typed, so the first prompt comes up
+# straight away
+TITLE_SCREEN = "\n".join(TITLE_LINES)
+MENU_SCREEN = "\n".join(MENU_LINES)
+
+def character_creation_lines(player_name):
+    """Lines shown once a new player has been named"""
+    return [f"\nWelcome, {player_name}.",
+            "\nRemember: There are no 'right' or 'wrong' choices.",
+            "Only choices that reveal who you truly are."]
+
 def main():
     """Main game function"""
-    type_text("="*60)
-    type_text("                      UTOPIAN SANDS")
-    type_text('            "play god in your personal sandbox"')
-    type_text("="*60)
-    
-    type_text("\nA text-based adventure that reveals your true moral alignment.")
-    type_text("Based on the classic ninefold alignment system from tabletop RPGs.")
-    type_text("\nThere are no right or wrong answers:")
-    type_text("\nOnly your truth.")
-    
-    # Menu
-    type_text("\n" + "-"*30)
-    type_text("MAIN MENU")
-    type_text("-"*30)
-    type_text("[1] Start New Game")
-    type_text("[2] Load Saved Game")
-    type_text("[3] Quit")
+    global journal
+    type_text(TITLE_SCREEN, 0)
     
-    menu_choice = input("\nEnter choice (1-3): ")
-    
-    if menu_choice == "3":
-        type_text("\nGoodbye.")
-        return
+    # Pick up any change to the event content since the last game
+    if content_file is not None:
+        try:
+            reload_content(content_file)
+        except (OSError, ValueError) as error:
+            type_text(f"\n(Keeping the current events: {error})", 0)
     
-    # Create or load player
-    player = None
-    event_counter = 0
+    # Pick up a game that was cut off part way (crash, closed window)
+    try:
+        player, event_counter, journal_end = find_unfinished_game()
+    except JournalContentError:
+        type_text("\nFound an unfinished game, but the events have changed since it was played,"
+                  " so it can't be resumed.")
+        player, event_counter = None, 0
+    if player is not None:
+        type_text(f"\nFound an unfinished game for {player.name}, up to event {event_counter + 1}.")
+        if input("Resume it? (y/n): ").lower() == "y":
+            journal = Journal(end=journal_end)
+        else:
+            player, event_counter = None, 0
     
-    if menu_choice == "2":
-        player, event_counter = load_game()
+    if player is None:
+        # Menu
+        type_text(MENU_SCREEN, 0)
+        
+        menu_choice = input("\nEnter choice (1-3): ")
+        
+        if menu_choice == "3":
+            type_text("\nGoodbye.")
+            return
+        
+        # Load player
+        if menu_choice == "2":
+            player, event_counter = load_game()
     
     if player is None:
         # Create new player
@@ -1070,48 +2745,56 @@ def main():
             player_name = "Stranger"
         
         player = Player(player_name, "Utopian Society")
-        type_text(f"\nWelcome, {player_name}.")
-        type_text("\nRemember: There are no 'right' or 'wrong' choices.")
-        type_text("Only choices that reveal who you truly are.")
+        for line in character_creation_lines(player_name):
+            type_text(line)
         input("\nPress Enter to begin your journey...")
     
-    # Game events in sequence
-    events = [
-        event_1,  # The Fall
-        event_2,  # Aftermath
-        event_3,  # Stray Dog
-        event_4,  # Shelter Houses
-        event_5,  # Police Encounter
-        event_6,  # Truth Reveal
-        event_7   # Final Choice
-    ]
+    # This game plays to the end on the events it starts with
+    player.graph = event_graph()
+    
+    # Record every choice and roll from here on
+    if journal is None:
+        journal = Journal(start=pack_save(player, event_counter), graph=player.graph)
+    
+    # Collect band crossings to tell the player about after each event
+    changes = []
+    track(player).subscribe(changes.append)
     
     # Play events
-    while event_counter < len(events) and not check_game_over(player):
+    while event_counter < len(EVENTS) and not check_game_over(player):
         # Show event counter
-        type_text(f"\n[Event {event_counter + 1} of {len(events)}]")
+        type_text(f"\n[Event {event_counter + 1} of {len(EVENTS)}]")
         
         # Play next event
-        player = events[event_counter](player)
+        player = EVENTS[event_counter](player)
         event_counter += 1
+        journal.event_done(event_counter)
+        for line in change_lines(changes):
+            type_text(line)
+        changes.clear()
         
         # Check for save/quit option
-        if not check_game_over(player) and event_counter < len(events):
+        if not check_game_over(player) and event_counter < len(EVENTS):
             type_text("\n" + "-"*30)
             type_text("Options: [c]ontinue, [s]ave, [q]uit, [v]iew stats")
             option = input("Choose: ").lower()
             
             if option == "s":
-                save_game(player, event_counter)
+                save_game(player, event_counter, ask_save_slot())
                 continue
             elif option == "q":
                 type_text("\nGame saved. Come back soon to continue your journey!")
-                save_game(player, event_counter)
+                save_game(player, event_counter, ask_save_slot())
+                journal.finish()
+                journal = None
                 return
             elif option == "v":
                 show_stats(player)
                 input("\nPress Enter to continue...")
     
+    journal.finish()
+    journal = None
+    
     # Game Ending
     if not check_game_over(player):
         # Determine final alignment
@@ -1123,13 +2806,93 @@ def main():
         # Ask to save final game
         type_text("\nWould you like to save your final results?")
         if input().lower() == "y":
-            save_game(player, event_counter)
+            save_game(player, event_counter, ask_save_slot())
         
         # Show play again option
         type_text("\nPlay again to explore different alignments!")
         if input().lower() == "y":
             main()
 
+# Command line flags and their help, (flag, value name or None, help).
+# They're read by hand rather than with argparse, which alone would add
+# about 10ms before the title screen.
+RUN_FLAGS = (
+    ("--fast", None, "skip the typing effect"),
+    ("--text-speed", "MODE", "typed, skip (Enter finishes a line at once) or instant"),
+    ("--analytics", None, f"log every choice to {ANALYTICS_FILE}"),
+    ("--text", "FILE", "read the narration from this string table"),
+    ("--content", "FILE", "play the events in this content file, reloaded before each new game"),
+)
+
+TEXT_SPEEDS = ("typed", "skip", "instant")   # TextRenderer modes --text-speed can pick
+
+def usage():
+    return "usage: " + os.path.basename(sys.argv[0]) + " " + " ".join(
+        f"[{flag} {value}]" if value else f"[{flag}]" for flag, value, _ in RUN_FLAGS)
+
+def usage_error(message):
+    """Stops with a usage message, the way argparse does"""
+    sys.stderr.write(f"{usage()}\n{os.path.basename(sys.argv[0])}: error: {message}\n")
+    raise SystemExit(2)
+
+def parse_run_args(args):
+    """{flag: value} for the flags given, True for flags that don't take one"""
+    values = {flag: value for flag, value, _ in RUN_FLAGS}
+    options = {}
+    args = list(args)
+    while args:
+        flag = args.pop(0)
+        if flag in ("-h", "--help"):
+            print(usage() + "\n\nPlay Utopian Sands\n\noptions:")
+            for name, value, help_text in RUN_FLAGS:
+                print(f"  {name + (' ' + value if value else ''):<18}  {help_text}")
+            raise SystemExit(0)
+        if flag not in values:
+            usage_error(f"unrecognized arguments: {flag}")
+        if values[flag] is None:
+            options[flag] = True
+        elif not args or args[0].startswith("--"):
+            usage_error(f"argument {flag}: expected one argument")
+        else:
+            options[flag] = args.pop(0)
+    return options
+
+def run(args):
+    """Starts the game from the command line"""
+    global renderer, analytics, content_file
+    options = parse_run_args(args)
+    # --text-speed picks the TextRenderer mode; otherwise --fast, or input
+    # that isn't a person at a keyboard, skips the typing effect
+    if "--text-speed" in options:
+        if options["--text-speed"] not in TEXT_SPEEDS:
+            usage_error(f"argument --text-speed: invalid choice: {options['--text-speed']!r} "
+                        f"(choose from {', '.join(TEXT_SPEEDS)})")
+        renderer = TextRenderer(options["--text-speed"])
+    elif "--fast" in options or not sys.stdin.isatty():
+        renderer = TextRenderer("zero")
+    # --text FILE reads the narration from a string table (sands_strings.py),
+    # before anything compiles the events
+    if "--text" in options:
+        try:
+            load_strings(options["--text"])
+        except (OSError, StringTableError) as error:
+            usage_error(str(error))
+    # A bad content file stops the game here, before the title screen
+    if "--content" in options:
+        try:
+            reload_content(options["--content"])
+        except (OSError, ValueError) as error:
+            usage_error(str(error))
+        content_file = options["--content"]
+    if "--analytics" in options:
+        analytics = AnalyticsSink()
+    try:
+        main()
+    finally:
+        if analytics is not None:
+            analytics.close()
+            analytics = None
+
 # ===== Start Game =====
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run(sys.argv[1:])
\ No newline at end of file